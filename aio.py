@@ -0,0 +1,134 @@
+'''
+Event loop integration. The VM's evaluator is recursive Python, so it can't
+suspend mid-expression. Instead an asyncio loop runs on its own thread:
+`await` hands the awaitable to the loop and blocks only the calling
+Espresso thread, while spawned coroutines are asyncio tasks whose bodies
+run on worker threads, each with its own VM stack. Hundreds of concurrent
+waits cost a parked thread each rather than serializing.
+
+So a spawned task is a thread with an asyncio future, not a coroutine
+which only yields at await: tasks interleave wherever the GIL switches.
+Each runs in a VM.child, which keeps its own stack and step count while
+the runtime's shared caches and budget are updated safely (see there).
+Espresso variables shared between tasks are as unprotected as they would
+be between threads.
+'''
+
+import asyncio, inspect, threading
+from concurrent.futures import ThreadPoolExecutor
+
+class Runtime:
+	def __init__(self, vm, workers=512):
+		self.vm = vm
+		self.workers = workers
+		self.loop = None
+		self.thread = None
+		self.executor = None
+		self.lock = threading.Lock()
+	
+	def start(self):
+		'''Start the loop thread on first use'''
+		
+		with self.lock:
+			if self.loop is None:
+				self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="esp-task")
+				loop = asyncio.new_event_loop()
+				loop.set_default_executor(self.executor)
+				self.thread = threading.Thread(target=loop.run_forever, name="esp-loop", daemon=True)
+				self.thread.start()
+				self.loop = loop
+		
+		return self.loop
+	
+	def close(self):
+		with self.lock:
+			if self.loop is None:
+				return
+			
+			self.loop.call_soon_threadsafe(self.loop.stop)
+			self.thread.join()
+			self.loop.close()
+			self.executor.shutdown(wait=False, cancel_futures=True)
+			self.loop = None
+	
+	def submit(self, coro):
+		'''Schedule a coroutine on the loop, returning a concurrent Future'''
+		return asyncio.run_coroutine_threadsafe(coro, self.start())
+	
+	def wait(self, aw):
+		'''Block the calling thread until aw completes on the loop'''
+		
+		if not inspect.isawaitable(aw):
+			return aw
+		
+		if threading.current_thread() is self.thread:
+			raise RuntimeError("await on the event loop thread would deadlock")
+		
+		async def wait():
+			return await aw
+		
+		return self.submit(wait()).result()
+	
+	def spawn(self, fn, args):
+		'''Start fn(*args) as an asyncio task running on a worker thread'''
+		
+		vm = self.vm.child()
+		async def run():
+			loop = asyncio.get_running_loop()
+			return await loop.run_in_executor(None, vm.call, fn, None, list(args))
+		
+		async def create():
+			return asyncio.ensure_future(run())
+		
+		return self.submit(create()).result()
+
+class Namespace:
+	'''The `async` builtin namespace'''
+	
+	def __init__(self, runtime):
+		self.runtime = runtime
+	
+	def spawn(self, fn, *args):
+		return self.runtime.spawn(fn, args)
+	
+	async def sleep(self, seconds, value=None):
+		await asyncio.sleep(seconds)
+		return value
+	
+	async def gather(self, *aws):
+		# Also takes a single list, there's no spread syntax
+		if len(aws) == 1 and isinstance(aws[0], list):
+			aws = aws[0]
+		return list(await asyncio.gather(*aws))
+	
+	async def timeout(self, aw, seconds):
+		return await asyncio.wait_for(aw, seconds)
+	
+	async def read(self, path):
+		def read():
+			with open(path, "r") as f:
+				return f.read()
+		
+		return await asyncio.get_running_loop().run_in_executor(None, read)
+	
+	async def write(self, path, data):
+		def write():
+			with open(path, "w") as f:
+				return f.write(data)
+		
+		return await asyncio.get_running_loop().run_in_executor(None, write)
+	
+	async def exec(self, *cmd):
+		'''Run a subprocess, evaluating to {code, out, err}'''
+		
+		proc = await asyncio.create_subprocess_exec(*map(str, cmd),
+			stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+		out, err = await proc.communicate()
+		return {"code": proc.returncode, "out": out.decode(), "err": err.decode()}
+
+def install(vm, workers=512):
+	'''Give a VM an event loop and the async namespace'''
+	
+	vm.aio = Runtime(vm, workers)
+	vm.stack[0].scope[0]["async"] = Namespace(vm.aio)
+	return vm.aio
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+'''
+Overhead of execution budgets on loop and call heavy code, without one
+and with generous limits on all of steps, time and memory, and how soon a
+runaway loop is stopped by a time limit. Run from the repo root:
+
+	python bench/budget.py [-n 5] [-k 50000]
+'''
+
+import time, argparse
+
+from common import const, ref, expr, best
+from vm import VM, BudgetError, builtins
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-k", type=int, default=50000, help="Iterations per run")
+	argv = ap.parse_args()
+	
+	scope = builtins()
+	scope.update(xs=range(argv.k), n=0)
+	vm = VM(scope)
+	vm.rval(['var', [[ref('inc'), ['fn', const('inc'), [{'name': 'x'}], ['block',
+		['return', expr("x + 1")]
+	]]]]])
+	
+	programs = {
+		"for loop": ['call', ref('list'), ['for', ref('i'), ref('xs'), expr("i + 1")]],
+		"calls": ['call', ref('list'), ['for', ref('i'), ref('xs'), expr("inc(i)")]],
+		"fused map": expr("list(map(xs, inc))")
+	}
+	
+	print(f"{argv.k} iterations{'':6}{'no budget':>12}{'budget':>12}")
+	for name, prog in programs.items():
+		times = []
+		for budget in (False, True):
+			def run():
+				if budget:
+					vm.limit(steps=10**9, seconds=3600, objects=10**9)
+				else:
+					vm.limit()
+				return vm.rval(prog)
+			times.append(best(run, argv.n)[0])
+		
+		t0, t1 = times
+		print(f"{name:22}{t0*1e3:9.1f} ms{t1*1e3:9.1f} ms  ({t1/t0 - 1:+.1%})")
+	
+	# loop { n = n + 1 }, stopped by a 100 ms limit
+	runaway = ['call', ref('list'), ['loop', None, const(True), expr("n = n + 1"), None, None]]
+	vm.limit(seconds=0.1)
+	t = time.perf_counter()
+	try:
+		vm.rval(runaway)
+	except BudgetError as e:
+		print(f"runaway loop: {e.kind} limit of 100 ms stopped it after {(time.perf_counter() - t)*1e3:.1f} ms")
+	vm.limit()
+
+if __name__ == "__main__":
+	main()
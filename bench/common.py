@@ -0,0 +1,43 @@
+'''
+Helpers shared by the benchmarks. Importing this puts the repo root on
+sys.path, so they run as python bench/<name>.py from the repo root.
+
+Expressions are parsed with crema where it emits what the VM runs, loops
+and functions around them are built by hand with const, ref and call
+since crema doesn't emit those in the VM's shape yet.
+'''
+
+import os, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import crema
+
+def const(x): return ['const', x]
+def ref(x): return ['id', x]
+def call(fn, *args): return ['call', ref(fn), *args]
+
+def expr(src):
+	'''Parse a single expression into the tree the VM runs'''
+	
+	match crema.Parser(src).parse().to_json([]):
+		case ['progn', ast]:
+			return ast
+	raise ValueError(f"Expected one expression: {src!r}")
+
+# fib(n), naive
+FIB = ['fn', const('fib'), [{'name': 'n'}], ['block',
+	['if', expr("n < 2"), ['return', ref('n')], None],
+	['return', expr("fib(n - 1) + fib(n - 2)")]
+]]
+
+def best(fn, n):
+	'''Run fn n times, returning the fastest time and the last result'''
+	
+	times = []
+	for _ in range(n):
+		t = time.perf_counter()
+		result = fn()
+		times.append(time.perf_counter() - t)
+	return min(times), result
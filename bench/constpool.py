@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+'''
+Allocations and time of constant literals in a hot loop, as written and
+after constpool.pool. Each loop keeps every value it makes, so the bytes
+it holds and the distinct objects in it count what was allocated per
+iteration. The string and list literals are parsed, crema doesn't emit
+the tuple or a many-field object in the VM's shape yet. Run from the repo
+root:
+
+	python bench/constpool.py [-n 5] [-k 20000]
+'''
+
+import copy, argparse, tracemalloc
+
+from common import const, ref, expr, best
+import constpool
+from vm import VM, builtins
+
+CASES = {
+	"string": expr('"Not a flat AST"'),
+	"tuple": ['tuple', const("line"), const(1), const(2.5)],
+	"list": expr('["add", "sub", "mul", "div"]'),
+	"object": ['object', [const("op"), const("+")], [const("prec"), const(10)], [const("assoc"), const("left")]]
+}
+
+def objects(x, seen):
+	'''Distinct objects reachable from x'''
+	
+	if id(x) in seen:
+		return
+	seen.add(id(x))
+	if isinstance(x, dict):
+		for k, v in x.items():
+			objects(k, seen)
+			objects(v, seen)
+	elif isinstance(x, (list, tuple)):
+		for v in x:
+			objects(v, seen)
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-k", type=int, default=20000, help="Iterations per run")
+	argv = ap.parse_args()
+	
+	scope = builtins()
+	scope.update(xs=range(argv.k))
+	vm = VM(scope)
+	
+	print(f"{argv.k} iterations{'':6}{'as written':>26}{'pooled':>26}")
+	for name, literal in CASES.items():
+		row = []
+		results = []
+		for pooled in (False, True):
+			prog = ['call', ref('list'), ['for', ref('i'), ref('xs'), copy.deepcopy(literal)]]
+			if pooled:
+				constpool.pool(prog)
+			
+			t, _ = best(lambda: vm.rval(prog), argv.n)
+			tracemalloc.start()
+			result = vm.rval(prog)
+			size = tracemalloc.get_traced_memory()[0]
+			tracemalloc.stop()
+			
+			seen = set()
+			objects(result, seen)
+			# Less the list holding them
+			count = (len(seen) - 1)/argv.k
+			results.append(result)
+			row.append(f"{t*1e3:7.1f} ms{size/argv.k:6.0f} B{count:5.1f} obj")
+		
+		note = "" if results[0] == results[1] else "  DIFFERENT"
+		print(f"{name:22}{row[0]:>26}{row[1]:>26}{note}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+'''
+Overhead of the debugger on a loop calling a function, with none attached,
+with a breakpoint on a statement that doesn't run, and with a conditional
+breakpoint in the loop which never stops. The statements are parsed, the
+function, loop and branch around them are built by hand and so are the
+lines. Run from the repo root:
+
+	python bench/debugger.py [-n 5] [-k 20000]
+'''
+
+import argparse
+
+from common import const, ref, expr, best
+import debugger
+from vm import VM, builtins
+
+def program(vm):
+	'''The script with its statements on lines 1-6, line 6 never running'''
+	
+	def at(line, node):
+		vm.origins.table[id(node)] = (line, 1)
+		vm.origins.roots.append(node)
+		return node
+	
+	body = ['block',
+		at(2, expr("var y = a + 1")),
+		at(3, expr("return y"))
+	]
+	return ['progn',
+		at(1, ['var', [[ref('f'), ['fn', const('f'), [{'name': 'a'}], body]]]]),
+		at(4, ['call', ref('list'), ['for', ref('i'), ref('xs'), ['block', at(4, expr("f(i)"))]]]),
+		at(5, ['if', const(False), ['block', at(6, expr('print("unreached")'))], None])
+	]
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-k", type=int, default=20000, help="Iterations per run")
+	argv = ap.parse_args()
+	
+	def never(dbg, probe, stmt):
+		raise AssertionError("stopped")
+	
+	setups = {
+		"no debugger": lambda vm, ast: None,
+		"breakpoint elsewhere": lambda vm, ast: debugger.Debugger(vm, never).add(ast) or vm.debugger.breakpoint(6),
+		"condition in the loop": lambda vm, ast: debugger.Debugger(vm, never).add(ast) or vm.debugger.breakpoint(2, cond=const(False))
+	}
+	
+	runs = {}
+	for name, setup in setups.items():
+		scope = builtins()
+		scope.update(xs=range(argv.k))
+		vm = VM(scope)
+		ast = program(vm)
+		setup(vm, ast)
+		runs[name] = lambda vm=vm, ast=ast: vm.rval(ast)
+	
+	# Interleaved so drift in the machine's speed hits each alike
+	times = {name: float('inf') for name in runs}
+	for _ in range(argv.n):
+		for name, run in runs.items():
+			times[name] = min(times[name], best(run, 1)[0])
+	
+	base = times["no debugger"]
+	for name, t in times.items():
+		print(f"{name:24}{t*1e3:9.1f} ms  ({t/base - 1:+.1%})")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+'''
+Cost of fail when it's caught, with the traceback formatted lazily as
+EspError does and eagerly as it used to, at a few stack depths. The eager
+run formats each error as it's made. Run from the repo root:
+
+	python bench/errors.py [-n 5] [-k 2000]
+'''
+
+import argparse
+
+from common import const, ref, expr, best
+import vm as _vm
+from vm import VM, EspError, builtins
+
+# fn f(n) { if n { return f(n - 1) } else { fail "not found" } }
+F = ['fn', const('f'), [{'name': 'n'}], ['block',
+	['if', ref('n'),
+		['return', expr("f(n - 1)")],
+		expr('fail("not found")')
+	]
+]]
+
+class EagerError(EspError):
+	def __init__(self, *args):
+		super().__init__(*args)
+		str(self)
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-k", type=int, default=2000, help="Failures per run")
+	argv = ap.parse_args()
+	
+	scope = builtins()
+	scope.update(xs=range(argv.k), caught=None)
+	vm = VM(scope)
+	vm.rval(['var', [[ref('f'), F]]])
+	
+	print(f"{argv.k} caught failures{'':4}{'eager':>10}{'lazy':>10}")
+	for depth in (0, 10, 50):
+		attempt = ['try', expr(f"f({depth})"), ref('e'), expr("caught = e"), None, None, None]
+		prog = ['call', ref('list'), ['for', ref('i'), ref('xs'), attempt]]
+		
+		times = []
+		for cls in (EagerError, EspError):
+			_vm.EspError = cls
+			try:
+				t, _ = best(lambda: vm.rval(prog), argv.n)
+			finally:
+				_vm.EspError = EspError
+			times.append(t)
+		
+		t0, t1 = times
+		print(f"depth {depth:<14}{t0*1e3:7.1f} ms{t1*1e3:7.1f} ms  ({t0/t1:.2f}x)")
+
+if __name__ == "__main__":
+	main()
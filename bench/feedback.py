@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+'''
+Cost of recording type feedback on a loop of branches, arithmetic and
+method calls, with vm.feedback off and on, and of saving the profile and
+preloading it on the next run. Run from the repo root:
+
+	python bench/feedback.py [-n 5] [-k 50000]
+'''
+
+import os, time, argparse, tempfile
+
+from common import const, ref, expr, best
+import feedback
+from flatast import FlatAST
+from vm import VM, EspList, builtins
+
+def program():
+	# for i in xs: if i % 3 { i * 2.5 } else { out.append(i) }
+	return ['call', ref('list'), ['for', ref('i'), ref('xs'),
+		['if', ['%', [ref('i'), const(3)]],
+			['*', [ref('i'), const(2.5)]],
+			expr("out.append(i)")
+		]
+	]]
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-k", type=int, default=50000, help="Iterations per run")
+	argv = ap.parse_args()
+	
+	scope = builtins()
+	scope.update(xs=range(argv.k), out=EspList())
+	vm = VM(scope)
+	ast = program()
+	
+	times = []
+	for fb in (None, feedback.Feedback()):
+		vm.feedback = fb
+		times.append(best(lambda: vm.rval(ast), argv.n)[0])
+		scope['out'].clear()
+	
+	t0, t1 = times
+	print(f"{argv.k} iterations  off {t0*1e3:.1f} ms  recording {t1*1e3:.1f} ms  ({t1/t0 - 1:+.1%})")
+	
+	with tempfile.TemporaryDirectory() as tmp:
+		cachefn = os.path.join(tmp, "bench.ast")
+		FlatAST.from_list(ast).save(cachefn)
+		
+		fb = vm.feedback
+		fb.add(ast, cachefn)
+		t = time.perf_counter()
+		fb.save()
+		ts = time.perf_counter() - t
+		
+		t = time.perf_counter()
+		loaded = feedback.Feedback().add(program(), cachefn)
+		tl = time.perf_counter() - t
+		
+		size = os.path.getsize(feedback.profile_path(cachefn))
+		print(f"saved {len(fb.sites)} sites ({size} bytes) in {ts*1e3:.2f} ms, preloaded {loaded} in {tl*1e3:.2f} ms")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+'''
+Fused iterator pipelines against the same calls run as written, one
+generator per stage. Pipelines of plain calls are parsed, those through
+for loops are built by hand. Run from the repo root:
+
+	python bench/fusion.py [-n 5] [-s 20000]
+'''
+
+import copy, operator, argparse
+
+from common import const, ref, call, expr, best
+import fusion
+from vm import VM, EspList, builtins
+
+def fn(name, params, body):
+	return ['fn', const(name), [{'name': p} for p in params], ['block', ['return', body]]]
+def loop(var, it, body): return ['for', ref(var), it, body]
+
+PIPELINES = {
+	"filter -> map -> reduce": expr("reduce(map(filter(xs, odd), square), add, 0)"),
+	"filter -> for -> list": call('list',
+		loop('x', call('filter', ref('xs'), ref('even')), call('mul', ref('x'), const(3)))
+	),
+	"for -> max": call('max', loop('y', ref('xs'), call('mod', ref('y'), const(997)))),
+	"map -> for -> min": call('min',
+		loop('z', call('map', ref('xs'), ref('square')), call('neg', ref('z')))
+	),
+	"map -> join": expr('join(map(xs, str), "-")')
+}
+
+def scope(size):
+	s = builtins()
+	s.update(
+		xs=EspList(range(size)), str=str, add=operator.add, mul=operator.mul,
+		mod=operator.mod, neg=operator.neg
+	)
+	vm = VM(s)
+	# Espresso functions for the callbacks, so calls cost what they would
+	s['odd'] = vm.rval(fn('odd', ['n'], call('mod', ref('n'), const(2))))
+	s['even'] = vm.rval(fn('even', ['n'], call('eq', call('mod', ref('n'), const(2)), const(0))))
+	s['square'] = vm.rval(fn('square', ['n'], call('mul', ref('n'), ref('n'))))
+	s['eq'] = operator.eq
+	return vm
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-s", "--size", type=int, default=20000, help="Elements per pipeline")
+	argv = ap.parse_args()
+	
+	vm = scope(argv.size)
+	prog = ['progn', *PIPELINES.values()]
+	fused = copy.deepcopy(prog)
+	for origin, p in fusion.fuse(fused):
+		print(f"fused {p.describe()}")
+	
+	print(f"{argv.size} elements{'':14}{'as written':>14}{'fused':>14}")
+	for name, plain, wrapped in zip(PIPELINES, prog[1:], fused[1:]):
+		t0, r0 = best(lambda: vm.rval(plain), argv.n)
+		t1, r1 = best(lambda: vm.rval(wrapped), argv.n)
+		same = "" if r0 == r1 else "  DIFFERENT"
+		print(f"{name:28}{t0*1e3:11.1f} ms{t1*1e3:11.1f} ms  ({t0/t1:.2f}x){same}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+'''
+The generated LALR parser (experimental/crema_lr.py) against the hand
+written crema.Parser, on the same sources, checking they build identical
+ASTs and origins. Run from the repo root:
+
+	python bench/lr.py [-n 20] [src.esp ...]
+'''
+
+import os, sys, time, argparse
+
+from common import ROOT, best
+sys.path.insert(0, os.path.join(ROOT, "experimental"))
+
+import crema, crema_lr, lr
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=20, help="Runs per parser, the best is kept")
+	ap.add_argument("src", nargs="*", default=[os.path.join(ROOT, "crema.esp")])
+	argv = ap.parse_args()
+	
+	fresh = lambda: lr.grammar(crema_lr.precedences(), crema_lr.TYPED, crema_lr.RULES)
+	t = time.perf_counter()
+	g = fresh()
+	g.build()
+	build = time.perf_counter() - t
+	
+	# Make sure the cache exists, then time loading it
+	crema_lr.GRAMMAR.load()
+	t = time.perf_counter()
+	fresh().load()
+	load = time.perf_counter() - t
+	print(f"tables: {len(g.action)} states, {len(g.prods)} rules, {len(g.conflicts)} conflicts resolved by default")
+	print(f"        built in {build*1e3:.1f} ms, loaded from {os.path.relpath(g.cachefile, ROOT)} in {load*1e3:.1f} ms")
+	
+	for fn in argv.src:
+		with open(fn) as f:
+			src = f.read()
+		
+		a, b = [], []
+		same = crema.Parser(src).parse().to_json(a) == crema_lr.parse(src).to_json(b) and a == b
+		hand, _ = best(lambda: crema.Parser(src).parse(), argv.n)
+		table, _ = best(lambda: crema_lr.parse(src), argv.n)
+		print(f"{os.path.basename(fn)}: {len(src)} bytes, {'identical' if same else 'DIFFERENT'} ASTs")
+		print(f"  crema.Parser {hand*1e3:8.2f} ms {len(src)/hand/1e6:6.2f} MB/s")
+		print(f"  LALR         {table*1e3:8.2f} ms {len(src)/table/1e6:6.2f} MB/s  ({hand/table:.2f}x)")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+'''
+Memory used by parser and runtime objects, measured with tracemalloc. Run
+from the repo root:
+
+	python bench/memory.py [src.esp]
+
+tokens   every token of the source, kept alive
+parse    the crema.AST of the source, kept alive
+nested   the nested list form the VM runs
+flat     the same tree as a flatast.FlatAST
+run      peak while running a call-heavy function (crema.esp doesn't run
+         to completion yet, so it's fib from bench/common.py)
+'''
+
+import os, sys, gc, time, tracemalloc
+
+from common import ROOT, FIB
+import crema, flatast
+from vm import VM, builtins
+
+def measure(name, fn):
+	gc.collect()
+	tracemalloc.start()
+	t = time.perf_counter()
+	keep = fn()
+	dt = time.perf_counter() - t
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	print(f"{name:8} {current/1024:10.1f} KiB live {peak/1024:10.1f} KiB peak {dt:8.3f}s")
+	return keep
+
+def lex(src):
+	p = crema.Parser(src)
+	toks = []
+	while tok := p.next():
+		toks.append(tok)
+	return toks
+
+def run():
+	scope = builtins()
+	vm = VM(scope)
+	scope['fib'] = vm.rval(FIB)
+	return vm.call(scope['fib'], None, [15])
+
+def main():
+	srcfn = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, "crema.esp")
+	with open(srcfn, "r") as f:
+		src = f.read()
+	
+	toks = measure("tokens", lambda: lex(src))
+	print(f"         {len(toks)} tokens")
+	del toks
+	
+	ast = measure("parse", lambda: crema.Parser(src).parse())
+	nested = measure("nested", lambda: ast.to_json([]))
+	del nested
+	flat = measure("flat", lambda: flatast.FlatAST.from_ast(ast))
+	del ast, flat
+	
+	# The first call imports modules, which isn't what's being measured
+	builtins()
+	measure("run", run)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+'''
+Multimethod dispatch with the prototype cache against resolving every
+call, on the collide example from esplib/multimethod.esp. Run from the
+repo root:
+
+	python bench/multimethod.py [-n 5] [-k 20000]
+'''
+
+import random, argparse
+
+from common import const, ref, call, best
+from vm import VM, EspObject, builtins
+
+def fn(name, params, body):
+	return ['fn', const(name), [{'name': p} for p in params], ['block', ['return', body]]]
+
+def proto(parent=None):
+	return EspObject() if parent is None else EspObject(proto=parent)
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-k", type=int, default=20000, help="Calls per run")
+	argv = ap.parse_args()
+	
+	entity = proto()
+	player, alien, ship = proto(entity), proto(entity), proto(entity)
+	scope = builtins()
+	scope.update(Entity=entity, Player=player, Alien=alien, Spaceship=ship)
+	vm = VM(scope)
+	
+	# Most specific first is the slowest order to resolve in
+	for name, protos in [
+		("alien-ship", ['Alien', 'Spaceship']),
+		("player-entity", ['Player', 'Entity']),
+		("entity-player", ['Entity', 'Player']),
+		("entity-entity", ['Entity', 'Entity']),
+		("any-any", [None, None])
+	]:
+		vm.rval(['=', [ref('collide'), call('method',
+			fn('collide', ['x', 'y'], const(name)),
+			*(ref(p) if p else const(None) for p in protos)
+		)]])
+	mm = scope['collide']
+	
+	rng = random.Random(1)
+	kinds = [player, alien, ship, entity]
+	pairs = [(proto(rng.choice(kinds)), proto(rng.choice(kinds))) for _ in range(argv.k)]
+	
+	def cached():
+		return [mm.dispatch(vm, x, y) for x, y in pairs]
+	
+	def uncached():
+		out = []
+		for x, y in pairs:
+			mm.cache.clear()
+			out.append(mm.dispatch(vm, x, y))
+		return out
+	
+	results = {}
+	for name, dispatch in (("resolve every call", uncached), ("cached", cached)):
+		def run():
+			mm.hits = mm.misses = 0
+			mm.elapsed = 0.0
+			return dispatch()
+		
+		t, results[name] = best(run, argv.n)
+		print(f"{name:20}{t*1e3:9.1f} ms  {mm.stats()}")
+	
+	if len(set(map(tuple, results.values()))) != 1:
+		print("DIFFERENT")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+'''
+Parser throughput on a generated source of about a megabyte, split into
+lexing alone and the whole parse. Run from the repo root:
+	
+	python bench/parse.py [-n 5] [-s 1000000] [--seed 0]
+'''
+
+import random, argparse
+
+from common import best
+import crema
+
+BINARY = ["+", "-", "==", "!=", "<", "<=", ">", ">=", "and", "or", "in", "is"]
+
+class Gen:
+	'''Random statements over the constructs crema.esp uses'''
+	
+	def __init__(self, seed):
+		self.rng = random.Random(seed)
+	
+	def name(self):
+		return self.rng.choice("abcdefghijklmnopqrstuvwxyz") + str(self.rng.randrange(100))
+	
+	def atom(self):
+		r = self.rng.random()
+		if r < 0.45: return self.name()
+		if r < 0.7: return str(self.rng.randrange(10000))
+		if r < 0.85: return f'"{self.name()} \\n"'
+		return f"'{self.name()}'"
+	
+	def expr(self, depth=0):
+		r = self.rng.random() if depth < 4 else 0
+		if r < 0.35: return self.atom()
+		if r < 0.6:
+			return f"{self.expr(depth + 1)} {self.rng.choice(BINARY)} {self.expr(depth + 1)}"
+		if r < 0.7: return f"{self.name()}.{self.name()}"
+		if r < 0.8:
+			args = ", ".join(self.expr(depth + 1) for _ in range(self.rng.randrange(3)))
+			return f"{self.name()}({args})"
+		if r < 0.85: return f"{self.name()}[{self.expr(depth + 1)}]"
+		if r < 0.9:
+			return "[" + ", ".join(self.expr(depth + 1) for _ in range(self.rng.randrange(4))) + "]"
+		if r < 0.95:
+			return "{" + ", ".join(f"{self.name()}: {self.expr(depth + 1)}" for _ in range(self.rng.randrange(3))) + "}"
+		return f"not ({self.expr(depth + 1)})"
+	
+	def block(self, depth):
+		return "{\n" + "".join(self.stmt(depth + 1) for _ in range(self.rng.randrange(1, 4))) + "}"
+	
+	def stmt(self, depth=0):
+		r = self.rng.random() if depth < 3 else 0
+		ind = "\t"*depth
+		if r < 0.4: return f"{ind}var {self.name()} = {self.expr()};\n"
+		if r < 0.6: return f"{ind}{self.name()} = {self.expr()};\n"
+		# Statements are juxtaposed, so one starting with ( [ or { would
+		#  call or index the one before
+		if r < 0.7: return f"{ind}{self.name()}({self.expr()});\n"
+		if r < 0.8:
+			return f"{ind}if({self.expr()}) {self.block(depth)} else {self.block(depth)}\n"
+		if r < 0.85: return f"{ind}while({self.expr()}) {self.block(depth)}\n"
+		if r < 0.9: return f"{ind}for(var {self.name()} in {self.expr()}) {self.block(depth)}\n"
+		if r < 0.95:
+			return f"{ind}var {self.name()}({self.name()}) {self.block(depth)}\n"
+		return f"{ind}return {self.expr()};\n"
+	
+	def source(self, size):
+		out, n = [], 0
+		while n < size:
+			out.append(s := self.stmt())
+			n += len(s)
+		return "".join(out)
+
+def lex(src):
+	p = crema.Parser(src)
+	n = 0
+	while p.consume():
+		n += 1
+	return n
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-s", "--size", type=int, default=1000000, help="Source size in bytes")
+	ap.add_argument("--seed", type=int, default=0)
+	argv = ap.parse_args()
+	
+	src = Gen(argv.seed).source(argv.size)
+	p = crema.Parser(src)
+	p.parse()
+	if p.cur is not None:
+		raise RuntimeError(f"Generated source didn't parse past {p.ctx.line}:{p.ctx.col}")
+	
+	ntok = lex(src)
+	print(f"{len(src)} bytes, {ntok} tokens")
+	for name, fn in (("lex", lex), ("parse", lambda s: crema.Parser(s).parse())):
+		dt, _ = best(lambda: fn(src), argv.n)
+		print(f"  {name:6} {dt*1e3:8.1f} ms {len(src)/dt/1e6:6.2f} MB/s {dt/ntok*1e9:8.0f} ns/token")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+'''
+Scaling of parallel.pmap against a serial loop on a CPU-bound Espresso
+function (naive fib). Run from the repo root:
+
+	python bench/pmap.py [-n 20] [-k 32] [-c 2] [-j 1 2 4 8]
+'''
+
+import os, argparse
+
+from common import FIB, best
+import parallel
+from vm import VM, builtins
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=20, help="fib argument per item")
+	ap.add_argument("-k", type=int, default=32, help="Number of items")
+	ap.add_argument("-c", "--chunksize", type=int, default=2)
+	ap.add_argument("-j", "--workers", type=int, nargs="*", default=[1, 2, 4, 8])
+	argv = ap.parse_args()
+	
+	scope = builtins()
+	vm = VM(scope)
+	fib = vm.rval(FIB)
+	scope['fib'] = fib
+	items = [argv.n]*argv.k
+	
+	print(f"{os.cpu_count()} cpus, {argv.k} x fib({argv.n})")
+	
+	serial, expect = best(lambda: [vm.call(fib, None, [x]) for x in items], 1)
+	print(f"serial   {serial:8.3f}s")
+	
+	for workers in argv.workers:
+		dt, got = best(lambda: list(parallel.pmap(fib, items, argv.chunksize, workers)), 1)
+		assert got == expect
+		print(f"pmap -j{workers:<3}{dt:8.3f}s  x{serial/dt:.2f}")
+
+if __name__ == "__main__":
+	main()
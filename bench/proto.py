@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+'''
+Memory and speed of slotted protos against object literals, on the AST
+protos declared in espresso.esp. crema doesn't parse proto declarations
+yet, so their names, parents and fields are read with a regex and the
+trees are built by hand. Run from the repo root:
+
+	python bench/proto.py [-n 5] [-k 50000]
+'''
+
+import os, re, random, argparse, tracemalloc
+
+from common import ROOT, const, ref, best
+from vm import VM, builtins
+
+# Only protos without methods, which is all the AST ones
+PROTO = re.compile(r"proto (\w+)(?: is (\w+))? \{([^{}]*)\}")
+FIELD = re.compile(r"(\w+)\s*:")
+
+def declarations(src):
+	'''proto nodes for espresso.esp's AST protos, parents first'''
+	
+	known = {"struct"}
+	for name, parent, body in PROTO.findall(src):
+		if parent not in known:
+			continue
+		known.add(name)
+		fields = [[ref(f), None] for f in FIELD.findall(body)]
+		yield name, ['proto', const(name), ref(parent), fields, []]
+
+def node(rng, depth=0):
+	'''Random AST as (proto name, field values) pairs'''
+	
+	if depth > 6 or (depth and rng.random() < 0.3):
+		return ("Const", [rng.randrange(1000)]) if rng.random() < 0.5 else ("Ident", ["x"])
+	return ("Op", ["+", node(rng, depth + 1), node(rng, depth + 1)])
+
+def build(vm, tree, slotted):
+	name, args = tree
+	args = [build(vm, a, slotted) if type(a) is tuple else const(a) for a in args]
+	if slotted:
+		return ['call', ref('new'), ref(name), *args]
+	return ['object', *([const(f), a] for f, a in zip(FIELDS[name], args))]
+
+FIELDS = {}
+
+def measure(vm, program, n):
+	'''Time to evaluate, and bytes the result holds'''
+	
+	t, _ = best(lambda: vm.rval(program), n)
+	tracemalloc.start()
+	result = vm.rval(program)
+	size = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return t, size, result
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-k", type=int, default=50000, help="Nodes, roughly")
+	argv = ap.parse_args()
+	
+	with open(os.path.join(ROOT, "espresso.esp")) as f:
+		decls = list(declarations(f.read()))
+	
+	vm = VM(builtins())
+	for name, decl in decls:
+		FIELDS[name] = [f for (_, f), _ in decl[3]]
+		vm.rval(decl)
+	print(f"{len(decls)} protos from espresso.esp:", ", ".join(name for name, _ in decls))
+	
+	rng = random.Random(1)
+	trees = []
+	count = 0
+	while count < argv.k:
+		trees.append(t := node(rng))
+		count += repr(t).count("(")
+	
+	results = {}
+	for label, slotted in (("object literals", False), ("slotted protos", True)):
+		program = ['list', *(build(vm, t, slotted) for t in trees)]
+		t, size, roots = measure(vm, program, argv.n)
+		
+		# Walk every root's operands through the VM
+		vm.stack[0].scope[0]['roots'] = roots
+		walk = ['call', ref('list'), ['for', ref('r'), ref('roots'), ['.', ref('r'), const('lhs')]]]
+		tw, _ = best(lambda: vm.rval(walk), argv.n)
+		
+		results[label] = size
+		print(f"{label:18}build {t*1e3:8.1f} ms  {size/count:6.1f} B/node  read {tw*1e3:6.2f} ms")
+	
+	ratio = results["slotted protos"]/results["object literals"]
+	print(f"slotted protos take {ratio:.0%} of the memory")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+'''
+Startup cost of a static table evaluated in every VM against the same
+table baked into the cache by loader.bake, loaded back through FlatAST.
+The table is a list built by a for loop over a string. Run from the repo
+root:
+
+	python bench/static.py [-n 5] [-k 20000]
+'''
+
+import os, argparse, tempfile
+
+from common import const, ref, expr, best
+import loader
+from flatast import FlatAST
+from vm import VM, builtins
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-k", type=int, default=20000, help="Table entries")
+	argv = ap.parse_args()
+	
+	letters = "abcdefghij"*(argv.k//10)
+	table = ['call', ref('list'), ['for', ref('c'), const(letters), expr("c + c")]]
+	
+	with tempfile.TemporaryDirectory() as tmp:
+		results = {}
+		for label, bake in (("evaluated per VM", False), ("baked", True)):
+			ast = ['var', [[ref('table'), ['static', table]]]]
+			if bake:
+				loader.bake(ast, tmp)
+			
+			fn = os.path.join(tmp, f"{bake}.ast")
+			FlatAST.from_list(ast).save(fn)
+			
+			def startup():
+				tree, _ = FlatAST.load(fn).to_list()
+				vm = VM(builtins())
+				vm.rval(tree)
+				return vm.stack[0].scope[0]['table']
+			
+			t, results[label] = best(startup, argv.n)
+			print(f"{label:18}{t*1e3:9.2f} ms  ({os.path.getsize(fn)} byte cache)")
+	
+	if len(set(map(tuple, results.values()))) != 1:
+		print("DIFFERENT")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+'''
+Template strings as one format node against the same strings built by
+chains of +, as a log line and a codegen line, both parsed by crema. Run
+from the repo root:
+
+	python bench/template.py [-n 5] [-k 20000]
+'''
+
+import argparse
+
+from common import ref, expr, best
+from vm import VM, builtins
+
+CASES = {
+	"log line": (
+		r'"[\{level}] \{name}: \{count} items in \{ms} ms (\{path})"',
+		r'"[" + level + "] " + name + ": " + count + " items in " + ms + " ms (" + path + ")"'
+	),
+	"codegen line": (
+		r'"\tself.\{name} = a\{count}\n"',
+		r'"\tself." + name + " = a" + count + "\n"'
+	),
+	"formatted": (
+		r'"\{name:<12}|\{count:>8}|\{ms:10.3f}"',
+		# Nearest equivalent without specs
+		r'name + "|" + count + "|" + ms'
+	)
+}
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-k", type=int, default=20000, help="Strings per run")
+	argv = ap.parse_args()
+	
+	scope = builtins()
+	scope.update(level="info", name="loader", count=42, ms=3.25, path="/tmp/x.esp", xs=range(argv.k))
+	vm = VM(scope)
+	
+	print(f"{argv.k} strings{'':11}{'concatenated':>14}{'template':>14}")
+	for name, (tpl, chain) in CASES.items():
+		runs = []
+		for body in map(expr, (chain, tpl)):
+			prog = ['call', ref('list'), ['for', ref('i'), ref('xs'), body]]
+			runs.append(best(lambda: vm.rval(prog), argv.n))
+		
+		(t0, r0), (t1, r1) = runs
+		note = "" if r0 == r1 or name == "formatted" else "  DIFFERENT"
+		print(f"{name:24}{t0*1e3:11.1f} ms{t1*1e3:11.1f} ms  ({t0/t1:.2f}x){note}")
+
+if __name__ == "__main__":
+	main()
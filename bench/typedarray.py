@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+'''
+Element-wise arithmetic over an EspList, one VM.binary per element in a
+loop expression, against the same expressions on a typed array. Cases
+using * or / are built by hand since crema doesn't lex them yet. Run from
+the repo root:
+
+	python bench/typedarray.py [-n 5] [-s 100000]
+'''
+
+import argparse
+
+from common import const, ref, expr, best
+import typedarray
+from vm import VM, EspList, builtins
+
+def op(o, *args): return [o, list(args)]
+def loop(var, it, body): return ['for', ref(var), it, body]
+
+# Name -> (over the list, over the array)
+CASES = {
+	"x*2.5 + 1": (
+		['call', ref('list'), loop('x', ref('xs'), op('+', op('*', ref('x'), const(2.5)), const(1)))],
+		op('+', op('*', ref('a'), const(2.5)), const(1))
+	),
+	"(x - y) / y": (
+		['call', ref('list'), loop('i', ref('idx'),
+			op('/', op('-', ['[]', ref('xs'), ref('i')], ['[]', ref('ys'), ref('i')]), ['[]', ref('ys'), ref('i')])
+		)],
+		op('/', op('-', ref('a'), ref('b')), ref('b'))
+	),
+	"sum of x > 1000": (expr("reduce(filter(xs, big), add, 0)"), expr("a[a > 1000].sum()")),
+	"max": (expr("max(xs)"), expr("a.max()"))
+}
+
+def same(x, y):
+	x, y = (list(v) if hasattr(v, "__iter__") else [v] for v in (x, y))
+	return len(x) == len(y) and all(abs(p - q) <= 1e-9*max(1, abs(p)) for p, q in zip(x, y))
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=5, help="Runs, the best is kept")
+	ap.add_argument("-s", "--size", type=int, default=100000, help="Elements")
+	argv = ap.parse_args()
+	
+	xs = [float(i % 2000) for i in range(argv.size)]
+	ys = [float(i % 7 + 1) for i in range(argv.size)]
+	
+	scope = builtins()
+	scope.update(
+		xs=EspList(xs), ys=EspList(ys), idx=range(argv.size),
+		a=typedarray.array("f64", xs), b=typedarray.array("f64", ys),
+		add=lambda x, y: x + y, big=lambda x: x > 1000
+	)
+	vm = VM(scope)
+	
+	backend = "numpy" if typedarray.np else "array"
+	print(f"{argv.size} elements{'':12}{'EspList':>14}{backend:>14}")
+	for name, (plain, typed) in CASES.items():
+		t0, r0 = best(lambda: vm.rval(plain), argv.n)
+		t1, r1 = best(lambda: vm.rval(typed), argv.n)
+		note = "" if same(r0, r1) else "  DIFFERENT"
+		print(f"{name:26}{t0*1e3:11.1f} ms{t1*1e3:11.1f} ms  ({t0/t1:.1f}x){note}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+'''
+Load time and lookup throughput of the unicode_names database against
+unicodedata, in both directions. Run from the repo root:
+
+	python bench/unicode_names.py [-n 20000]
+'''
+
+import os, time, random, argparse, unicodedata
+
+import common # puts the repo root on sys.path
+import unicode_names
+
+def timed(fn, items):
+	t = time.perf_counter()
+	for x in items:
+		fn(x)
+	return (time.perf_counter() - t)/len(items)*1e9
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument("-n", type=int, default=20000, help="Lookups per test")
+	argv = ap.parse_args()
+	
+	t = time.perf_counter()
+	db = unicode_names.NameDB()
+	dt = time.perf_counter() - t
+	size = os.path.getsize(unicode_names.DBFILE)
+	print(f"load {dt*1e3:.3f} ms, {size/1024:.1f} KiB, {db.nnames} stored names, Unicode {db.version}")
+	
+	rng = random.Random(0)
+	chars = [c for c in map(chr, range(0x110000)) if unicodedata.name(c, None)]
+	chars = rng.choices(chars, k=argv.n)
+	names = [unicodedata.name(c) for c in chars]
+	
+	print(f"{'':10}{'unicode_names':>16}{'unicodedata':>16}  (ns/call)")
+	print(f"{'lookup':10}{timed(db.lookup, names):16.1f}{timed(unicodedata.lookup, names):16.1f}")
+	cps = [ord(c) for c in chars]
+	print(f"{'name':10}{timed(db.name, cps):16.1f}{timed(unicodedata.name, chars):16.1f}")
+
+if __name__ == "__main__":
+	main()
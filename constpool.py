@@ -0,0 +1,103 @@
+'''
+Constant pool, a load-time pass over a tree. A const node's value goes
+through py2esp every time it's evaluated, which allocates a new EspString
+for each string literal run, and list, tuple and object literals are
+rebuilt entry by entry even when every entry is a constant.
+
+pool() converts string constants once, sharing one EspString between equal
+literals, and wraps literals whose entries are all immutable constants as
+['pooled', original, value] for tuples, which are shared, and
+['template', original, value] for lists and objects, which are shallow
+copied each time since they're mutable. Only immutable entries qualify so
+a shallow copy never shares anything a program could change.
+
+Literals are matched in the shapes crema emits: list entries as one ','
+chain (see vm.spread) and object keys as bare ids or constants. The only
+tuple crema emits is the empty one, since (a, b) parses as a ',' node
+which isn't a literal the VM evaluates. An object literal with more than
+one entry doesn't come out of crema in a shape this can read yet, so only
+single-entry objects are pooled from parsed source.
+'''
+
+from vm import EspString, EspList, EspTuple, EspObject, spread
+
+# Constant values which are their own py2esp and can't be mutated
+IMMUTABLE = (EspString, EspTuple, int, float, bool, type(None))
+
+def constant(node):
+	'''(True, value) for a node with a pooled immutable value, else (False, None)'''
+	
+	if type(node) is list and len(node) == 3 and node[0] == "pooled":
+		return True, node[2]
+	if type(node) is list and len(node) == 2 and node[0] == "const":
+		if type(node[1]) in IMMUTABLE:
+			return True, node[1]
+	return False, None
+
+def key(node):
+	'''(True, key) for an object entry's constant key, else (False, None)'''
+	
+	if type(node) is list and len(node) == 2 and node[0] == "id" and type(node[1]) is str:
+		return True, EspString(node[1])
+	return constant(node)
+
+def literal(node):
+	'''The ['pooled'|'template', node, value] for a constant literal, or None'''
+	
+	match node:
+		case ['tuple', *elems]:
+			values = [constant(e) for e in elems]
+			if all(ok for ok, _ in values):
+				return ['pooled', node, EspTuple(v for _, v in values)]
+		
+		case ['list', *elems]:
+			values = [constant(e) for e in spread(elems)]
+			if all(ok for ok, _ in values):
+				return ['template', node, EspList(v for _, v in values)]
+		
+		case ['object', *elems]:
+			if not all(type(e) is list and len(e) == 2 for e in elems):
+				return None
+			
+			keys = [key(k) for k, _ in elems]
+			values = [constant(v) for _, v in elems]
+			if all(ok for ok, _ in keys + values):
+				return ['template', node, EspObject(
+					(k, v) for (_, k), (_, v) in zip(keys, values)
+				)]
+	
+	return None
+
+def pool(ast):
+	'''
+	Pool the constants in ast in place. Returns how many strings, shared
+	literals and templates were made. Already pooled nodes are skipped, so
+	running it twice is harmless.
+	'''
+	
+	strings = {}
+	counts = {"strings": 0, "pooled": 0, "template": 0}
+	
+	def walk(node):
+		for i, x in enumerate(node):
+			if type(x) is not list or (x and x[0] in ("pooled", "template")):
+				continue
+			
+			if len(x) == 2 and x[0] == "const":
+				if type(x[1]) is str:
+					s = strings.get(x[1])
+					if s is None:
+						s = strings[x[1]] = EspString(x[1])
+						counts["strings"] += 1
+					x[1] = s
+				continue
+			
+			# Inner first, a constant tuple can be another literal's entry
+			walk(x)
+			if p := literal(x):
+				node[i] = p
+				counts[p[0]] += 1
+	
+	if type(ast) is list:
+		walk(ast)
+	return counts
@@ -2,6 +2,8 @@
 
 import re, traceback
 
+import unicode_names
+
 class ParseError(RuntimeError):
 	def __init__(self, msg, ctx):
 		l = ctx.line
@@ -15,10 +17,12 @@ KW = [
 	"and", "or", "not", "in", "is", "new",
 	"function", "new", "var", "proto",
 	"if", "then", "else", "loop", "while", "for",
-	"switch", "case", "return", "fail", "break", "continue"
+	"switch", "case", "return", "fail", "break", "continue", "await", "static"
 ]
 KWBOP = ['and', 'or', 'in', 'is']
 KWUOP = ['not']
+# Token type of each keyword, operator keywords taking precedence
+KWTYPES = {kw: "kw" for kw in KW} | {op: "bop" for op in KWBOP} | {op: "uop" for op in KWUOP}
 
 SC = r"(?:(?!\\\{)\\.|.+?)*?"
 # Token regex, organized to allow them to be indexed by name
@@ -28,8 +32,12 @@ PATTERNS = {
 	"cmp": r"[<>!=]=|[<>!]",
 	"op": r"[-+=]",
 	"dec": r"\d+",
+	# Template strings up to their first interpolation, see Parser.nud_template
+	"sqt": r"'((?:(?!\\\{)\\.|[^\\'])*)\\\{", "dqt": r'"((?:(?!\\\{)\\.|[^\\"])*)\\\{',
 	"sq": rf"'({SC})'", "dq": rf'"({SC})"', "bq": rf"`({SC})`",
-	"id": r"[_\w][_\w\d]*"
+	# Any non-ASCII run is lexed as identifier characters and checked
+	#  against Unicode's identifier classes afterwards
+	"id": r"[_a-zA-Z\x80-\U0010ffff][_a-zA-Z0-9\x80-\U0010ffff]*"
 }
 
 TOKEN = re.compile(f"({')|('.join(PATTERNS.values())})", re.M)
@@ -39,7 +47,9 @@ TG = {}
 
 # Matches an even number of backslashes, but not odd
 EVEN_SLASH = re.compile(r'\\{2}')
-RE_CLASS = re.compile(r"(?<!\\)\[(?:\\.|[^\[]+)*\\]")
+# Character classes, which can't hold groups. No nested quantifiers, so
+#  patterns without a class don't backtrack exponentially
+RE_CLASS = re.compile(r"(?<!\\)\[(?:\\.|[^\\\]])*\]")
 RE_GROUP = re.compile(r'(?<!\\)\((?!\?(?!P<))')
 index = 1
 for name, pat in PATTERNS.items():
@@ -57,6 +67,8 @@ NEWLINE = re.compile("\n")
 SPACE = re.compile(r"\s+", re.M)
 
 class Context:
+	__slots__ = ("pos", "line", "col")
+	
 	def __init__(self, pos, line, col):
 		self.pos = pos
 		self.line = line
@@ -66,26 +78,39 @@ class Context:
 		return [self.line, self.col]
 
 class Token:
-	def __init__(self, m, t, ctx):
-		self.match = m
-		self.value = m[0]
+	# groups are the token's regex groups as strings, the match itself
+	#  isn't kept since it pins the whole source. nud and infix are the
+	#  parser's handlers for it, see NUD and INFIX
+	__slots__ = ("value", "type", "groups", "ctx", "nud", "infix")
+	
+	def __init__(self, groups, t, ctx, nud=None, infix=None):
+		self.value = groups[0]
 		self.type = t
+		self.groups = groups
 		self.ctx = ctx
+		self.nud = nud
+		self.infix = infix
 	
 	def __repr__(self):
 		return f"Token({self.type!r}, {self.value!r})"
 
-def to_json(ast):
+def to_json(ast, origins=None):
 	if isinstance(ast, AST):
-		return ast.to_json()
+		return ast.to_json(origins)
 	elif isinstance(ast, list):
-		return list(map(to_json, ast))
+		# Plain lists headed by a string, like switch cases, look like nodes
+		#  to vm.OriginTable, so they need an entry to keep the order
+		if origins is not None and ast and type(ast[0]) is str:
+			origins.append(None)
+		return [to_json(x, origins) for x in ast]
 	elif isinstance(ast, dict):
-		return dict((to_json(k), to_json(v)) for k, v in ast.items())
+		return dict((to_json(k, origins), to_json(v, origins)) for k, v in ast.items())
 	else:
 		return ast
 
 class AST:
+	__slots__ = ("op", "args", "token")
+	
 	def __init__(self, op, *args):
 		self.op = op
 		self.args = args
@@ -99,12 +124,17 @@ class AST:
 		self.token = tok
 		return self
 	
-	def to_json(self):
-		out = [self.op, *map(to_json, self.args)]
+	def to_json(self, origins=None):
+		'''
+		Convert to nested lists. Source positions are kept out of band: if
+		origins is a list, the [line, col] of each node (or None) is appended
+		to it in preorder, the same order vm.OriginTable numbers nodes.
+		'''
+		
+		if origins is not None:
+			origins.append(self.token and self.token.ctx.to_json())
 		
-		if self.token:
-			out = ['line', self.token.ctx.line, out]
-		return out
+		return [self.op, *(to_json(x, origins) for x in self.args)]
 
 # Each operator is its own precedence class
 def separate(*v):
@@ -144,8 +174,40 @@ OPNAMES = {
 UNARY = {"!"}
 RIGHT = {"**"}
 
+# Values which end an expression rather than start one
+STOP = frozenset({")", "]", "}", ",", ";", "else", "case"})
+RELAXID = frozenset({"id", "kw", "bop", "uop", "assign"})
+QUOTED = frozenset({"sq", "dq", "bq"})
+
+def ineq(value, desc):
+	'''Whether a token's value or type matches a peek() description'''
+	if desc is None:
+		return True
+	if isinstance(desc, (set, frozenset)):
+		return value in desc
+	return value == desc
+
+# The rest of a template after an interpolation's closing brace, up to the
+#  next interpolation or the closing quote
+TPL_REST = {
+	q: re.compile(rf"((?:(?!\\\{{)\\.|[^\\{q}])*)(\\\{{|{q})")
+	for q in "'\""
+}
+# A format spec after an interpolation's colon, through the closing brace
+SPEC = re.compile(r"([^{}]*)\}")
+# Python's format spec mini-language
+FORMAT_SPEC = re.compile(r"(?:.?[<>=^])?[-+ ]?z?#?0?\d*[,_]?(?:\.\d+)?[bcdeEfFgGnosxX%]?")
+
+# An escaped backslash is consumed whole so the one after it starts nothing
+ESCAPE = re.compile(r"\\(?:([tnr\\])|N\{([^}]*)\})")
+SIMPLE_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "\\": "\\"}
+
 def stresc(s):
-	return s.replace("\\t", "\t").replace("\\n", "\n").replace("\\r", "\r")
+	'''Decode escapes, raises KeyError for unknown \\N{...} names'''
+	
+	if "\\" not in s:
+		return s
+	return ESCAPE.sub(lambda m: SIMPLE_ESCAPES[m[1]] if m[1] else unicode_names.lookup(m[2]), s)
 
 class Parser:
 	def __init__(self, src):
@@ -205,12 +267,9 @@ class Parser:
 		if m is None:
 			return None
 		
-		if m[0] in KWBOP:
-			tt = "bop"
-		elif m[0] in KWUOP:
-			tt = "uop"
-		elif m[0] in KW:
-			tt = "kw"
+		v = m[0]
+		if tt := KWTYPES.get(v):
+			m = (v,)
 		else:
 			try:
 				tt, gc = TG[m.lastindex]
@@ -219,8 +278,13 @@ class Parser:
 				# Common parsing issue, give us more context
 				print(list(enumerate(m.groups(), 1)))
 				raise
+			
+			# ASCII identifiers are already exact from the regex, the rest are
+			#  checked against XID_Start/XID_Continue
+			if tt == "id" and not m[0].isascii() and not m[0].isidentifier():
+				raise self.error(f"Invalid identifier {m[0]!r}")
 		
-		return Token(m, tt, self.repos(m))
+		return Token(m, tt, self.repos(m), NUD.get(v, NUD_TYPE[tt]), INFIX.get(v))
 	
 	def consume(self):
 		self.cur = self.next()
@@ -231,11 +295,6 @@ class Parser:
 	#######################
 	
 	def peek(self, value=None, type=None):
-		def ineq(value, desc):
-			if isinstance(desc, set):
-				return value in desc
-			return desc is None or value == desc
-		
 		cur = self.cur
 		if cur and ineq(cur.value, value) and ineq(cur.type, type):
 			return cur
@@ -294,10 +353,10 @@ class Parser:
 		return args
 	
 	def relaxid(self):
-		if tok := self.maybe(type={"id", "kw", "bop", "uop", "assign"}):
+		if tok := self.maybe(type=RELAXID):
 			return tok.value
-		elif tok := self.maybe(type={"sq", "dq", "bq"}):
-			return tok.match[1]
+		elif tok := self.maybe(type=QUOTED):
+			return tok.groups[1]
 	
 	def block(self):
 		if tok := self.maybe("{"):
@@ -368,6 +427,9 @@ class Parser:
 		self.expect("}")
 		return lhs
 	
+	def op_after(self, lhs):
+		raise self.error("after isn't supported yet")
+	
 	def op_comma(self, lhs):
 		return AST(",", lhs, *self.yield_sep())
 	
@@ -381,23 +443,17 @@ class Parser:
 	def expr(self, min_prec=0):
 		lhs = self.atom()
 		
-		while tok := self.peek():
-			op = tok.value
-			if op not in PRECS: break
-			
-			if op == ";": break
-			
-			prec = PRECS[op]
-			if prec < min_prec: break
-			
+		# The lexer attached (lbp, rbp, led) to infix tokens
+		while (tok := self.cur) and (infix := tok.infix) and infix[0] >= min_prec:
 			self.consume()
 			
-			if op in OPNAMES:
-				lhs = getattr(self, "op_" + OPNAMES[op])(lhs)
+			_, rbp, led = infix
+			if led is not None:
+				lhs = led(self, lhs)
 			else:
-				rhs = self.expr(prec + (op not in RIGHT))
+				rhs = self.expr(rbp)
 				if rhs is None: break
-				lhs = AST(op, lhs, rhs).origin(tok)
+				lhs = AST(tok.value, lhs, rhs).origin(tok)
 		
 		return lhs
 	
@@ -414,6 +470,35 @@ class Parser:
 			return AST("loop", always, self.condition(), self.block())
 		return AST("loop", always)
 	
+	def kw_switch(self):
+		ex = self.condition()
+		self.expect("{")
+		
+		cases = []
+		while not self.maybe("}"):
+			self.expect("case")
+			
+			# An empty case is the default
+			if self.peek(":") or self.peek("=>"):
+				op, value = "default", None
+			else:
+				op, value = "case", self.expr(PRECS[':'] + 1)
+			
+			ft = self.maybe(":") or self.expect("=>")
+			if ft.value == "=>" or self.peek("{"):
+				body = self.block()
+			else:
+				# Bare fallthrough bodies run until the next case
+				tok = self.cur
+				body = AST("block", *self.yield_semi()).origin(tok)
+			
+			cases.append([op, value, ft.value, body])
+		
+		th = self.maybe("then") and self.block()
+		el = self.maybe("else") and self.block()
+		
+		return AST("switch", ex, cases, th or None, el or None)
+	
 	def kw_while(self):
 		cond = self.condition()
 		body = self.block()
@@ -439,6 +524,11 @@ class Parser:
 	def kw_continue(self): return AST("continue")
 	def kw_return(self): return AST("return", self.expr())
 	def kw_fail(self): return AST("fail", self.expr())
+	# Binds like a call so `await a.b()` awaits the call's result
+	def kw_await(self): return AST("await", self.expr(PRECS['(']))
+	# Evaluated once at compile time, see loader.bake
+	def kw_static(self):
+		return AST("static", self.block() if self.peek("{") else self.expr(PRECS['(']))
 	
 	def kw_var(self):
 		vars = []
@@ -461,38 +551,110 @@ class Parser:
 		
 		return AST("var", vars)
 	
-	def atom(self):
-		cur = self.peek()
-		if cur is None:
-			return None
-		
-		ct = cur.type
-		val = cur.value
+	#######################
+	### Prefix handlers ###
+	#######################
+	
+	def nud_dec(self, tok): return AST("const", int(tok.value, 10))
+	def nud_bq(self, tok): return AST("const", tok.groups[1])
+	def nud_id(self, tok): return AST("id", tok.value)
+	def nud_prefix(self, tok): return AST(tok.value, self.expr())
+	
+	def unescape(self, tok, s):
+		try:
+			return stresc(s)
+		except KeyError as e:
+			raise self.error(f"Unknown character name in {tok.value}: {e.args[0]}") from None
+	
+	def nud_str(self, tok):
+		return AST("const", self.unescape(tok, tok.groups[1]))
+	
+	def nud_template(self, tok):
+		'''
+		A string with \\{value} or \\{value:spec} interpolations, as one format
+		node of its constant pieces and values. The lexer only knows where
+		each interpolation starts, so the rest of the string is matched here
+		each time a value's closing brace is the lookahead.
+		'''
+		
+		quote = tok.value[0]
+		pieces = []
+		text = tok.groups[1]
+		while True:
+			if text:
+				pieces.append(AST("const", self.unescape(tok, text)))
+			
+			value = self.expr(PRECS[','] + 1)
+			if not value:
+				raise self.expected("value")
+			if self.peek(":"):
+				if (m := self.match(SPEC)) is None:
+					raise self.expected("}")
+				if not FORMAT_SPEC.fullmatch(m[1]):
+					raise self.error(f"Invalid format spec {m[1]!r}")
+				self.repos(m)
+				value = AST("spec", value, m[1])
+			elif not self.peek("}"):
+				raise self.expected("}")
+			pieces.append(value)
+			
+			if (m := self.match(TPL_REST[quote])) is None:
+				raise self.error("Unterminated template string")
+			self.repos(m)
+			# Either the next value's first token or whatever follows the string
+			self.consume()
+			text = m[1]
+			if m[2] == quote:
+				break
 		
-		# Exceptions which shouldn't be consumed
-		if val in {")", ']', "}", ',', ';', 'else'}:
-			return None
+		if text:
+			pieces.append(AST("const", self.unescape(tok, text)))
 		
-		if ct == "punc":
+		return AST("format", *pieces)
+	
+	def nud_unknown(self, tok):
+		raise self.error(f"Unknown token {tok.type} {tok.value}")
+	
+	def nud_unknown_kw(self, tok):
+		raise self.error("Unknown keyword " + tok.value)
+	
+	def atom(self):
+		cur = self.cur
+		# Puncs and STOP values aren't atoms and shouldn't be consumed
+		if cur is None or (nud := cur.nud) is None:
 			return None
 		
 		# Everything else will either consume or error
 		self.consume()
-		
-		if ct == "dec": result = AST("const", int(cur.value, 10))
-		elif ct in {"sq", "dq"}: result = AST("const", stresc(cur.match[1]))
-		elif ct in {"bq"}: result = AST("const", cur.match[1])
-		elif ct == "id": result = AST("id", val)
-		elif ct == "uop": result = AST(val, self.expr())
-		elif ct == "op" and val == "-": result = AST(val, self.expr())
-		
-		elif ct == "kw":
-			try:
-				result = getattr(self, "kw_" + val)()
-			except AttributeError:
-				raise self.error("Unknown keyword " + val) from None
-		
-		else:
-			raise self.error(f"Unknown token {ct} {val}")
-		
-		return result.origin(cur)
+		return nud(self, cur).origin(cur)
+
+def keyword(kw):
+	'''Prefix handler for a keyword from its kw_ method'''
+	
+	fn = getattr(Parser, "kw_" + kw, None)
+	if fn is None:
+		return Parser.nud_unknown_kw
+	return lambda self, tok: fn(self)
+
+# Prefix handlers by value, falling back to NUD_TYPE by token type. None
+#  means the token can't start an expression
+NUD_TYPE = {
+	"dec": Parser.nud_dec, "sq": Parser.nud_str, "dq": Parser.nud_str,
+	"bq": Parser.nud_bq, "id": Parser.nud_id, "uop": Parser.nud_prefix,
+	"sqt": Parser.nud_template, "dqt": Parser.nud_template,
+	"kw": Parser.nud_unknown_kw, "bop": Parser.nud_unknown,
+	"op": Parser.nud_unknown, "cmp": Parser.nud_unknown, "punc": None
+}
+NUD = {kw: keyword(kw) for kw, tt in KWTYPES.items() if tt == "kw"}
+NUD["-"] = Parser.nud_prefix
+NUD.update(dict.fromkeys(STOP))
+
+# (left binding power, right binding power, special handler or None) of
+#  each infix operator by value
+INFIX = {
+	op: (
+		prec, prec + (op not in RIGHT),
+		getattr(Parser, "op_" + OPNAMES[op]) if op in OPNAMES else None
+	)
+	for op, prec in PRECS.items() if op != ";"
+}
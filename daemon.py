@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+'''
+Long-running espresso server which keeps parsed modules warm. Run requests
+arrive over a local Unix socket. Each runs in a fresh VM, but sources are
+only reparsed when their mtime changes, either when a request notices or
+when the watcher thread polls them.
+
+	python daemon.py serve /tmp/esp.sock [--watch src.esp ...]
+	python daemon.py run /tmp/esp.sock src.esp [args...]
+
+The protocol is JSON lines. The client sends a single request
+{"file": ..., "argv": [...]} and the server streams back {"out": text}
+messages followed by a final {"exit": code}.
+'''
+
+import os, sys, json, socket, socketserver, threading, traceback, contextlib
+
+import loader, aio, fusion, constpool
+from vm import VM, OriginTable, builtins
+
+class WarmStore:
+	'''Parsed modules kept in memory, keyed by realpath'''
+	
+	def __init__(self):
+		self.lock = threading.Lock()
+		# path -> (mtime, ast, origins, {dep: mtime}) where deps are the files
+		#  its static values were computed from, see loader.bake
+		self.entries = {}
+		self.parses = 0
+	
+	@staticmethod
+	def fresh(path, entry):
+		mt, _, _, deps = entry
+		return loader.mtime(path) == mt and all(
+			loader.mtime(dep) == dmt for dep, dmt in deps.items()
+		)
+	
+	def get(self, path):
+		'''Get (ast, origins) for a source, reparsing only if it or its deps changed'''
+		
+		path = os.path.realpath(path)
+		with self.lock:
+			entry = self.entries.get(path)
+			if entry is None or not self.fresh(path, entry):
+				mt = loader.mtime(path)
+				# The disk cache may already be newer than our copy
+				if flat := loader.load_flat(path):
+					ast, origins = flat.to_list()
+					deps = flat.deps
+				else:
+					ast, origins, deps = loader.compile_deps(path)
+				entry = (mt, ast, origins, {dep: loader.mtime(dep) for dep in deps})
+				self.entries[path] = entry
+				self.parses += 1
+			
+			return entry[1], entry[2]
+	
+	def refresh(self):
+		'''Reparse everything that changed since it was loaded'''
+		for path, entry in list(self.entries.items()):
+			if not self.fresh(path, entry):
+				try:
+					self.get(path)
+				except Exception:
+					# Broken sources are reported when they're next run
+					with self.lock:
+						self.entries.pop(path, None)
+	
+	def watch(self, interval=1.0):
+		'''Poll for changes in a daemon thread'''
+		
+		stop = threading.Event()
+		def poll():
+			while not stop.wait(interval):
+				self.refresh()
+		
+		threading.Thread(target=poll, daemon=True).start()
+		return stop
+
+class WarmLoader(loader.Loader):
+	'''Loader which takes modules from a WarmStore instead of the disk cache'''
+	
+	def __init__(self, vm, store, base=".", path=None):
+		super().__init__(vm, base, path)
+		self.store = store
+	
+	def fetch(self, path):
+		return self.store.get(path)
+	
+	def precompile(self, roots):
+		# Anything not already warm is parsed on first fetch
+		pass
+
+class Channel:
+	'''File-like which frames everything written as {"out": ...} messages'''
+	
+	def __init__(self, wfile):
+		self.wfile = wfile
+	
+	def send(self, **msg):
+		self.wfile.write(json.dumps(msg).encode() + b"\n")
+		self.wfile.flush()
+	
+	def write(self, s):
+		if s: self.send(out=s)
+		return len(s)
+	
+	def flush(self): pass
+
+def bad_request(request):
+	'''Why a decoded run request can't be run, or None if it can'''
+	
+	if type(request) is not dict:
+		return "expected an object"
+	if type(request.get('file')) is not str:
+		return 'expected a "file" path'
+	if type(request.get('argv', [])) is not list:
+		return '"argv" must be a list'
+	return None
+
+def run_job(store, request, out, modules=None):
+	'''
+	Run one request with stdout and stderr sent to out, returning its exit
+	code, 2 for a bad request. modules optionally seeds the registry with
+	already loaded modules.
+	'''
+	
+	if why := bad_request(request):
+		out.write(f"Bad request: {why}\n")
+		return 2
+	
+	srcfn = os.path.realpath(request['file'])
+	argv = request.get('argv', [])
+	
+	vm = None
+	with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+		try:
+			ast, origins = store.get(srcfn)
+			vm = VM(builtins(argv), OriginTable(ast, origins))
+			aio.install(vm)
+			# Stored trees are shared between jobs, both passes are idempotent
+			fusion.fuse(ast)
+			constpool.pool(ast)
+			imp = WarmLoader(vm, store, os.path.dirname(srcfn)).install()
+			if modules:
+				imp.modules.update(modules)
+			vm.eval(ast)
+			return 0
+		except SystemExit as e:
+			return e.code if isinstance(e.code, int) else 1
+		except Exception:
+			traceback.print_exc()
+			return 1
+		finally:
+			# The loop thread would outlive the job (and the daemon's next one)
+			if vm is not None and vm.aio is not None:
+				vm.aio.close()
+
+class Handler(socketserver.StreamRequestHandler):
+	def handle(self):
+		chan = Channel(self.wfile)
+		try:
+			request = json.loads(self.rfile.readline())
+		except json.decoder.JSONDecodeError as e:
+			chan.send(out=f"Bad request: {e}\n")
+			chan.send(exit=2)
+			return
+		
+		# run_job turns away bad requests itself
+		chan.send(exit=run_job(self.server.store, request, chan))
+
+class Server(socketserver.UnixStreamServer):
+	'''
+	Requests are served one at a time since jobs share the process's
+	stdout and the warm store. Throughput comes from skipping startup.
+	'''
+	
+	def __init__(self, path, store=None):
+		if os.path.exists(path):
+			os.unlink(path)
+		
+		self.store = store or WarmStore()
+		super().__init__(path, Handler)
+
+def request(sockfn, srcfn, argv=(), out=sys.stdout):
+	'''Send a run request to a server and stream its output, returning the exit code'''
+	
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		sock.connect(sockfn)
+		msg = {"file": os.path.abspath(srcfn), "argv": list(argv)}
+		sock.sendall(json.dumps(msg).encode() + b"\n")
+		
+		with sock.makefile("rb") as f:
+			for line in f:
+				msg = json.loads(line)
+				if "out" in msg:
+					out.write(msg['out'])
+				elif "exit" in msg:
+					return msg['exit']
+	
+	# Server went away mid-request
+	return 1
+
+def main():
+	import argparse
+	
+	ap = argparse.ArgumentParser("espresso-daemon")
+	sub = ap.add_subparsers(dest="cmd", required=True)
+	
+	serve = sub.add_parser("serve", help="Run the server")
+	serve.add_argument("socket")
+	serve.add_argument("-w", "--watch", nargs="*", default=[], metavar="src",
+		help="Sources to parse up front and keep fresh")
+	serve.add_argument("-i", "--interval", type=float, default=1.0,
+		help="Seconds between checks for changed sources")
+	
+	run = sub.add_parser("run", help="Run a file on a server")
+	run.add_argument("socket")
+	run.add_argument("src")
+	run.add_argument("argv", nargs="*")
+	
+	argv = ap.parse_args()
+	
+	if argv.cmd == "run":
+		sys.exit(request(argv.socket, argv.src, argv.argv))
+	
+	server = Server(argv.socket)
+	for src in argv.watch:
+		server.store.get(src)
+	server.store.watch(argv.interval)
+	
+	print("Serving on", argv.socket)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		os.unlink(argv.socket)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,277 @@
+'''
+Debugger with breakpoints, stepping and frame inspection. Nothing in the
+VM checks whether one is attached: a breakpoint wraps the statement on its
+line in place as ['debug', stmt, Probe], which VM.rval runs by letting the
+probe decide whether to stop before evaluating stmt. Stepping wraps every
+statement until execution continues, then only those with breakpoints stay
+wrapped. Runs without breakpoints evaluate the same trees they always did.
+
+Statements are the entries of blocks and of a file's top level, and a
+statement's line is that of the first node in it with an origin, since
+crema gives some nodes (eg calls) none. A breakpoint goes on the outermost
+statement starting on its line.
+
+When execution stops the handler is called with the debugger, probe and
+statement, and returns how to go on: "continue", or "into", "over" or
+"out" to step. The default is an interactive prompt on stdin.
+'''
+
+from vm import EspError, summary, scope_vars
+
+class Breakpoint:
+	'''
+	A line breakpoint, path being the file it's in (None for the first one
+	added). cond is a tree evaluated where it's hit, stopping if truthy.
+	'''
+	
+	__slots__ = ("path", "line", "cond", "hits")
+	
+	def __init__(self, path, line, cond=None):
+		self.path = path
+		self.line = line
+		self.cond = cond
+		self.hits = 0
+	
+	def __repr__(self):
+		return f"Breakpoint({self.path or '<main>'}:{self.line}, {self.hits} hits)"
+
+class Probe:
+	'''Wraps a statement, stopping before it for its breakpoints or a step'''
+	
+	__slots__ = ("debugger", "path", "line", "breakpoints")
+	
+	def __init__(self, debugger, path, line):
+		self.debugger = debugger
+		self.path = path
+		self.line = line
+		self.breakpoints = []
+	
+	def triggered(self, vm):
+		for bp in self.breakpoints:
+			if bp.cond is None or vm.rval(bp.cond):
+				bp.hits += 1
+				return True
+		return False
+	
+	def run(self, vm, stmt):
+		dbg = self.debugger
+		stepping = dbg.stepping
+		if (stepping is not None and stepping(vm)) or self.triggered(vm):
+			dbg.stop(vm, self, stmt)
+		return vm.rval(stmt)
+
+class Debugger:
+	'''
+	Debugger for a VM. trees are the (path, ast) it can place breakpoints
+	in, the loader adds each module it executes. stepping is a predicate
+	on the VM while stepping, else None.
+	'''
+	
+	def __init__(self, vm, handler=None):
+		self.vm = vm
+		self.handler = handler or prompt
+		self.trees = []
+		self.breakpoints = []
+		self.stepping = None
+		# Stopped at, for inspection
+		self.frame = None
+		self.node = None
+		vm.debugger = self
+	
+	def add(self, ast, path=None):
+		'''Debug a tree, placing any breakpoints already set in it'''
+		
+		self.trees.append((path, ast))
+		for bp in self.breakpoints:
+			if self.path(bp) == path:
+				self.place(bp, ast)
+		if self.stepping is not None:
+			self.probe_all(ast, path)
+	
+	def path(self, bp):
+		if bp.path is None and self.trees:
+			return self.trees[0][0]
+		return bp.path
+	
+	def located(self, stmt):
+		'''The first node in a statement with an origin, or None'''
+		
+		origins = self.vm.origins
+		todo = [stmt]
+		while todo:
+			node = todo.pop()
+			if type(node) is not list:
+				continue
+			if origins.get(node) is not None:
+				return node
+			todo.extend(reversed(node))
+		return None
+	
+	def line(self, stmt):
+		'''A statement's line, see the module docs'''
+		
+		node = self.located(stmt)
+		return None if node is None else self.vm.origins.get(node)[0]
+	
+	def statements(self, ast):
+		'''(parent, index, stmt) for each statement, outermost first'''
+		
+		def walk(node):
+			if type(node) is not list:
+				return
+			
+			body = node and node[0] in ("block", "progn")
+			for i, x in enumerate(node):
+				if body and i:
+					# Already probed statements are seen through
+					stmt = x[1] if type(x) is list and x and x[0] == "debug" else x
+					yield node, i, stmt
+					yield from walk(stmt)
+				else:
+					yield from walk(x)
+		
+		return walk(ast)
+	
+	def probe(self, parent, i, stmt, path):
+		'''The probe on a statement, wrapping it in one if it isn't'''
+		
+		x = parent[i]
+		if type(x) is list and x and x[0] == "debug":
+			return x[2]
+		
+		probe = Probe(self, path, self.line(stmt))
+		parent[i] = ['debug', stmt, probe]
+		return probe
+	
+	def probe_all(self, ast, path):
+		for parent, i, stmt in self.statements(ast):
+			self.probe(parent, i, stmt, path)
+	
+	def place(self, bp, ast):
+		for parent, i, stmt in self.statements(ast):
+			if self.line(stmt) == bp.line:
+				self.probe(parent, i, stmt, self.path(bp)).breakpoints.append(bp)
+				return True
+		return False
+	
+	def unprobe(self):
+		'''Unwrap every statement whose probe has no breakpoints'''
+		
+		for _, ast in self.trees:
+			for parent, i, stmt in list(self.statements(ast)):
+				x = parent[i]
+				if type(x) is list and x and x[0] == "debug" and not x[2].breakpoints:
+					parent[i] = stmt
+	
+	def breakpoint(self, line, path=None, cond=None):
+		'''
+		Break before the statement on a line. Set before the file is added,
+		it's placed when it is.
+		'''
+		
+		bp = Breakpoint(path, line, cond)
+		self.breakpoints.append(bp)
+		for p, ast in self.trees:
+			if p == self.path(bp):
+				self.place(bp, ast)
+		return bp
+	
+	def clear(self, bp):
+		self.breakpoints.remove(bp)
+		for _, ast in self.trees:
+			for parent, i, _ in self.statements(ast):
+				x = parent[i]
+				if type(x) is list and x and x[0] == "debug" and bp in x[2].breakpoints:
+					x[2].breakpoints.remove(bp)
+		if self.stepping is None:
+			self.unprobe()
+	
+	def step(self, kind):
+		'''Stop at the next statement run "into" calls, "over" them or "out" of this one'''
+		
+		depth = len(self.vm.stack)
+		match kind:
+			case "into": self.stepping = lambda vm: True
+			case "over": self.stepping = lambda vm: len(vm.stack) <= depth
+			case "out": self.stepping = lambda vm: len(vm.stack) < depth
+			case _: raise ValueError(f"Can't step {kind}")
+		
+		for path, ast in self.trees:
+			self.probe_all(ast, path)
+	
+	def resume(self):
+		self.stepping = None
+		self.unprobe()
+	
+	def stop(self, vm, probe, stmt):
+		self.frame = vm.stack[-1]
+		self.node = stmt
+		self.stepping = None
+		try:
+			how = self.handler(self, probe, stmt)
+		finally:
+			self.frame = self.node = None
+		
+		if how == "continue":
+			self.resume()
+		else:
+			self.step(how)
+	
+	### Inspection, while stopped ###
+	
+	def where(self):
+		'''The stack as a traceback, innermost frame last'''
+		return EspError(self.vm, "where", self.located(self.node)).traceback()
+	
+	def variables(self):
+		'''The variables visible from where it's stopped, inner scopes first'''
+		
+		out = {}
+		for scope in reversed(self.frame.scope):
+			for k, v in scope.items():
+				out.setdefault(k, v)
+		return out
+	
+	def lookup(self, name):
+		return self.vm.resolve(name).get(name)
+	
+	def evaluate(self, ast):
+		'''Evaluate a tree where it's stopped'''
+		return self.vm.rval(ast)
+
+HELP = '''\
+c(ontinue)     run to the next breakpoint
+s(tep)         stop at the next statement, entering calls
+n(ext)         stop at the next statement in this function or its callers
+o(ut)          stop after returning from this function
+w(here)        print the stack
+v(ars)         list the variables in scope
+p name         print a variable
+b line         break at a line in this file
+breakpoints    list the breakpoints'''
+
+def prompt(dbg, probe, stmt):
+	'''Interactive handler on stdin'''
+	
+	print(f"Stopped at {probe.path or '<main>'}:{probe.line}:", summary(stmt, 60))
+	while True:
+		try:
+			cmd = input("(esp) ").split()
+		except EOFError:
+			return "continue"
+		
+		match cmd:
+			case ["c"|"continue"]: return "continue"
+			case ["s"|"step"]: return "into"
+			case ["n"|"next"]: return "over"
+			case ["o"|"out"]: return "out"
+			case ["w"|"where"]: print(dbg.where())
+			case ["v"|"vars"]: print(scope_vars(dbg.frame.scope))
+			case ["p", name]: print(repr(dbg.lookup(name)))
+			case ["b", line] if line.isdigit():
+				print(dbg.breakpoint(int(line), probe.path))
+			case ["breakpoints"]:
+				for bp in dbg.breakpoints:
+					print(bp)
+			case []: pass
+			case _: print(HELP)
@@ -0,0 +1,251 @@
+#!/usr/bin/python3.10
+'''
+crema.Parser's language as an LALR(1) grammar for lr.py. It uses crema's
+lexer and builds the same AST, origins included, quirk for quirk: the
+precedences are crema.PRECS, prefix operators and keyword forms swallow a
+whole expression like expr() does, statements can be juxtaposed, a block
+position prefers a block to an object literal, and so on. Inputs crema
+rejects may parse here, but inputs it accepts parse the same.
+
+	python crema_lr.py src.esp    print the AST, or the conflicts if no src
+'''
+
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import crema, lr
+from crema import AST
+
+def const(t, x): return AST("const", x).origin(t)
+def first(t, x, *rest): return x
+def second(t, _, x, *rest): return x
+def nothing(t, *args): return None
+def empty(t): return []
+def push(t, xs, x):
+	xs.append(x)
+	return xs
+
+def relaxid(tok):
+	'''The name of a token accepted by crema.Parser.relaxid'''
+	return tok.groups[1] if tok.type in {"sq", "dq", "bq"} else tok.value
+
+def string(t, x):
+	try:
+		return const(t, crema.stresc(x.groups[1]))
+	except KeyError as e:
+		raise crema.ParseError(f"Unknown character name in {x.value}: {e.args[0]}", x.ctx) from None
+
+def binop(t, lhs, op, rhs): return AST(op.value, lhs, rhs).origin(op)
+def comma(t, lhs, op, rhs): return AST(",", lhs, rhs)
+def prefix(t, op, x=None): return AST(op.value, x).origin(t)
+
+def var_item(t, name, value=None): return [AST("id", relaxid(name)).origin(t), value]
+def method(t, name, _, *rest):
+	# (t, name, '(', [args,] ')', body)
+	args = [rest[0] if len(rest) == 3 else None]
+	return AST("fn", AST("const", name and relaxid(name)), args, rest[-1])
+
+def var_fn(t, name, *rest):
+	return [AST("id", relaxid(name)).origin(t), method(t, name, *rest)]
+
+def entry(t, name, value=None):
+	vn = AST("id", name and relaxid(name)).origin(t)
+	return [vn, vn if value is None else value]
+def fn_entry(t, name, *rest):
+	return [AST("id", name and relaxid(name)).origin(t), method(t, name, *rest).origin(t)]
+
+def case(op):
+	def build(t, _, *args):
+		value, ft, body = (None, *args) if len(args) == 2 else args
+		return [op, value, ft.value, body]
+	return build
+
+def switch(t, _, ex, __, cases, ___, *tail):
+	th = el = None
+	for i in range(0, len(tail), 2):
+		if tail[i].value == "then": th = tail[i + 1]
+		else: el = tail[i + 1]
+	return AST("switch", ex, cases, th, el).origin(t)
+
+# Binary operators crema's lexer can produce, by the precedence they're
+#  parsed at. OPNAMES have their own parsing, the comma acts binary anyway
+BINARY = [op for op, prec in sorted(crema.PRECS.items(), key=lambda x: x[1])
+	if op != ";" and (op == "," or op not in crema.OPNAMES) and crema.TOKEN.fullmatch(op)]
+CASE_BINARY = [op for op in BINARY if crema.PRECS[op] > crema.PRECS[":"]]
+
+def expression(name, ops):
+	'''Productions of an expression allowing the binary operators ops'''
+	
+	rules = [("primary", None)]
+	rules += [(f"{name} '{op}' {name}", comma if op == "," else binop) for op in ops]
+	if "," in ops:
+		# `a,` is a comma with nothing after it
+		rules.append((f"{name} ','", lambda t, l, op: AST(",", l, None), "STMT"))
+		rules.append(("','", lambda t, op: AST(",", None, None), "STMT"))
+	# Puncs aren't atoms, so these ops can go without a lhs
+	rules += [
+		(f"'{op}' {name}", lambda t, op, rhs: (comma if op.value == "," else binop)(t, None, op, rhs))
+		for op in ops if op in {",", ":", "."}
+	]
+	rules += [
+		(f"{name} '(' ')'", lambda t, f, _, __: AST("call", f, None)),
+		(f"{name} '(' expr ')'", lambda t, f, _, x, __: AST("call", f, x)),
+		(f"{name} '[' ']'", lambda t, x, _, __: AST("[]", x, None)),
+		(f"{name} '[' expr ']'", lambda t, x, _, i, __: AST("[]", x, i))
+	]
+	return rules
+
+def precedences():
+	levels = {}
+	for op, prec in crema.PRECS.items():
+		levels.setdefault(prec, []).append(op)
+	
+	out = [
+		# Greedy constructs like `return expr` and juxtaposed statements
+		#  shift anything they can, like expr(0)
+		("right", ["STMT"]),
+		("right", ["else", "then", *STARTS])
+	]
+	for prec in sorted(levels):
+		ops = levels[prec]
+		if prec == crema.PRECS[","]:
+			# The comma takes the rest at its own level, so it's a
+			#  right associative level just below ':'
+			out.append(("right", [","]))
+			out.append(("left", [op for op in ops if op != ","]))
+		elif prec == crema.PRECS["("]:
+			# await binds like a call but leaves calls to its operand
+			out.append(("right", ops + ["AWAIT"]))
+		else:
+			out.append(("left", ops))
+	return out
+
+NAMES = sorted(set(crema.KW + crema.KWBOP + crema.KWUOP))
+TYPED = ["id", "dec", "sq", "dq", "bq"]
+# Terminals which can only start an expression
+STARTS = TYPED + [
+	"not", "return", "fail", "await", "break", "continue",
+	"if", "loop", "while", "for", "switch", "var"
+]
+
+RULES = {
+	"progn": [("stmts", lambda t, s: AST("progn", *s))],
+	"stmts": [
+		("", empty),
+		("stmts expr", push, "STMT"),
+		("stmts ';'", first)
+	],
+	"block": [
+		("'{' stmts '}'", lambda t, _, s, __: AST("block", *s).origin(t)),
+		("expr", None, "STMT"),
+		("expr ';'", first),
+		# expr() finds nothing, then the ; is skipped
+		("';'", nothing)
+	],
+	# A parenthesized condition ends at its paren, before anything else
+	"cond": [
+		("'(' expr ')'", second),
+		("expr", None, "STMT")
+	],
+	"expr": expression("expr", BINARY),
+	"case_expr": expression("case_expr", CASE_BINARY),
+	"primary": [
+		("id", lambda t, x: AST("id", x.value).origin(t)),
+		("dec", lambda t, x: const(t, int(x.value, 10))),
+		("sq", string), ("dq", string),
+		("bq", lambda t, x: const(t, x.groups[1])),
+		
+		("'(' ')'", lambda t, _, __: AST("tuple")),
+		("'(' expr ')'", second),
+		("'[' ']'", lambda t, _, __: AST("list", None)),
+		("'[' expr ']'", lambda t, _, x, __: AST("list", x)),
+		("'{' items last '}'", lambda t, _, items, last, __: AST("object", *items, last)),
+		
+		("'-' expr", prefix, "STMT"),
+		("'not' expr", prefix, "STMT"),
+		("'return'", prefix), ("'return' expr", prefix, "STMT"),
+		("'fail'", prefix), ("'fail' expr", prefix, "STMT"),
+		("'await'", prefix), ("'await' expr", prefix, "AWAIT"),
+		("'break'", lambda t, _: AST("break").origin(t)),
+		("'continue'", lambda t, _: AST("continue").origin(t)),
+		
+		("'if' cond block", lambda t, _, c, th: AST("if", c, th, None).origin(t), "STMT"),
+		("'if' cond block 'else' block",
+			lambda t, _, c, th, __, el: AST("if", c, th, el).origin(t), "STMT"),
+		("'loop' block", lambda t, _, b: AST("loop", b).origin(t), "STMT"),
+		("'loop' block 'while' cond block",
+			lambda t, _, b, __, c, body: AST("loop", b, c, body).origin(t), "STMT"),
+		("'while' cond block",
+			lambda t, _, c, b: AST("loop", None, c, b, None).origin(t), "STMT"),
+		("'while' cond block 'else' block",
+			lambda t, _, c, b, __, el: AST("loop", None, c, b, el).origin(t), "STMT"),
+		("'for' '(' 'var' name 'in' expr ')' block",
+			lambda t, _, __, ___, name, ____, it, _____, body: AST("for",
+				AST("id", relaxid(name)).origin(name), it, body
+			).origin(t)),
+		
+		("'switch' cond '{' cases '}'", switch, "STMT"),
+		("'switch' cond '{' cases '}' 'then' block", switch, "STMT"),
+		("'switch' cond '{' cases '}' 'else' block", switch, "STMT"),
+		("'switch' cond '{' cases '}' 'then' block 'else' block", switch, "STMT"),
+		
+		("'var' vars", lambda t, _, v: AST("var", v).origin(t))
+	],
+	"name": [("id", None), ("sq", None), ("dq", None), ("bq", None)]
+		+ [(f"'{kw}'", None) for kw in NAMES],
+	
+	"vars": [("var_item", lambda t, x: [x]), ("vars ',' var_item", lambda t, xs, _, x: push(t, xs, x))],
+	"var_item": [
+		("name", var_item),
+		("name '=' expr", lambda t, n, _, x: var_item(t, n, x), "STMT"),
+		("name '(' ')' block", var_fn),
+		("name '(' expr ')' block", var_fn)
+	],
+	
+	# Entries are separated by commas, except after methods
+	"items": [("", empty), ("items item", push)],
+	"item": [
+		("oname '(' ')' block", fn_entry),
+		("oname '(' expr ')' block", fn_entry),
+		("oname ','", lambda t, n, _: entry(t, n))
+	],
+	# A value's expression takes any commas after it
+	"last": [("oname", entry), ("oname ':' expr", lambda t, n, _, x: entry(t, n, x))],
+	"oname": [("", nothing), ("name", None)],
+	
+	"cases": [("", empty), ("cases clause", push)],
+	"clause": [
+		("'case' ':' body", case("default")),
+		("'case' '=>' block", case("default")),
+		("'case' case_expr ':' body", case("case")),
+		("'case' case_expr '=>' block", case("case"))
+	],
+	# Bare fallthrough bodies run until the next case
+	"body": [
+		("'{' stmts '}'", lambda t, _, s, __: AST("block", *s).origin(t)),
+		("stmts", lambda t, s: AST("block", *s).origin(t))
+	]
+}
+
+GRAMMAR = lr.grammar(precedences(), TYPED, RULES)
+
+class Parser(crema.Parser):
+	'''crema.Parser with the generated tables doing the parsing'''
+	
+	def parse(self):
+		return GRAMMAR.parse(self)
+
+def parse(src):
+	return Parser(src).parse()
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1:
+		with open(sys.argv[1]) as f:
+			print(parse(f.read()).to_json())
+	else:
+		GRAMMAR.build()
+		print(f"{len(GRAMMAR.action)} states, {len(GRAMMAR.prods)} rules")
+		for c in GRAMMAR.conflicts:
+			print(GRAMMAR.describe(c))
@@ -0,0 +1,389 @@
+#!/usr/bin/python3.10
+'''
+LALR(1) parser generator. A grammar is described the way ruleset.py
+sketches it, grammar(precedences, tokens, rules):
+
+	precedences  [(assoc, [terminal, ...]), ...] loosest first, assoc is
+	             "left", "right" or "nonassoc" like yacc's %left and friends
+	tokens       token types matched by type rather than value (id, dec...)
+	rules        {nonterminal: [(rhs, action[, prec]), ...]}, the first
+	             nonterminal is the start symbol
+
+An rhs is a string of space separated symbols: 'quoted' terminals match a
+token's value, bare names are nonterminals or token types. Actions are
+called as action(tok, *values) where tok is the first token the rule
+covers (the lookahead for empty rules) and values are tokens for
+terminals; None passes the first value through. prec names a terminal
+whose precedence the rule takes instead of its last terminal's.
+
+Conflicts are resolved like yacc: shift/reduce by precedence if both sides
+have one, otherwise shift; reduce/reduce by rule order. The unresolved ones
+are kept in CONFLICTS.
+
+The tables are emitted as a self-contained Python module with the driver,
+cached in __espcache__ by a hash of the grammar (not the actions, which
+are bound at load).
+'''
+
+import os, json, hashlib, importlib.util
+
+VERSION = 1
+CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__espcache__")
+END = "$end"
+
+DRIVER = '''
+def parse(lexer, actions):
+	\'\'\'
+	Run the tables over a lexer with cur and consume() like crema.Parser,
+	actions is a list parallel to RULES.
+	\'\'\'
+	
+	action, goto, rules, literals = ACTION, GOTO, RULES, LITERALS
+	states, values, starts = [0], [], []
+	state = 0
+	
+	tok = lexer.cur
+	key = END if tok is None else tok.value if tok.value in literals else tok.type
+	while True:
+		act = action[state].get(key)
+		if act is None:
+			raise lexer.expected(" or ".join(sorted(action[state])))
+		
+		if act >= 0:
+			values.append(tok)
+			starts.append(tok)
+			states.append(act)
+			state = act
+			
+			tok = lexer.consume()
+			key = END if tok is None else tok.value if tok.value in literals else tok.type
+			continue
+		
+		lhs, n = rules[~act]
+		if n:
+			args = values[-n:]
+			start = starts[-n]
+			del values[-n:], starts[-n:], states[-n:]
+		else:
+			args, start = (), tok
+		
+		if lhs is None:
+			return args[0]
+		
+		fn = actions[~act]
+		values.append(args[0] if fn is None else fn(start, *args))
+		starts.append(start)
+		state = goto[states[-1]][lhs]
+		states.append(state)
+'''
+
+class GrammarError(ValueError): pass
+
+class Grammar:
+	def __init__(self, precedences, tokens, rules, start=None):
+		self.tokens = set(tokens)
+		self.start = start or next(iter(rules))
+		
+		# Production 0 accepts the start symbol
+		self.prods = [(None, (self.start,))]
+		self.actions = [None]
+		self.precs = [None]
+		for lhs, alts in rules.items():
+			for alt in alts:
+				rhs, action, *prec = alt
+				self.prods.append((lhs, tuple(rhs.split())))
+				self.actions.append(action)
+				self.precs.append(prec[0] if prec else None)
+		
+		self.nonterminals = set(rules)
+		self.literals = set()
+		for lhs, rhs in self.prods:
+			for sym in rhs:
+				if sym[0] == "'":
+					self.literals.add(sym[1:-1])
+				elif sym not in self.nonterminals and sym not in self.tokens:
+					raise GrammarError(f"Unknown symbol {sym} in {lhs}")
+		
+		if clash := self.literals & (self.nonterminals | self.tokens):
+			raise GrammarError(f"Terminals named like other symbols: {sorted(clash)}")
+		
+		# Quotes are only needed to tell symbols apart in the rules
+		strip = lambda s: s[1:-1] if s[0] == "'" else s
+		self.prods = [(lhs, tuple(map(strip, rhs))) for lhs, rhs in self.prods]
+		
+		self.levels = {}
+		for level, (assoc, syms) in enumerate(precedences):
+			for sym in syms:
+				self.levels[sym] = (level, assoc)
+		
+		self.by_lhs = {}
+		for i, (lhs, _) in enumerate(self.prods):
+			self.by_lhs.setdefault(lhs, []).append(i)
+		
+		self.hash = hashlib.sha256(json.dumps([
+			VERSION, self.start, sorted(self.tokens), precedences,
+			self.prods, self.precs
+		]).encode()).hexdigest()[:16]
+		self.module = None
+	
+	#############
+	### Sets ###
+	#############
+	
+	def terminal(self, sym):
+		return sym not in self.nonterminals
+	
+	def compute_first(self):
+		self.nullable = set()
+		self.first = {nt: set() for nt in self.nonterminals}
+		changed = True
+		while changed:
+			changed = False
+			for lhs, rhs in self.prods[1:]:
+				first = self.first[lhs]
+				before = len(first)
+				for sym in rhs:
+					if self.terminal(sym):
+						first.add(sym)
+						break
+					first |= self.first[sym]
+					if sym not in self.nullable:
+						break
+				else:
+					if lhs not in self.nullable:
+						self.nullable.add(lhs)
+						changed = True
+				changed |= len(first) != before
+	
+	def first_seq(self, seq):
+		'''(FIRST of a symbol sequence, whether it's nullable)'''
+		
+		out = set()
+		for sym in seq:
+			if self.terminal(sym):
+				out.add(sym)
+				return out, False
+			out |= self.first[sym]
+			if sym not in self.nullable:
+				return out, False
+		return out, True
+	
+	#############
+	### LR(0) ###
+	#############
+	
+	def closure0(self, kernel):
+		out = list(kernel)
+		seen = set(kernel)
+		for p, d in out:
+			rhs = self.prods[p][1]
+			if d < len(rhs) and rhs[d] in self.by_lhs:
+				for q in self.by_lhs[rhs[d]]:
+					if (q, 0) not in seen:
+						seen.add((q, 0))
+						out.append((q, 0))
+		return out
+	
+	def compute_states(self):
+		self.kernels = [((0, 0),)]
+		self.gotos = []
+		index = {self.kernels[0]: 0}
+		for kernel in self.kernels:
+			moves = {}
+			for p, d in self.closure0(kernel):
+				rhs = self.prods[p][1]
+				if d < len(rhs):
+					moves.setdefault(rhs[d], []).append((p, d + 1))
+			
+			goto = {}
+			for sym, items in moves.items():
+				k = tuple(sorted(items))
+				if k not in index:
+					index[k] = len(self.kernels)
+					self.kernels.append(k)
+				goto[sym] = index[k]
+			self.gotos.append(goto)
+	
+	#################
+	### Lookahead ###
+	#################
+	
+	def closure1(self, kernel):
+		'''LR(1) closure with lookahead sets, kernel maps items to sets'''
+		
+		las = {item: set(la) for item, la in kernel.items()}
+		work = list(las)
+		while work:
+			p, d = work.pop()
+			rhs = self.prods[p][1]
+			if d < len(rhs) and rhs[d] in self.by_lhs:
+				new, nullable = self.first_seq(rhs[d + 1:])
+				if nullable:
+					new = new | las[p, d]
+				for q in self.by_lhs[rhs[d]]:
+					la = las.setdefault((q, 0), set())
+					if not new <= la:
+						la |= new
+						work.append((q, 0))
+		return las
+	
+	def compute_lookaheads(self):
+		'''Spontaneous generation and propagation, the dragon book's way'''
+		
+		la = {(i, item): set() for i, k in enumerate(self.kernels) for item in k}
+		la[0, (0, 0)].add(END)
+		propagate = {key: [] for key in la}
+		
+		for i, kernel in enumerate(self.kernels):
+			goto = self.gotos[i]
+			for item in kernel:
+				for (p, d), las in self.closure1({item: {"#"}}).items():
+					rhs = self.prods[p][1]
+					if d == len(rhs):
+						continue
+					target = (goto[rhs[d]], (p, d + 1))
+					for a in las:
+						if a == "#":
+							propagate[i, item].append(target)
+						else:
+							la[target].add(a)
+		
+		changed = True
+		while changed:
+			changed = False
+			for src, targets in propagate.items():
+				s = la[src]
+				for t in targets:
+					if not s <= la[t]:
+						la[t] |= s
+						changed = True
+		
+		self.la = la
+	
+	##############
+	### Tables ###
+	##############
+	
+	def rule_prec(self, p):
+		if self.precs[p]:
+			return self.levels[self.precs[p]]
+		for sym in reversed(self.prods[p][1]):
+			if self.terminal(sym):
+				return self.levels.get(sym)
+	
+	def resolve(self, state, sym, old, new):
+		'''Pick between two actions for the same lookahead'''
+		
+		# Reduce/reduce, the earlier rule wins
+		if old < 0 and new < 0:
+			self.conflicts.append((state, sym, "reduce/reduce", ~old, ~new))
+			return max(old, new)
+		
+		shift, reduce = (old, new) if old >= 0 else (new, old)
+		rp, tp = self.rule_prec(~reduce), self.levels.get(sym)
+		if rp is None or tp is None:
+			self.conflicts.append((state, sym, "shift/reduce", ~reduce, None))
+			return shift
+		
+		if tp[0] > rp[0]: return shift
+		if tp[0] < rp[0]: return reduce
+		
+		assoc = tp[1]
+		if assoc == "left": return reduce
+		if assoc == "right": return shift
+		return None
+	
+	def build(self):
+		self.compute_first()
+		self.compute_states()
+		self.compute_lookaheads()
+		
+		self.conflicts = []
+		self.action = []
+		self.goto = []
+		for i, kernel in enumerate(self.kernels):
+			act = {}
+			for sym, j in self.gotos[i].items():
+				if self.terminal(sym):
+					act[sym] = j
+			
+			las = self.closure1({item: self.la[i, item] for item in kernel})
+			for (p, d), la in sorted(las.items()):
+				if d != len(self.prods[p][1]):
+					continue
+				for sym in la:
+					if sym in act:
+						r = self.resolve(i, sym, act[sym], ~p)
+						if r is None:
+							del act[sym]
+						else:
+							act[sym] = r
+					else:
+						act[sym] = ~p
+			
+			self.action.append(act)
+			self.goto.append({
+				sym: j for sym, j in self.gotos[i].items() if not self.terminal(sym)
+			})
+	
+	def describe(self, conflict):
+		state, sym, kind, a, b = conflict
+		rule = lambda p: f"{self.prods[p][0]} -> {' '.join(self.prods[p][1]) or '<empty>'}"
+		out = f"state {state} on {sym!r}: {kind}, {rule(a)}"
+		return out + (f" vs {rule(b)}" if b is not None else "")
+	
+	############
+	### Emit ###
+	############
+	
+	def emit(self, f):
+		# One JSON string compiles much faster than the literals would
+		tables = json.dumps({
+			"literals": sorted(self.literals),
+			"rules": [(lhs, len(rhs)) for lhs, rhs in self.prods],
+			"conflicts": [self.describe(c) for c in self.conflicts],
+			"action": self.action,
+			"goto": self.goto
+		}, separators=(",", ":"))
+		
+		f.write(f"# Generated by experimental/lr.py from grammar {self.hash}, don't edit\n\n")
+		f.write("import json\n\n")
+		f.write(f"END = {END!r}\n")
+		f.write(f"_tables = json.loads({tables!r})\n")
+		f.write("LITERALS = set(_tables['literals'])\n")
+		f.write("RULES = [tuple(r) for r in _tables['rules']]\n")
+		f.write("CONFLICTS = _tables['conflicts']\n")
+		f.write("ACTION = _tables['action']\n")
+		f.write("GOTO = _tables['goto']\n")
+		f.write(DRIVER)
+	
+	@property
+	def cachefile(self):
+		return os.path.join(CACHE, f"lr_{self.hash}.py")
+	
+	def load(self):
+		'''The generated module, built and cached first if needed'''
+		
+		if self.module is not None:
+			return self.module
+		
+		fn = self.cachefile
+		if not os.path.exists(fn):
+			self.build()
+			os.makedirs(CACHE, exist_ok=True)
+			# Written aside and renamed so a concurrent load never sees half
+			tmp = f"{fn}.{os.getpid()}"
+			with open(tmp, "w") as f:
+				self.emit(f)
+			os.replace(tmp, fn)
+		
+		spec = importlib.util.spec_from_file_location(f"lr_{self.hash}", fn)
+		self.module = importlib.util.module_from_spec(spec)
+		spec.loader.exec_module(self.module)
+		return self.module
+	
+	def parse(self, lexer):
+		return self.load().parse(lexer, self.actions)
+
+def grammar(precedences, tokens, rules, start=None):
+	return Grammar(precedences, tokens, rules, start)
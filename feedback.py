@@ -0,0 +1,182 @@
+'''
+Type feedback. With vm.feedback set the VM counts, per site, the operand
+types at binary operators, the receiver types at method calls and which
+way each if goes. Sites are numbered in preorder as OriginTable numbers
+nodes, so a module's profile lines up with its tree from run to run. It's
+saved next to the module's compiled cache on exit and preloaded on the
+next run, so what a site has seen doesn't have to be rediscovered.
+
+The VM consults it through fast(): once an arithmetic or comparison site
+has seen HOT operations all on one pair of numeric types, it runs as a
+guarded call to the operator itself, skipping binary()'s dispatch. A
+preloaded profile makes a site hot before it first runs, so it starts
+specialized, and a guard failing turns the site back to generic for good.
+
+A profile is only used with the cache it was recorded against, since a
+changed source renumbers the sites. Loaded counts are halved so older
+runs fade, a site keeps MAX_TYPES keys before the rest are counted under
+"*" (it's megamorphic), and only the MAX_SITES busiest sites are saved.
+'''
+
+import os, json, operator
+
+MAX_TYPES = 4
+MAX_SITES = 4096
+# Operations a site has to have seen before it's specialized
+HOT = 64
+
+# Operand types a site can be specialized on, by their recorded names
+NUMERIC = {"int": int, "float": float}
+# Operators with the same meaning in binary() as in Python for those
+OPERATORS = {
+	"+": operator.add, "-": operator.sub, "*": operator.mul,
+	"/": operator.truediv, "%": operator.mod, "//": operator.floordiv,
+	"==": operator.eq, "!=": operator.ne, "<": operator.lt,
+	"<=": operator.le, ">": operator.gt, ">=": operator.ge
+}
+
+def preorder(ast):
+	'''Nodes in ast numbered as OriginTable does, skipping wrappers'''
+	
+	def walk(node):
+		if type(node) is not list: return
+		if node and type(node[0]) is str:
+			# Fusion, pool and debugger wrappers aren't in the source
+			if node[0] in ("fused", "pooled", "template", "debug"):
+				yield from walk(node[1])
+				return
+			yield node
+		for x in node:
+			yield from walk(x)
+	
+	return walk(ast)
+
+def profile_path(cachefn):
+	return os.path.splitext(cachefn)[0] + ".profile"
+
+def stamp(cachefn):
+	'''Identifies the compiled cache a profile was recorded against'''
+	
+	st = os.stat(cachefn)
+	return [st.st_mtime_ns, st.st_size]
+
+class Feedback:
+	'''
+	The counts for every recorded site by id(node), each a dict of key to
+	count, and the modules they're saved for as (ast, cachefn).
+	'''
+	
+	def __init__(self):
+		self.sites = {}
+		self.modules = []
+		# id(node) -> (node, lhs type, rhs type, fn), or (node, None) once
+		#  it won't be specialized
+		self.fast_paths = {}
+	
+	def record(self, node, key):
+		counts = self.sites.get(id(node))
+		if counts is None:
+			# Tasks on other threads may be recording the same site
+			counts = self.sites.setdefault(id(node), {})
+		
+		if key in counts:
+			counts[key] += 1
+		elif len(counts) < MAX_TYPES:
+			counts[key] = 1
+		else:
+			counts["*"] = counts.get("*", 0) + 1
+	
+	def site(self, node):
+		'''What's been seen at a node, {key: count}, or None'''
+		return self.sites.get(id(node))
+	
+	def fast(self, node, op):
+		'''
+		(lhs type, rhs type, fn) to run a binary site with when its operands
+		have those types, or None while it should go through binary()
+		'''
+		
+		entry = self.fast_paths.get(id(node))
+		if entry is not None:
+			return entry[1:] if entry[1] is not None else None
+		
+		counts = self.sites.get(id(node))
+		if counts is None or sum(counts.values()) < HOT:
+			return None
+		
+		fn = OPERATORS.get(op)
+		types = next(iter(counts)).split(" ") if len(counts) == 1 else ()
+		if fn is None or len(types) != 2 or not all(t in NUMERIC for t in types):
+			self.fast_paths[id(node)] = (node, None)
+			return None
+		
+		# The node is kept so its id can't be reused
+		entry = self.fast_paths[id(node)] = (node, NUMERIC[types[0]], NUMERIC[types[1]], fn)
+		return entry[1:]
+	
+	def deopt(self, node):
+		'''A specialized site's guard failed, it stays generic from now on'''
+		self.fast_paths[id(node)] = (node, None)
+	
+	def add(self, ast, cachefn):
+		'''
+		Track a module's tree, preloading its saved profile if it was
+		recorded against the same cache. Returns how many sites were loaded.
+		'''
+		
+		self.modules.append((ast, cachefn))
+		try:
+			with open(profile_path(cachefn)) as f:
+				saved = json.load(f)
+			if saved['cache'] != stamp(cachefn):
+				return 0
+		except (OSError, ValueError, KeyError):
+			return 0
+		
+		sites = saved['sites']
+		loaded = 0
+		for i, node in enumerate(preorder(ast)):
+			if (counts := sites.get(str(i))) is not None:
+				# Halved so what older runs saw fades
+				self.sites[id(node)] = {k: (n + 1)//2 for k, n in counts.items()}
+				loaded += 1
+		return loaded
+	
+	def save(self):
+		'''Write each module's profile next to its cache'''
+		
+		for ast, cachefn in self.modules:
+			sites = []
+			for i, node in enumerate(preorder(ast)):
+				if counts := self.sites.get(id(node)):
+					sites.append((sum(counts.values()), i, counts))
+			sites.sort(key=lambda s: s[0], reverse=True)
+			
+			try:
+				data = {
+					"cache": stamp(cachefn),
+					"sites": {str(i): counts for _, i, counts in sites[:MAX_SITES]}
+				}
+				
+				# Write then rename, as loader.compile_source does
+				fn = profile_path(cachefn)
+				tmp = f"{fn}.{os.getpid()}.tmp"
+				with open(tmp, "w") as f:
+					json.dump(data, f)
+				os.replace(tmp, fn)
+			except OSError:
+				# A profile is only ever an optimization
+				continue
+	
+	def hottest(self, origins, n=10):
+		'''The n busiest sites with more than one key, as (origin, counts)'''
+		
+		out = []
+		for ast, _ in self.modules:
+			for node in preorder(ast):
+				counts = self.sites.get(id(node))
+				if counts and len(counts) > 1:
+					out.append((sum(counts.values()), origins.get(node), counts))
+		
+		out.sort(key=lambda s: s[0], reverse=True)
+		return [(origin, counts) for _, origin, counts in out[:n]]
@@ -0,0 +1,322 @@
+'''
+Struct-of-arrays AST. Instead of a Python object per node, every item of
+the tree (node, plain list or constant) is a row across parallel
+array.array columns, laid out in preorder:
+
+	kind    NODE, LIST or CONST
+	value   const pool index of a node's op or a constant's value
+	first   where the item's children start in kids
+	count   number of children
+	line    source position of nodes, -1 if unknown
+	col
+
+A node is a list headed by its op string, the same definition
+vm.OriginTable uses, so node order matches the origins order. Files are a
+magic number, a JSON header with the const pool, then the raw columns, so
+loading is one read with no per-node parsing.
+'''
+
+import sys, json
+from array import array
+
+import crema
+from vm import summary
+
+NODE, LIST, CONST = range(3)
+
+MAGIC = b"ESPFLAT\x01"
+COLUMNS = [
+	("kind", "b"), ("value", "i"), ("first", "i"), ("count", "i"),
+	("kids", "i"), ("line", "i"), ("col", "i")
+]
+
+class FlatError(ValueError): pass
+
+class Cursor:
+	'''
+	A position in a FlatAST. Nodes and lists index like their nested list
+	form (a node's op first), constants are returned as plain values.
+	'''
+	
+	__slots__ = ("flat", "index")
+	
+	def __init__(self, flat, index):
+		self.flat = flat
+		self.index = index
+	
+	def __repr__(self):
+		return f"Cursor({self.index}, {summary(self.to_list(), 40)})"
+	
+	@property
+	def kind(self): return self.flat.kind[self.index]
+	
+	@property
+	def op(self):
+		'''The op of a node, None otherwise'''
+		flat = self.flat
+		if flat.kind[self.index] == NODE:
+			return flat.consts[flat.value[self.index]]
+	
+	@property
+	def origin(self):
+		'''(line, col) of a node, or None'''
+		line = self.flat.line[self.index]
+		return None if line < 0 else (line, self.flat.col[self.index])
+	
+	def child(self, i):
+		'''The ith child, not counting a node's op'''
+		return self.flat.item(self.flat.kids[self.flat.first[self.index] + i])
+	
+	@property
+	def args(self):
+		'''Children, not counting a node's op'''
+		flat = self.flat
+		f = flat.first[self.index]
+		return [flat.item(k) for k in flat.kids[f:f + flat.count[self.index]]]
+	
+	def __len__(self):
+		return self.flat.count[self.index] + (self.kind == NODE)
+	
+	def __getitem__(self, i):
+		if self.kind == NODE:
+			if i == 0:
+				return self.op
+			i -= 1
+		if not 0 <= i < self.flat.count[self.index]:
+			raise IndexError(i)
+		return self.child(i)
+	
+	def __iter__(self):
+		if self.kind == NODE:
+			yield self.op
+		yield from self.args
+	
+	def nodes(self):
+		'''Every node in this subtree, in preorder'''
+		flat = self.flat
+		end = flat.end(self.index)
+		for i in range(self.index, end):
+			if flat.kind[i] == NODE:
+				yield Cursor(flat, i)
+	
+	def to_list(self):
+		return self.flat.to_list(self.index)[0]
+
+class FlatAST:
+	def __init__(self):
+		for name, tc in COLUMNS:
+			setattr(self, name, array(tc))
+		self.consts = []
+		# Files besides the source the tree was computed from, eg by static
+		#  expressions, see loader.bake
+		self.deps = []
+		# Only immutable constants are pooled, so the nested form never
+		#  shares lists or dicts between nodes
+		self.pool = {}
+	
+	def __len__(self):
+		return len(self.kind)
+	
+	@property
+	def root(self):
+		return self.item(0)
+	
+	@property
+	def nbytes(self):
+		'''Size of the columns'''
+		return sum(len(getattr(self, name))*getattr(self, name).itemsize for name, _ in COLUMNS)
+	
+	def item(self, i):
+		if self.kind[i] == CONST:
+			return self.consts[self.value[i]]
+		return Cursor(self, i)
+	
+	def end(self, i):
+		'''Index just past the subtree at i'''
+		while self.count[i]:
+			i = self.kids[self.first[i] + self.count[i] - 1]
+		return i + 1
+	
+	def const(self, value):
+		if isinstance(value, (list, dict)):
+			self.consts.append(value)
+			return len(self.consts) - 1
+		
+		key = (type(value), value)
+		idx = self.pool.get(key)
+		if idx is None:
+			idx = self.pool[key] = len(self.consts)
+			self.consts.append(value)
+		return idx
+	
+	def row(self, kind, value, count, origin=None):
+		'''Append an item, reserving slots in kids for its children'''
+		
+		i = len(self.kind)
+		self.kind.append(kind)
+		self.value.append(value)
+		self.first.append(len(self.kids))
+		self.count.append(count)
+		self.kids.frombytes(bytes(count*self.kids.itemsize))
+		line, col = origin or (-1, -1)
+		self.line.append(line)
+		self.col.append(col)
+		return i
+	
+	def add(self, value, origins=None):
+		'''Append nested lists in preorder, origins is an iterator of positions'''
+		
+		if type(value) is list:
+			if value and type(value[0]) is str:
+				origin = next(origins, None) if origins else None
+				i = self.row(NODE, self.const(value[0]), len(value) - 1, origin)
+				children = value[1:]
+			else:
+				i = self.row(LIST, -1, len(value))
+				children = value
+			
+			f = self.first[i]
+			for n, x in enumerate(children):
+				self.kids[f + n] = self.add(x, origins)
+			return i
+		
+		return self.row(CONST, self.const(value), 0)
+	
+	def add_ast(self, ast):
+		'''Append a crema.AST directly, without going through nested lists'''
+		
+		match ast:
+			case crema.AST():
+				tok = ast.token
+				origin = tok and (tok.ctx.line, tok.ctx.col)
+				i = self.row(NODE, self.const(ast.op), len(ast.args), origin)
+				children = ast.args
+			
+			case list() if ast and type(ast[0]) is str:
+				i = self.row(NODE, self.const(ast[0]), len(ast) - 1)
+				children = ast[1:]
+			
+			case list():
+				i = self.row(LIST, -1, len(ast))
+				children = ast
+			
+			case dict():
+				return self.row(CONST, self.const(crema.to_json(ast)), 0)
+			
+			case _:
+				return self.row(CONST, self.const(ast), 0)
+		
+		f = self.first[i]
+		for n, x in enumerate(children):
+			self.kids[f + n] = self.add_ast(x)
+		return i
+	
+	@classmethod
+	def from_list(cls, ast, origins=()):
+		flat = cls()
+		flat.add(ast, iter(origins))
+		return flat
+	
+	@classmethod
+	def from_ast(cls, ast):
+		flat = cls()
+		flat.add_ast(ast)
+		return flat
+	
+	def to_list(self, start=0):
+		'''
+		Adapter for code expecting nested lists, returns (ast, origins) of
+		the subtree at start. Built bottom up since parents come first.
+		'''
+		
+		end = self.end(start)
+		kind, first, count = self.kind[start:end], self.first, self.count
+		kids = self.kids
+		
+		# Constants are right from the start, nodes' ops get their children appended
+		consts = self.consts
+		built = [consts[v] for v in self.value[start:end]]
+		get = built.__getitem__ if start == 0 else lambda k: built[k - start]
+		for i in [i for i, k in enumerate(kind) if k != CONST][::-1]:
+			f = first[start + i]
+			elems = map(get, kids[f:f + count[start + i]])
+			if kind[i] == NODE:
+				built[i] = [built[i], *elems]
+			else:
+				built[i] = list(elems)
+		
+		origins = [
+			None if l < 0 else [l, c]
+			for l, c, k in zip(self.line[start:end], self.col[start:end], kind) if k == NODE
+		]
+		return built[0], origins
+	
+	def find(self, op):
+		'''Indices of every node with an op, without building cursors'''
+		
+		idx = self.pool.get((str, op))
+		if idx is None:
+			return []
+		kind = self.kind
+		return [i for i, v in enumerate(self.value) if v == idx and kind[i] == NODE]
+	
+	def dump(self, f):
+		header = json.dumps({
+			"byteorder": sys.byteorder,
+			"consts": self.consts,
+			"deps": self.deps,
+			"sizes": [len(getattr(self, name)) for name, _ in COLUMNS]
+		}).encode()
+		
+		f.write(MAGIC)
+		f.write(len(header).to_bytes(4, "little"))
+		f.write(header)
+		for name, _ in COLUMNS:
+			getattr(self, name).tofile(f)
+	
+	def save(self, fn):
+		with open(fn, "wb") as f:
+			self.dump(f)
+	
+	@classmethod
+	def loads(cls, data):
+		data = memoryview(data)
+		if data[:len(MAGIC)] != MAGIC:
+			raise FlatError("Not a flat AST")
+		
+		pos = len(MAGIC)
+		size = int.from_bytes(data[pos:pos + 4], "little")
+		pos += 4
+		header = json.loads(bytes(data[pos:pos + size]))
+		pos += size
+		
+		flat = cls()
+		flat.consts = header['consts']
+		flat.deps = header.get('deps', [])
+		flat.pool = {
+			(type(c), c): i for i, c in enumerate(flat.consts)
+			if not isinstance(c, (list, dict))
+		}
+		for (name, tc), n in zip(COLUMNS, header['sizes']):
+			col = getattr(flat, name)
+			nb = n*col.itemsize
+			if pos + nb > len(data):
+				raise FlatError("Truncated flat AST")
+			col.frombytes(data[pos:pos + nb])
+			if header['byteorder'] != sys.byteorder:
+				col.byteswap()
+			pos += nb
+		
+		return flat
+	
+	@classmethod
+	def load(cls, fn):
+		with open(fn, "rb") as f:
+			return cls.loads(f.read())
+
+def is_flat(fn):
+	try:
+		with open(fn, "rb") as f:
+			return f.read(len(MAGIC)) == MAGIC
+	except OSError:
+		return False
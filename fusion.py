@@ -0,0 +1,279 @@
+'''
+Iterator pipeline fusion. A chain of the builtin adapters (filter, map) and
+loop expressions feeding a consumer (reduce, max, min, join, list) builds a
+generator per stage when run as written, and every loop expression wraps
+an EspGenerator. fuse() finds these chains ahead of time and wraps the
+consumer call in place as ['fused', call, Pipeline], which runs the stages
+together in one loop.
+
+Whether the names mean the builtins is only known at runtime, so a pipeline
+checks them each time it runs and evaluates the original call if any of
+them was rebound. The adapters and consumers here are also what the
+builtins are, so both paths share their semantics (esplib/iter.esp's).
+'''
+
+from vm import Intrinsic, EspList, EspString, BreakSignal, ContinueSignal, spread
+
+#####################
+### The builtins ###
+#####################
+
+def _filter(vm, this, predicate):
+	for x in this:
+		if vm.call(predicate, None, [x]):
+			yield x
+
+def _map(vm, this, transform):
+	for x in this:
+		yield vm.call(transform, None, [x])
+
+def _reduce(vm, this, combinator, initial=None):
+	acc = initial
+	for x in this:
+		acc = vm.call(combinator, None, [acc, x])
+	return acc
+
+def _extreme(better):
+	def extreme(vm, *args):
+		# One argument is an iterable of candidates, otherwise the arguments are
+		it = iter(args[0] if len(args) == 1 else args)
+		best = next(it, None)
+		for x in it:
+			if better(x, best):
+				best = x
+		return best
+	return extreme
+
+def _join(vm, this, separator=", "):
+	it = iter(this)
+	first = next(it, None)
+	if first is None:
+		return EspString("")
+	
+	out = [str(first)]
+	for x in it:
+		out.append(str(separator))
+		out.append(str(x))
+	return EspString("".join(out))
+
+ADAPTERS = {
+	"filter": Intrinsic("filter", _filter),
+	"map": Intrinsic("map", _map)
+}
+CONSUMERS = {
+	"reduce": Intrinsic("reduce", _reduce),
+	"max": Intrinsic("max", _extreme(lambda x, best: x > best)),
+	"min": Intrinsic("min", _extreme(lambda x, best: x < best)),
+	"join": Intrinsic("join", _join)
+}
+INTRINSICS = {**ADAPTERS, **CONSUMERS}
+
+# What the names in a pipeline have to mean for it to run fused
+BUILTIN = {**INTRINSICS, "list": EspList}
+# Allowed numbers of arguments after the pipeline
+ARITY = {"reduce": (1, 2), "max": (0, 0), "min": (0, 0), "join": (0, 1), "list": (0, 0)}
+
+################
+### Codegen ###
+################
+
+NOTHING = object()
+
+# Consumers inlined into the loop as (setup, per element, result)
+CONSUMER_CODE = {
+	"list": (["out = EspList()", "push = out.append"], ["push(x)"], "out"),
+	"reduce": (
+		["combinator, acc = (*extra, None)[:2]"],
+		["acc = call(combinator, None, [acc, x])"], "acc"
+	),
+	"max": (["best = NOTHING"], ["if best is NOTHING or x > best: best = x"],
+		"None if best is NOTHING else best"),
+	"min": (["best = NOTHING"], ["if best is NOTHING or x < best: best = x"],
+		"None if best is NOTHING else best"),
+	"join": (
+		["separator = extra[0] if extra else ', '", "parts = []"],
+		# A none first element reads as the end, like esplib's join
+		["if not parts and x is None: break", "parts.append(str(x))"],
+		"EspString(str(separator).join(parts))"
+	)
+}
+
+LOOPS = {}
+
+def compile_loop(kinds, consumer):
+	'''
+	A function running stages of the given kinds, innermost first, into
+	consumer as one loop. It's called as loop(vm, it, args, *extra) where
+	args are each stage's function, or lvalue and body for loop expressions.
+	'''
+	
+	key = (kinds, consumer)
+	if (loop := LOOPS.get(key)) is not None:
+		return loop
+	
+	setup, step, result = CONSUMER_CODE[consumer]
+	# A back-edge, see VM.tick
+	params, body = [], ["vm.ticks -= 1", "if vm.ticks < 0: vm.tick()"]
+	for i, kind in enumerate(kinds):
+		if kind == "filter":
+			params.append(f"f{i}")
+			body.append(f"if not call(f{i}, None, [x]): continue")
+		elif kind == "map":
+			params.append(f"f{i}")
+			body.append(f"x = call(f{i}, None, [x])")
+		else:
+			# As VM.forloop, minus the EspGenerator
+			params += [f"lv{i}", f"body{i}"]
+			body += [
+				f"lv{i}.set(x)",
+				"try:", f"\tx = rval(body{i})",
+				"except ContinueSignal:", "\tcontinue",
+				"except BreakSignal:", "\tbreak"
+			]
+	
+	src = "\n".join([
+		"def loop(vm, it, args, *extra):",
+		"\tcall, rval = vm.call, vm.rval",
+		f"\t{', '.join(params)}, = args",
+		*("\t" + line for line in setup),
+		"\tfor x in it:",
+		*("\t\t" + line for line in body + step),
+		f"\treturn {result}"
+	])
+	
+	ns = {
+		"EspList": EspList, "EspString": EspString, "NOTHING": NOTHING,
+		"BreakSignal": BreakSignal, "ContinueSignal": ContinueSignal
+	}
+	exec(compile(src, f"<fused {' -> '.join(kinds + (consumer,))}>", "exec"), ns)
+	loop = LOOPS[key] = ns['loop']
+	return loop
+
+##############
+### Fusion ###
+##############
+
+class Pipeline:
+	'''
+	A consumer call over a chain of stages, outermost first. Stages are
+	("filter"|"map", fn) with fn an AST, or ("for", var, body) for a loop
+	expression.
+	'''
+	
+	__slots__ = ("consumer", "extra", "stages", "source")
+	
+	def __init__(self, consumer, extra, stages, source):
+		self.consumer = consumer
+		self.extra = extra
+		self.stages = stages
+		self.source = source
+	
+	def __repr__(self):
+		return f"Pipeline({self.describe()})"
+	
+	def describe(self):
+		return " -> ".join([s[0] for s in reversed(self.stages)] + [self.consumer])
+	
+	def names(self):
+		yield self.consumer
+		for stage in self.stages:
+			if stage[0] != "for":
+				yield stage[0]
+	
+	def prepare(self, vm, i=0):
+		'''
+		Evaluate what the chain evaluates when it's built, from stage i in.
+		Loop expressions defer theirs to the first pull, so the result is
+		start(), which does the deferred part and returns the source's
+		iterator and the loop's args, innermost stage first.
+		'''
+		
+		if i == len(self.stages):
+			value = vm.rval(self.source)
+			return lambda: (iter(value), [])
+		
+		stage = self.stages[i]
+		if stage[0] == "for":
+			_, var, body = stage
+			def start():
+				lv = vm.lval(var)
+				it, args = self.prepare(vm, i + 1)()
+				args += [lv, body]
+				return it, args
+			return start
+		
+		inner = self.prepare(vm, i + 1)
+		fn = vm.rval(stage[1])
+		def start():
+			it, args = inner()
+			args.append(fn)
+			return it, args
+		return start
+	
+	def run(self, vm, original):
+		for name in self.names():
+			if vm.resolve(name).get(name) is not BUILTIN[name]:
+				return vm.rval(original)
+		
+		# Same evaluation order as the call: the chain, the rest of the
+		#  consumer's arguments, then whatever waits for the first pull
+		start = self.prepare(vm)
+		extra = [vm.rval(x) for x in self.extra]
+		it, args = start()
+		
+		kinds = tuple(s[0] for s in reversed(self.stages))
+		return compile_loop(kinds, self.consumer)(vm, it, args, *extra)
+
+def pipeline(ast):
+	'''A Pipeline for a consumer call over at least one stage, or None'''
+	
+	# Arguments as crema emits them or spread out, see vm.spread
+	match ast:
+		case ['call', ['id', str(name)], *args] if name in ARITY:
+			args = spread(args)
+			lo, hi = ARITY[name]
+			if not args or not lo <= len(args) - 1 <= hi:
+				return None
+			src, *extra = args
+		case _:
+			return None
+	
+	stages = []
+	while True:
+		match src:
+			case ['call', ['id', str(adapter)], *args] if adapter in ADAPTERS and len(args := spread(args)) == 2:
+				inner, fn = args
+				stages.append((adapter, fn))
+				src = inner
+			case ['for', var, it, body]:
+				stages.append(("for", var, body))
+				src = it
+			case _:
+				break
+	
+	return Pipeline(name, extra, stages, src) if stages else None
+
+def fuse(ast, origins=None):
+	'''
+	Wrap the pipelines in ast in place. Returns a report of (origin, Pipeline)
+	for each, origin being the call's (line, col) if origins has it. Already
+	fused nodes are skipped, so running it twice is harmless.
+	'''
+	
+	report = []
+	def walk(node):
+		for i, x in enumerate(node):
+			if type(x) is not list or (x and x[0] == "fused"):
+				continue
+			
+			# Inner first, a fused pipeline can be another's source
+			walk(x)
+			if p := pipeline(x):
+				node[i] = ['fused', x, p]
+				# crema gives calls no origin, their callee has one
+				origin = origins and (origins.get(x) or origins.get(x[1]))
+				report.append((origin, p))
+	
+	if type(ast) is list:
+		walk(ast)
+	return report
@@ -0,0 +1,336 @@
+'''
+Module system for Espresso sources. Modules are resolved against a search
+path, parsed once into an on-disk cache next to their source, and loaded
+at most once per VM. Uncached dependencies found by scanning for constant
+import("...") calls are compiled in parallel before anything executes.
+'''
+
+import os, types
+from concurrent.futures import ProcessPoolExecutor
+
+import crema, fusion, parallel, constpool
+from flatast import FlatAST, FlatError, Cursor
+from vm import VM, Context, StackFrame, ReturnSignal, EspObject, builtins, summary
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ESPLIB = os.path.join(ROOT, "esplib")
+CACHE_DIR = "__espcache__"
+EXT = ".esp"
+
+class ModuleError(ImportError): pass
+
+def mtime(fn):
+	try:
+		return os.path.getmtime(fn)
+	except FileNotFoundError:
+		return float('inf')
+
+def cache_path(srcfn):
+	'''Where the compiled form of a source file is cached'''
+	head, tail = os.path.split(srcfn)
+	return os.path.join(head, CACHE_DIR, os.path.splitext(tail)[0] + ".ast")
+
+def statics(ast):
+	'''Yield every static node, outermost first'''
+	
+	if type(ast) is not list:
+		return
+	
+	if ast and ast[0] == "static":
+		yield ast
+	
+	for x in ast:
+		yield from statics(x)
+
+def bake(ast, base):
+	'''
+	Evaluate the static expressions in a tree at compile time, appending
+	each value in its portable form (see parallel.encode) to its node. They
+	run in a VM of their own with only the builtins, so module variables
+	aren't visible yet. Values which can't be encoded are left to be
+	evaluated once per VM at runtime. Returns the files they imported.
+	'''
+	
+	nodes = [node for node in statics(ast) if len(node) == 2]
+	if not nodes:
+		return []
+	
+	vm = VM(builtins())
+	imp = StaticLoader(vm, base).install()
+	for node in nodes:
+		try:
+			value = vm.rval(node[1])
+		except Exception as e:
+			raise ModuleError(f"static {summary(node[1], 40)} failed: {e}") from e
+		
+		try:
+			fns, data = parallel.encode(value)
+		except parallel.PortableError:
+			continue
+		node.append({"fns": fns, "data": data})
+	
+	return sorted(imp.deps.union(imp.modules))
+
+def compile_source(srcfn, cachefn=None):
+	'''Parse a source file and write its compiled cache'''
+	
+	ast, origins, _ = compile_deps(srcfn, cachefn)
+	return ast, origins
+
+def compile_deps(srcfn, cachefn=None):
+	'''compile_source, also returning the files its static values depend on'''
+	
+	with open(srcfn, "r") as f:
+		ast = crema.Parser(f.read()).parse()
+	
+	origins = []
+	ast = ast.to_json(origins)
+	deps = bake(ast, os.path.dirname(os.path.abspath(srcfn)))
+	
+	flat = FlatAST.from_list(ast, origins)
+	flat.deps = deps
+	
+	cachefn = cachefn or cache_path(srcfn)
+	os.makedirs(os.path.dirname(cachefn) or ".", exist_ok=True)
+	
+	# Write then rename so concurrent loaders never see a partial cache
+	tmp = f"{cachefn}.{os.getpid()}.tmp"
+	flat.save(tmp)
+	os.replace(tmp, cachefn)
+	
+	return ast, origins, deps
+
+def _precompile(srcfn):
+	# Pool worker, the tree is read back from the cache rather than pickled
+	compile_source(srcfn)
+
+def load_flat(srcfn, cachefn=None):
+	'''Load the cached FlatAST, or None if it's stale or unusable'''
+	
+	cachefn = cachefn or cache_path(srcfn)
+	cmt = mtime(cachefn)
+	if mtime(srcfn) > cmt or mtime(crema.__file__) > cmt:
+		return None
+	
+	try:
+		flat = FlatAST.load(cachefn)
+	except (FlatError, ValueError, FileNotFoundError):
+		return None
+	
+	# Static values are only as fresh as what they were computed from
+	if any(mtime(dep) > cmt for dep in flat.deps):
+		return None
+	return flat
+
+def load_cache(srcfn, cachefn=None):
+	'''Load (ast, origins) from the cache, or None if it's stale or unusable'''
+	
+	flat = load_flat(srcfn, cachefn)
+	return flat and flat.to_list()
+
+def imports(ast):
+	'''Yield the names of every import("...") with a constant argument'''
+	
+	# Flat trees are searched by column, without building the nested form
+	if isinstance(ast, FlatAST):
+		for i in ast.find('call'):
+			call = ast.item(i)
+			if len(call) > 2 and all(isinstance(x, Cursor) for x in call.args[:2]):
+				yield from imports(['call', call[1].to_list(), call[2].to_list()])
+		return
+	
+	if type(ast) is not list:
+		return
+	
+	match ast:
+		case ['call', ['id', 'import'], ['const', str(name)], *_]:
+			yield name
+	
+	for x in ast:
+		yield from imports(x)
+
+def default_path():
+	path = [ESPLIB]
+	if env := os.environ.get("ESPPATH"):
+		path = env.split(os.pathsep) + path
+	return path
+
+class Module:
+	def __init__(self, name, path):
+		self.name = name
+		self.path = path
+		self.ast = None
+		self.origins = None
+		# Pipelines fusion.fuse found, as (origin, Pipeline)
+		self.fused = None
+		self.loaded = False
+		self.value = None
+
+class Loader:
+	'''
+	Implements the import builtin for a single VM. Espresso modules are
+	tried first, anything else falls through to Python's __import__.
+	'''
+	
+	def __init__(self, vm, base=".", path=None, workers=None):
+		self.vm = vm
+		self.base = base
+		self.path = default_path() if path is None else list(path)
+		self.workers = workers
+		
+		# Registry of realpath -> Module, each loaded once per VM
+		self.modules = {}
+		# Modules currently executing, innermost last
+		self.loading = []
+	
+	def install(self):
+		self.vm.stack[0].scope[0]["import"] = self
+		self.vm.loader = self
+		return self
+	
+	def resolve(self, name, base=None):
+		'''Find the source file for a module name, or None'''
+		
+		fn = name if name.endswith(EXT) else name + EXT
+		if os.path.isabs(fn):
+			dirs = [""]
+		else:
+			dirs = [base or self.base, *self.path]
+		
+		for d in dirs:
+			path = os.path.join(d, fn)
+			if os.path.isfile(path):
+				return os.path.realpath(path)
+		
+		return None
+	
+	def __call__(self, name):
+		base = self.loading and os.path.dirname(self.loading[-1].path) or None
+		path = self.resolve(name, base)
+		if path is None:
+			return __import__(name)
+		
+		return self.load(path, name)
+	
+	def graph(self, roots):
+		'''
+		Walk the dependency graph from roots, yielding (path, cached) for
+		each module. cached is its FlatAST or None if it must be compiled.
+		'''
+		
+		seen = set()
+		frontier = list(roots)
+		while frontier:
+			level = []
+			for path in frontier:
+				if path in seen or path in self.modules: continue
+				seen.add(path)
+				level.append((path, load_flat(path)))
+			yield level
+			
+			frontier = []
+			for path, cached in level:
+				if cached is None: continue
+				base = os.path.dirname(path)
+				for name in imports(cached):
+					if dep := self.resolve(name, base):
+						frontier.append(dep)
+	
+	def precompile(self, roots):
+		'''
+		Compile every uncached module reachable from roots. Each level of
+		the dependency graph is compiled in parallel across a process pool,
+		since dependencies are only known once their importer is parsed.
+		'''
+		
+		pool = None
+		try:
+			frontier = list(roots)
+			while frontier:
+				stale = [p for level in self.graph(frontier) for p, c in level if c is None]
+				if not stale:
+					break
+				
+				if len(stale) == 1:
+					compile_source(stale[0])
+				else:
+					if pool is None:
+						pool = ProcessPoolExecutor(self.workers)
+					list(pool.map(_precompile, stale))
+				
+				# Freshly compiled modules may import further uncached ones
+				frontier = stale
+		finally:
+			if pool is not None:
+				pool.shutdown()
+	
+	def fetch(self, path):
+		'''
+		Get the (ast, origins) of a module, compiling it on a cache miss.
+		Whole graphs are compiled ahead by precompile, once from the roots.
+		'''
+		return load_cache(path) or compile_source(path)
+	
+	def load(self, path, name=None):
+		'''Load and execute a module by its resolved path'''
+		
+		if mod := self.modules.get(path):
+			if not mod.loaded:
+				chain = [m.name for m in self.loading[self.loading.index(mod):]]
+				raise ModuleError(f"Import cycle: {' -> '.join(chain + [mod.name])}")
+			return mod.value
+		
+		mod = Module(name or path, path)
+		mod.ast, mod.origins = self.fetch(path)
+		self.modules[path] = mod
+		
+		self.loading.append(mod)
+		try:
+			mod.value = self.execute(mod)
+		except:
+			# Allow a retry once whatever broke is fixed
+			del self.modules[path]
+			raise
+		finally:
+			self.loading.pop()
+		
+		mod.loaded = True
+		return mod.value
+	
+	def execute(self, mod):
+		'''
+		Run a module's top level in its own scope. The module's value is
+		whatever it returns, or its scope if it doesn't return anything.
+		'''
+		
+		vm = self.vm
+		vm.origins.add(mod.ast, mod.origins)
+		mod.fused = fusion.fuse(mod.ast, vm.origins)
+		constpool.pool(mod.ast)
+		if vm.feedback is not None:
+			vm.feedback.add(mod.ast, cache_path(mod.path))
+		if vm.debugger is not None:
+			vm.debugger.add(mod.ast, mod.path)
+		
+		scope = {}
+		frame = StackFrame(None, None, [vm.stack[0].scope[0], scope])
+		try:
+			with Context(vm.stack, frame):
+				vm.rval(mod.ast)
+		except ReturnSignal as r:
+			return r.value
+		
+		return EspObject(scope)
+
+class StaticLoader(Loader):
+	'''Loader for static expressions, recording the Python modules they import'''
+	
+	def __init__(self, vm, base="."):
+		super().__init__(vm, base)
+		self.deps = set()
+	
+	def __call__(self, name):
+		value = super().__call__(name)
+		if type(value) is types.ModuleType and (fn := getattr(value, "__file__", None)):
+			self.deps.add(fn)
+		return value
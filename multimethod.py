@@ -0,0 +1,173 @@
+'''
+Runtime support for multimethods, the `method` builtin. Each overload
+names a prototype per parameter (none for any) and a call runs the
+overload whose prototypes are nearest along the arguments' prototype
+chains, earlier arguments deciding ties as in CLOS.
+
+A call's resolution only depends on its arguments' prototype chains.
+Each multimethod caches the overload for every tuple of chains it has
+seen, and registering an overload clears it. The key is the whole chain
+up to the first Python type, not just the first link, since an object's
+"proto" entry can be reassigned and a cached overload would go stale.
+
+A value's prototype is its "proto" entry if it's an object which has one,
+otherwise its Python type, whose chain is the MRO.
+'''
+
+import time
+
+from vm import Intrinsic, EspObject
+
+def prototype(x):
+	'''The first link of x's prototype chain'''
+	
+	if type(x) is EspObject and (p := dict.get(x, "proto")) is not None:
+		return p
+	return type(x)
+
+def chain(proto):
+	'''Prototypes from proto to the root, nearest first'''
+	
+	out = []
+	seen = set()
+	while type(proto) is EspObject:
+		if id(proto) in seen:
+			break
+		seen.add(id(proto))
+		out.append(proto)
+		proto = prototype(proto)
+	
+	return out + list(getattr(proto, "__mro__", [proto]))
+
+def links(x):
+	'''
+	x's prototype chain up to and including its first Python type, which
+	is what a dispatch has to be keyed on. That type's MRO is fixed.
+	'''
+	
+	out = []
+	p = prototype(x)
+	while type(p) is EspObject:
+		# A cycle ends the chain, as in chain()
+		if any(q is p for q in out):
+			break
+		out.append(p)
+		p = prototype(p)
+	
+	out.append(p)
+	return tuple(out)
+
+def distance(protos, chains):
+	'''How far each parameter's prototype is along the argument's chain, or None'''
+	
+	out = []
+	for p, c in zip(protos, chains):
+		if p is None:
+			# Unconstrained parameters lose to any prototype
+			out.append(len(c))
+			continue
+		
+		for i, q in enumerate(c):
+			if q is p:
+				out.append(i)
+				break
+		else:
+			return None
+	return out
+
+class MultiMethod(Intrinsic):
+	'''
+	A function dispatching on all its arguments' prototypes. overloads are
+	(prototypes, fn) in registration order, cache maps the ids along each
+	argument's links() to (links, fn) with the links kept so the ids can't
+	be reused.
+	'''
+	
+	__slots__ = ("overloads", "cache", "hits", "misses", "elapsed")
+	
+	def __init__(self, name):
+		super().__init__(name, self.dispatch)
+		self.overloads = []
+		self.cache = {}
+		self.hits = 0
+		self.misses = 0
+		# Seconds spent resolving misses
+		self.elapsed = 0.0
+	
+	def __repr__(self):
+		return f"MultiMethod({self.name}, {len(self.overloads)} overloads)"
+	
+	def register(self, fn, protos):
+		'''Add an overload, replacing one with the same prototypes'''
+		
+		protos = tuple(protos)
+		for i, (ps, _) in enumerate(self.overloads):
+			if len(ps) == len(protos) and all(p is q for p, q in zip(ps, protos)):
+				self.overloads[i] = (protos, fn)
+				break
+		else:
+			self.overloads.append((protos, fn))
+		
+		self.cache.clear()
+		return self
+	
+	def resolve(self, protos):
+		'''The overload for arguments with these prototypes, or None'''
+		
+		chains = [chain(p) for p in protos]
+		best = best_fn = None
+		for ps, fn in self.overloads:
+			if len(ps) != len(protos):
+				continue
+			
+			d = distance(ps, chains)
+			if d is not None and (best is None or d < best):
+				best, best_fn = d, fn
+		
+		return best_fn
+	
+	def dispatch(self, vm, *args):
+		chains = tuple(map(links, args))
+		key = tuple(tuple(map(id, c)) for c in chains)
+		
+		if (entry := self.cache.get(key)) is not None:
+			self.hits += 1
+			fn = entry[1]
+		else:
+			self.misses += 1
+			start = time.perf_counter()
+			protos = tuple(c[0] for c in chains)
+			fn = self.resolve(protos)
+			self.elapsed += time.perf_counter() - start
+			
+			if fn is None:
+				names = ", ".join(getattr(p, "__name__", None) or repr(p) for p in protos)
+				raise TypeError(f"No overload of {self.name} for ({names})")
+			self.cache[key] = (chains, fn)
+		
+		return vm.call(fn, None, list(args))
+	
+	def stats(self):
+		calls = self.hits + self.misses
+		rate = self.hits/calls if calls else 0
+		return (
+			f"{self.name}: {calls} calls, {rate:.1%} cached, {self.misses} "
+			f"resolved in {self.elapsed*1e3:.3f} ms, {len(self.overloads)} overloads"
+		)
+
+def method(vm, fn, *protos):
+	'''
+	Register fn as an overload of the multimethod visible under its name,
+	making a new one if there isn't one, and return the multimethod.
+	Missing prototypes are none.
+	'''
+	
+	mm = vm.resolve(fn.name).get(fn.name)
+	if type(mm) is not MultiMethod:
+		mm = MultiMethod(fn.name)
+		vm.multimethods.append(mm)
+	
+	protos += (None,)*(len(fn.args) - len(protos))
+	return mm.register(fn, protos)
+
+INTRINSICS = {"method": Intrinsic("method", method)}
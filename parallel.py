@@ -0,0 +1,230 @@
+'''
+Parallel map and reduce over a process pool. Workers don't share the
+parent's VM, so the function and everything it captures are shipped as
+portable values: plain data, lists, objects, tuples and Espresso functions
+(by their AST and captured variables). Builtins are left out and rebound to
+the worker's own.
+'''
+
+import os, re, sys, itertools, functools, collections, importlib, pickle
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from vm import VM, EspFunc, EspString, EspList, EspTuple, EspObject, builtins
+
+CHUNKSIZE = 64
+
+class PortableError(TypeError): pass
+
+# Modules decode will import for a {"py": ...} value, any other has to be
+#  loaded already since the data can come from a cache on disk
+MODULES = {
+	"math", "cmath", "operator", "functools", "itertools", "statistics",
+	"string", "re", "json", "random", "unicodedata"
+}
+
+def free_names(ast, bound=()):
+	'''Names referenced by a function body which aren't its parameters'''
+	
+	names = set()
+	def walk(ast):
+		if type(ast) is not list:
+			return
+		
+		match ast:
+			case ['id', str(name)]:
+				names.add(name)
+			# Attribute names aren't variables
+			case ['.', lhs, _]:
+				walk(lhs)
+			case _:
+				for x in ast:
+					walk(x)
+	
+	walk(ast)
+	return names.difference(bound)
+
+class Encoder:
+	'''
+	Converts values to the portable form. Functions are numbered so shared
+	and recursive references survive the trip.
+	'''
+	
+	def __init__(self):
+		self.builtins = builtins()
+		self.fns = []
+		self.ids = {}
+	
+	def function(self, fn):
+		if (idx := self.ids.get(id(fn))) is not None:
+			return idx
+		
+		idx = self.ids[id(fn)] = len(self.fns)
+		entry = {"name": fn.name, "args": fn.args, "body": fn.body, "free": None}
+		self.fns.append(entry)
+		
+		free = {}
+		for name in free_names(fn.body, (a['name'] for a in fn.args)):
+			for scope in reversed(fn.scope):
+				if name in scope:
+					value = scope[name]
+					# The worker has its own
+					if self.builtins.get(name, self) is not value:
+						try:
+							free[name] = self.value(value)
+						except PortableError as e:
+							# Runtime services like import are rebound too
+							if name not in self.builtins:
+								raise PortableError(f"{fn.name} captures {name}: {e}") from None
+					break
+		
+		entry['free'] = free
+		return idx
+	
+	def value(self, value):
+		match value:
+			case None|bool()|int()|float()|str():
+				return value
+			case EspFunc():
+				return {"fn": self.function(value)}
+			case tuple():
+				return {"tuple": [self.value(x) for x in value]}
+			case list():
+				return [self.value(x) for x in value]
+			case dict():
+				return {"object": [[self.value(k), self.value(v)] for k, v in value.items()]}
+			# Recompiled on the other side, patterns are cheaper to send than to pickle
+			case re.Pattern() if type(value.pattern) is str:
+				return {"re": [value.pattern, value.flags]}
+			# Python functions go by name, eg things imported from modules
+			case _ if callable(value) and hasattr(value, "__qualname__") and "<" not in value.__qualname__:
+				return {"py": [value.__module__, value.__qualname__]}
+		
+		raise PortableError(f"{type(value).__name__} can't be sent to a worker")
+
+def encode(value):
+	'''Encode a value as (fns, data) of portable types'''
+	enc = Encoder()
+	return enc.fns, enc.value(value)
+
+def _module(name):
+	if (mod := sys.modules.get(name)) is not None:
+		return mod
+	if name in MODULES:
+		return importlib.import_module(name)
+	raise PortableError(f"Module {name} isn't loaded and won't be imported to decode a value")
+
+def decode(fns, data, scope):
+	'''Inverse of encode, functions close over scope plus their captures'''
+	
+	funcs = [EspFunc(f['name'], f['args'], f['body'], None) for f in fns]
+	
+	def value(data):
+		match data:
+			case str():
+				return EspString(data)
+			case list():
+				return EspList(map(value, data))
+			case {"fn": idx}:
+				return funcs[idx]
+			case {"tuple": xs}:
+				return EspTuple(map(value, xs))
+			case {"object": kvs}:
+				return EspObject((value(k), value(v)) for k, v in kvs)
+			case {"re": [pattern, flags]}:
+				return re.compile(pattern, flags)
+			case {"py": [module, name]}:
+				return functools.reduce(getattr, name.split("."), _module(module))
+		return data
+	
+	for fn, f in zip(funcs, fns):
+		fn.scope = [scope, {k: value(v) for k, v in f['free'].items()}]
+	
+	return value(data)
+
+@functools.lru_cache(8)
+def _function(payload):
+	# Workers see the same function for every chunk of a call
+	vm = VM(builtins())
+	return vm, decode(*pickle.loads(payload), vm.stack[0].scope[0])
+
+def _map_chunk(payload, chunk):
+	vm, fn = _function(payload)
+	scope = vm.stack[0].scope[0]
+	return encode([vm.call(fn, None, [x]) for x in decode(*chunk, scope)])
+
+def _reduce_chunk(payload, chunk):
+	vm, fn = _function(payload)
+	it = iter(decode(*chunk, vm.stack[0].scope[0]))
+	acc = next(it)
+	for x in it:
+		acc = vm.call(fn, None, [acc, x])
+	return encode(acc)
+
+def chunks(iterable, size):
+	it = iter(iterable)
+	while chunk := list(itertools.islice(it, size)):
+		yield chunk
+
+def _stream(task, fn, iterable, chunksize, workers, ordered):
+	'''
+	Run task over chunks of iterable, yielding each chunk's result. Only a
+	few chunks per worker are in flight so huge or infinite inputs stream.
+	'''
+	
+	if not isinstance(fn, EspFunc):
+		raise PortableError("Only Espresso functions can be sent to a worker")
+	
+	payload = pickle.dumps(encode(fn))
+	workers = workers or os.cpu_count() or 1
+	inputs = chunks(iterable, chunksize or CHUNKSIZE)
+	
+	with ProcessPoolExecutor(workers) as pool:
+		pending = collections.deque()
+		
+		def fill():
+			while len(pending) < workers*2:
+				chunk = next(inputs, None)
+				if chunk is None:
+					break
+				pending.append(pool.submit(task, payload, encode(chunk)))
+		
+		fill()
+		while pending:
+			if ordered:
+				yield pending.popleft().result()
+			else:
+				done, _ = wait(pending, return_when=FIRST_COMPLETED)
+				for f in done:
+					pending.remove(f)
+					yield f.result()
+			fill()
+
+def pmap(fn, iterable, chunksize=None, workers=None, ordered=True):
+	'''
+	Map fn over iterable across worker processes. Results are yielded in
+	input order as they arrive unless ordered is false.
+	'''
+	
+	scope = builtins()
+	for result in _stream(_map_chunk, fn, iterable, chunksize, workers, ordered):
+		yield from decode(*result, scope)
+
+def preduce(fn, iterable, initial=None, chunksize=None, workers=None):
+	'''
+	Reduce iterable with fn, each chunk in a worker and then the partial
+	results in order locally. fn must be associative. As with reduce, the
+	first call gets initial even when it's none, so for associative fn
+	the result is reduce's.
+	'''
+	
+	vm, local = _function(pickle.dumps(encode(fn)))
+	scope = vm.stack[0].scope[0]
+	partials = [
+		decode(*r, scope)
+		for r in _stream(_reduce_chunk, fn, iterable, chunksize, workers, True)
+	]
+	
+	acc = initial
+	for x in partials:
+		acc = vm.call(local, None, [acc, x])
+	return acc
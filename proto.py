@@ -0,0 +1,83 @@
+'''
+Prototypes with a fixed layout. A proto declaration's fields are known
+when it's evaluated, so it becomes a generated class with those fields as
+__slots__, inheriting its parent's, instead of each instance being a dict.
+Slots are stored at fixed offsets in the instance, in __fields__ order.
+
+Protos under struct can't be given fields outside their layout. Others get
+a __dict__ slot for the rare extra property, which costs a pointer until
+it's used. Statics and methods are class attributes.
+'''
+
+import keyword
+
+from vm import EspProto, EspStruct, EspFunc, Intrinsic
+
+# Field names -> generated __init__
+INITS = {}
+
+def _init(fields):
+	'''An __init__ taking fields positionally, unset ones are none'''
+	
+	if (init := INITS.get(fields)) is not None:
+		return init
+	
+	params = [f"a{i}=None" for i in range(len(fields))]
+	body = [
+		f"\tself.{name} = a{i}" if name.isidentifier() and not keyword.iskeyword(name)
+		else f"\tsetattr(self, {name!r}, a{i})"
+		for i, name in enumerate(fields)
+	]
+	src = "\n".join([f"def __init__(self, {', '.join(params)}):", *body, "\tpass"])
+	
+	ns = {}
+	exec(compile(src, f"<proto init {', '.join(fields)}>", "exec"), ns)
+	init = INITS[fields] = ns['__init__']
+	return init
+
+def make(name, parent, fields, statics):
+	'''The class for `proto name is parent {fields; statics}`'''
+	
+	if parent is None:
+		parent = EspProto
+	elif not (isinstance(parent, type) and issubclass(parent, EspProto)):
+		raise TypeError(f"proto {name} can't derive from {parent!r}, only protos or struct")
+	
+	fields = tuple(fields)
+	inherited = parent.__fields__
+	if clash := set(fields) & set(inherited):
+		raise ValueError(f"proto {name} redeclares {', '.join(sorted(clash))}")
+	if clash := set(fields) & set(statics):
+		raise ValueError(f"proto {name} declares {', '.join(sorted(clash))} as both field and static")
+	
+	slots = fields
+	if not issubclass(parent, EspStruct) and parent.__dictoffset__ == 0:
+		slots += ("__dict__",)
+	
+	cls = type(name, (parent,), {
+		**statics,
+		"__slots__": slots,
+		"__fields__": inherited + fields,
+		"__init__": _init(inherited + fields)
+	})
+	# Chains are immutable, so the subtype test is computed once
+	cls.__ancestors__ = frozenset(cls.__mro__)
+	return cls
+
+def new(vm, proto, *args):
+	'''
+	The new operator. Protos with an init method run it on an instance with
+	every field none, otherwise the arguments fill the fields in order.
+	'''
+	
+	if isinstance(proto, type) and issubclass(proto, EspProto):
+		init = getattr(proto, "init", None)
+		if isinstance(init, EspFunc):
+			obj = proto()
+			vm.call(init, obj, list(args))
+			return obj
+		return proto(*args)
+	
+	return vm.call(proto, None, list(args))
+
+INTRINSICS = {"new": Intrinsic("new", new), "struct": EspStruct}
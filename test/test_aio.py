@@ -0,0 +1,58 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+import aio
+from vm import VM, BudgetError, builtins
+
+def const(x): return ['const', x]
+def ref(x): return ['id', x]
+
+# function count(n) { return list(for(var i in range(n)) i).length }, by
+#  hand since crema doesn't emit functions or loops the VM runs yet
+COUNT = ['fn', const('count'), [{'name': 'n'}], ['block',
+	['return', ['call', ref('len'), ['call', ref('list'),
+		['for', ref('i'), ['call', ref('range'), ref('n')], ref('i')]
+	]]]
+]]
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		scope = builtins()
+		scope.update(len=len, range=range)
+		self.vm = VM(scope)
+		self.fn = scope['count'] = self.vm.rval(COUNT)
+		self.rt = aio.install(self.vm)
+	
+	def tearDown(self):
+		self.rt.close()
+	
+	def gather(self, tasks):
+		return self.rt.wait(self.vm.stack[0].scope[0]['async'].gather(tasks))
+	
+	def test_concurrent(self):
+		tasks = [self.rt.spawn(self.fn, [1000 + i]) for i in range(32)]
+		self.assertEqual(self.gather(tasks), [1000 + i for i in range(32)])
+	
+	def test_shared_budget(self):
+		budget = self.vm.limit(steps=10**6)
+		tasks = [self.rt.spawn(self.fn, [2000]) for _ in range(16)]
+		self.gather(tasks)
+		
+		# Every task's steps are counted once, give or take what each still
+		#  had granted when it finished
+		self.assertGreaterEqual(budget.used, 16*2000 - 16*budget.INTERVAL)
+		self.assertLessEqual(budget.used, 16*2000 + 16*10)
+	
+	def test_budget_stops_tasks(self):
+		self.vm.limit(steps=5000)
+		tasks = [self.rt.spawn(self.fn, [10**6]) for _ in range(8)]
+		with self.assertRaises(BudgetError):
+			self.gather(tasks)
+		
+		# The parent is out too, whichever thread ran out first
+		with self.assertRaises(BudgetError):
+			self.vm.eval(['call', ref('count'), const(10**6)])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,38 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+from vm import VM, BudgetError, builtins
+
+def const(x): return ['const', x]
+def ref(x): return ['id', x]
+
+# try { loop {} } catch e { caught = true }, by hand since crema doesn't
+#  emit loops in the shape the VM runs yet
+RUNAWAY = ['call', ref('list'), ['loop', None, const(True), const(None), None, None]]
+
+def guarded(fin=None):
+	return ['try', RUNAWAY, ref('e'), ['=', [ref('caught'), const(True)]], None, None, fin]
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		scope = builtins()
+		scope.update(caught=False)
+		self.vm = VM(scope)
+		self.vm.limit(steps=5000)
+	
+	def test_catch(self):
+		with self.assertRaises(BudgetError) as cm:
+			self.vm.eval(guarded())
+		
+		self.assertEqual(cm.exception.kind, "steps")
+		self.assertFalse(self.vm.stack[0].scope[0]['caught'])
+	
+	def test_finally_break(self):
+		# The finally's break replaces the error, eval still reports it
+		prog = ['call', ref('list'), ['loop', None, const(True), guarded(['break']), None, None]]
+		with self.assertRaises(BudgetError):
+			self.vm.eval(prog)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,72 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+
+import crema, constpool
+from vm import VM, builtins
+
+def const(x): return ['const', x]
+
+def parse(src):
+	return crema.Parser(src).parse().to_json([])
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		self.vm = VM(builtins())
+	
+	def pooled(self, src):
+		ast = parse(src)
+		counts = constpool.pool(ast)
+		return ast, counts
+	
+	def test_list(self):
+		ast, counts = self.pooled('["add", "sub", 1]')
+		self.assertEqual(ast[1][0], "template")
+		self.assertEqual(counts, {"strings": 2, "pooled": 0, "template": 1})
+		
+		# Each run gets its own copy, so changing one leaves the literal be
+		first = self.vm.rval(ast)
+		first.append("mul")
+		first[0] = "changed"
+		self.assertEqual(self.vm.rval(ast), ["add", "sub", 1])
+		self.assertIsNot(self.vm.rval(ast), self.vm.rval(ast))
+	
+	def test_object(self):
+		ast, _ = self.pooled('{op: "+"}')
+		self.assertEqual(ast[1][0], "template")
+		
+		first = self.vm.rval(ast)
+		first['op'] = "-"
+		first['prec'] = 10
+		self.assertEqual(dict(self.vm.rval(ast)), {"op": "+"})
+	
+	def test_tuple(self):
+		ast = ['progn', ['tuple', const("line"), const(1)]]
+		constpool.pool(ast)
+		self.assertEqual(ast[1][0], "pooled")
+		# Immutable, so every run shares one
+		self.assertIs(self.vm.rval(ast), self.vm.rval(ast))
+	
+	def test_mutable_entries(self):
+		# The inner list is a template, so the outer one can't share it
+		ast, counts = self.pooled('[1, [2]]')
+		self.assertEqual(ast[1][0], "list")
+		self.assertEqual(counts['template'], 1)
+		
+		first = self.vm.rval(ast)
+		first[1].append(3)
+		self.assertEqual(self.vm.rval(ast), [1, [2]])
+	
+	def test_strings(self):
+		ast, counts = self.pooled('f("a", "a")')
+		self.assertEqual(counts['strings'], 1)
+		args = ast[1][2]
+		self.assertIs(args[1][1], args[2][1])
+	
+	def test_idempotent(self):
+		ast, _ = self.pooled('["a", {b: 1}]')
+		self.assertEqual(constpool.pool(ast), {"strings": 0, "pooled": 0, "template": 0})
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,66 @@
+import os, sys, io, time, tempfile, threading
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+import daemon
+
+class Test(unittest.TestCase):
+	def run_source(self, src):
+		with tempfile.TemporaryDirectory() as tmp:
+			srcfn = os.path.join(tmp, "job.esp")
+			with open(srcfn, "w") as f:
+				f.write(src)
+			
+			out = io.StringIO()
+			code = daemon.run_job(daemon.WarmStore(), {"file": srcfn}, out)
+			return code, out.getvalue()
+	
+	def test_bad_request(self):
+		for request in ([1], {}, {"file": 1}, {"file": "x.esp", "argv": "a"}):
+			out = io.StringIO()
+			self.assertEqual(daemon.run_job(daemon.WarmStore(), request, out), 2)
+			self.assertTrue(out.getvalue().startswith("Bad request"))
+	
+	def test_static_deps(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			depfn = os.path.join(tmp, "dep.esp")
+			srcfn = os.path.join(tmp, "main.esp")
+			with open(depfn, "w") as f:
+				f.write("return 5;")
+			with open(srcfn, "w") as f:
+				f.write('var x = static import("dep"); print(x);')
+			# Sources from well before their caches are written
+			past = time.time() - 100
+			for fn in (depfn, srcfn):
+				os.utime(fn, (past, past))
+			
+			store = daemon.WarmStore()
+			def run():
+				out = io.StringIO()
+				self.assertEqual(daemon.run_job(store, {"file": srcfn}, out), 0, out.getvalue())
+				return out.getvalue()
+			
+			self.assertEqual(run(), "5\n")
+			self.assertEqual(run(), "5\n")
+			self.assertEqual(store.parses, 1)
+			
+			# The source is untouched, only what its static value came from
+			with open(depfn, "w") as f:
+				f.write("return 6;")
+			now = time.time()
+			os.utime(depfn, (now, now))
+			
+			self.assertEqual(run(), "6\n")
+			self.assertEqual(store.parses, 2)
+	
+	def test_await(self):
+		threads = threading.active_count()
+		code, out = self.run_source("var x = await async.sleep(0); print(x);")
+		
+		self.assertEqual(code, 0, out)
+		self.assertEqual(out, "None\n")
+		# The job's event loop is closed with it
+		self.assertEqual(threading.active_count(), threads)
+
+if __name__ == "__main__":
+	unittest.main()
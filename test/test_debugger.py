@@ -0,0 +1,116 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+
+import debugger
+from vm import VM, builtins
+
+def const(x): return ['const', x]
+def ref(x): return ['id', x]
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		self.vm = VM(builtins())
+		self.stops = []
+		self.actions = []
+		self.dbg = debugger.Debugger(self.vm, self.handler)
+	
+	def handler(self, dbg, probe, stmt):
+		self.stops.append((probe.line, dbg.variables().get('a')))
+		return self.actions.pop(0) if self.actions else "continue"
+	
+	def at(self, line, node):
+		self.vm.origins.table[id(node)] = (line, 1)
+		self.vm.origins.roots.append(node)
+		return node
+	
+	def program(self):
+		'''
+		1 var f = fn(a) {
+		2     var y = a + 1
+		3     return y }
+		4 var r = f(1)
+		5 var s = f(r)
+		6 if false {
+		7     print("unreached") }
+		'''
+		
+		at = self.at
+		body = ['block',
+			at(2, ['var', [[ref('y'), ['+', ref('a'), const(1)]]]]),
+			at(3, ['return', ref('y')])
+		]
+		return ['progn',
+			at(1, ['var', [[ref('f'), ['fn', const('f'), [{'name': 'a'}], body]]]]),
+			at(4, ['var', [[ref('r'), ['call', ref('f'), const(1)]]]]),
+			at(5, ['var', [[ref('s'), ['call', ref('f'), ref('r')]]]]),
+			at(6, ['if', const(False), ['block', at(7, ['call', ref('print'), const("unreached")])], None])
+		]
+	
+	def debug(self, *breakpoints):
+		ast = self.program()
+		self.dbg.add(ast)
+		for line in breakpoints:
+			self.dbg.breakpoint(line)
+		self.vm.rval(ast)
+		return ast
+	
+	def probed(self, ast):
+		'''Lines of the statements still wrapped in a probe'''
+		return sorted(x[2].line for parent, i, _ in self.dbg.statements(ast)
+			if (x := parent[i])[0] == "debug")
+	
+	def test_placement(self):
+		ast = self.debug(2, 6, 7)
+		# Every call stops in the function, the branch never runs
+		self.assertEqual(self.stops, [(2, 1), (2, 2), (6, None)])
+		self.assertEqual([bp.hits for bp in self.dbg.breakpoints], [2, 1, 0])
+		self.assertEqual(ast[4][0], "debug")
+		self.assertEqual(self.probed(ast), [2, 6, 7])
+	
+	def test_outermost(self):
+		# if true { var z = 1 } all on line 1
+		inner = self.at(1, ['var', [[ref('z'), const(1)]]])
+		ast = ['progn', self.at(1, ['if', const(True), ['block', inner], None])]
+		self.dbg.add(ast)
+		self.dbg.breakpoint(1)
+		self.vm.rval(ast)
+		
+		self.assertEqual(ast[1][0], "debug")
+		self.assertIs(ast[1][1][2][1], inner)
+		self.assertEqual(len(self.stops), 1)
+	
+	def test_before_add(self):
+		self.dbg.breakpoint(5)
+		self.debug()
+		self.assertEqual(self.stops, [(5, None)])
+	
+	def test_condition(self):
+		ast = self.program()
+		self.dbg.add(ast)
+		self.dbg.breakpoint(2, cond=['==', ref('a'), const(2)])
+		self.vm.rval(ast)
+		self.assertEqual(self.stops, [(2, 2)])
+	
+	def test_step_over(self):
+		self.actions = ["over", "over"]
+		ast = self.debug(4)
+		# Over the call on line 4, not into it
+		self.assertEqual([line for line, _ in self.stops], [4, 5, 6])
+		# Stepping is done, only the breakpoint's probe is left
+		self.assertEqual(self.probed(ast), [4])
+	
+	def test_step_into(self):
+		self.actions = ["into", "into", "into"]
+		self.debug(4)
+		self.assertEqual([line for line, _ in self.stops], [4, 2, 3, 5])
+	
+	def test_step_out(self):
+		self.actions = ["out"]
+		self.debug(2)
+		# Out of the first call, then the breakpoint in the second
+		self.assertEqual(self.stops, [(2, 1), (5, None), (2, 2)])
+
+if __name__ == "__main__":
+	unittest.main()
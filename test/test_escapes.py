@@ -0,0 +1,25 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+import crema
+
+class Test(unittest.TestCase):
+	def test_simple(self):
+		self.assertEqual(crema.stresc(r"a\tb\n"), "a\tb\n")
+	
+	def test_name(self):
+		self.assertEqual(crema.stresc(r"\N{BULLET}"), "•")
+		with self.assertRaises(KeyError):
+			crema.stresc(r"\N{NO SUCH NAME}")
+	
+	def test_escaped_backslash(self):
+		self.assertEqual(crema.stresc(r"a\\N{x}"), r"a\N{x}")
+		self.assertEqual(crema.stresc(r"\\\\"), "\\\\")
+		self.assertEqual(crema.stresc(r"\\\N{BULLET}"), "\\•")
+		
+		ast = crema.Parser(r'"a\\N{x}"').parse().to_json()
+		self.assertEqual(ast, ['progn', ['const', r"a\N{x}"]])
+
+if __name__ == "__main__":
+	unittest.main()
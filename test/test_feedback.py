@@ -0,0 +1,95 @@
+import os, sys, tempfile
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+import crema, loader, feedback
+from vm import VM, builtins
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.srcfn = os.path.join(self.tmp.name, "main.esp")
+		with open(self.srcfn, "w") as f:
+			f.write("var x = a + 1; var y = x < b;")
+		self.cachefn = loader.cache_path(self.srcfn)
+		loader.compile_source(self.srcfn)
+	
+	def tearDown(self):
+		self.tmp.cleanup()
+	
+	def run_profiled(self, fb, a=1, b=5, times=1):
+		'''Run the cached tree with a fresh VM, returning its tree'''
+		
+		ast, origins = loader.load_cache(self.srcfn)
+		fb.add(ast, self.cachefn)
+		for _ in range(times):
+			vm = VM(builtins())
+			vm.stack[0].scope[0].update(a=a, b=b)
+			vm.feedback = fb
+			vm.rval(ast)
+		return ast
+	
+	def sites(self, fb, ast):
+		return [fb.site(node) for node in feedback.preorder(ast) if fb.site(node)]
+	
+	def test_parsed_arithmetic(self):
+		fb = feedback.Feedback()
+		ast = crema.Parser("var x = a + 1;").parse().to_json()
+		vm = VM(builtins())
+		vm.stack[0].scope[0]['a'] = 2.5
+		vm.feedback = fb
+		vm.rval(ast)
+		self.assertEqual(vm.stack[0].scope[0]['x'], 3.5)
+		self.assertEqual(self.sites(fb, ast), [{"float int": 1}])
+	
+	def test_save_and_preload(self):
+		fb = feedback.Feedback()
+		self.run_profiled(fb, times=10)
+		fb.save()
+		
+		again = feedback.Feedback()
+		ast, _ = loader.load_cache(self.srcfn)
+		self.assertEqual(again.add(ast, self.cachefn), 2)
+		# Halved on load
+		self.assertEqual(self.sites(again, ast), [{"int int": 5}, {"int int": 5}])
+	
+	def test_stale(self):
+		fb = feedback.Feedback()
+		self.run_profiled(fb)
+		fb.save()
+		
+		# A recompiled cache renumbers the sites, its profile is ignored
+		with open(self.srcfn, "a") as f:
+			f.write(" var z = 2 * 3;")
+		loader.compile_source(self.srcfn)
+		ast, _ = loader.load_cache(self.srcfn)
+		self.assertEqual(feedback.Feedback().add(ast, self.cachefn), 0)
+	
+	def test_starts_warm(self):
+		fb = feedback.Feedback()
+		self.run_profiled(fb, times=feedback.HOT*2)
+		fb.save()
+		
+		# Preloaded counts are halved, still hot before the first run
+		warm = feedback.Feedback()
+		ast, _ = loader.load_cache(self.srcfn)
+		warm.add(ast, self.cachefn)
+		add = next(n for n in feedback.preorder(ast) if n[0] == "+")
+		lt, rt, fn = warm.fast(add, "+")
+		self.assertEqual((lt, rt, fn(2, 3)), (int, int, 5))
+	
+	def test_deopt(self):
+		fb = feedback.Feedback()
+		ast = self.run_profiled(fb, times=feedback.HOT)
+		add = next(n for n in feedback.preorder(ast) if n[0] == "+")
+		self.assertIsNotNone(fb.fast(add, "+"))
+		
+		vm = VM(builtins())
+		vm.stack[0].scope[0].update(a=1.5, b=5)
+		vm.feedback = fb
+		vm.rval(ast)
+		self.assertEqual(vm.stack[0].scope[0]['x'], 2.5)
+		self.assertIsNone(fb.fast(add, "+"))
+
+if __name__ == "__main__":
+	unittest.main()
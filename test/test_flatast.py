@@ -0,0 +1,79 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest, io
+
+import crema
+from flatast import FlatAST, FlatError, Cursor
+
+SRC = '''
+var xs = [1, "two", 3]
+f(xs, {a: 1}) + g.h
+return xs[0] == 1
+'''
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		self.ast = crema.Parser(SRC).parse()
+		self.origins = []
+		self.nested = self.ast.to_json(self.origins)
+		self.flat = FlatAST.from_list(self.nested, self.origins)
+	
+	def test_round_trip(self):
+		self.assertEqual(self.flat.to_list(), (self.nested, self.origins))
+		
+		# Straight from the crema.AST, and through the file format
+		self.assertEqual(FlatAST.from_ast(self.ast).to_list(), (self.nested, self.origins))
+		self.flat.deps = ["dep.py"]
+		loaded = FlatAST.loads(self.dump())
+		self.assertEqual(loaded.to_list(), (self.nested, self.origins))
+		self.assertEqual(loaded.deps, ["dep.py"])
+	
+	def test_subtree(self):
+		# Each statement's subtree, with only its own origins
+		root = self.flat.root
+		for i, stmt in enumerate(root.args):
+			ast, origins = self.flat.to_list(stmt.index)
+			self.assertEqual(ast, self.nested[i + 1])
+			self.assertEqual(origins[0], list(stmt.origin))
+	
+	def test_cursor(self):
+		root = self.flat.root
+		self.assertIsInstance(root, Cursor)
+		self.assertEqual(root[0], "progn")
+		self.assertEqual(root.op, "progn")
+		self.assertEqual(len(root), len(self.nested))
+		
+		# Nodes index like their nested form, constants come back plain
+		ret = root[3]
+		self.assertEqual(ret.op, "return")
+		self.assertEqual(ret[1][0], "==")
+		self.assertEqual(ret[1][2][1], 1)
+		self.assertEqual(ret.child(0).to_list(), self.nested[3][1])
+		self.assertEqual([x if type(x) is str else x.to_list() for x in ret], self.nested[3])
+		with self.assertRaises(IndexError):
+			ret[2]
+		
+		# Lists have no op
+		decl = root[1][1]
+		self.assertIsNone(decl.op)
+		self.assertEqual(decl.to_list(), self.nested[1][1])
+	
+	def test_find(self):
+		calls = self.flat.find("call")
+		self.assertEqual([self.flat.item(i)[1].to_list() for i in calls], [['id', 'f']])
+		self.assertEqual(self.flat.find("while"), [])
+	
+	def test_bad_file(self):
+		with self.assertRaises(FlatError):
+			FlatAST.loads(b"not a flat ast")
+		with self.assertRaises(FlatError):
+			FlatAST.loads(self.dump()[:-4])
+	
+	def dump(self):
+		f = io.BytesIO()
+		self.flat.dump(f)
+		return f.getvalue()
+
+if __name__ == "__main__":
+	unittest.main()
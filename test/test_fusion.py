@@ -0,0 +1,65 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest, copy
+
+import crema, fusion
+from vm import VM, EspList, builtins
+
+def const(x): return ['const', x]
+def ref(x): return ['id', x]
+def fn(name, params, body):
+	return ['fn', const(name), [{'name': p} for p in params], ['block', ['return', body]]]
+
+def parse(src):
+	return crema.Parser(src).parse().to_json([])
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		self.scope = builtins()
+		self.scope.update(xs=EspList(range(10)))
+		self.vm = VM(self.scope)
+		for name, params, body in [
+			('small', ['x'], ['<', ref('x'), const(5)]),
+			('double', ['x'], ['+', ref('x'), ref('x')]),
+			('add', ['a', 'b'], ['+', ref('a'), ref('b')])
+		]:
+			self.scope[name] = self.vm.rval(fn(name, params, body))
+	
+	def fused(self, src):
+		ast = parse(src)
+		plain = copy.deepcopy(ast)
+		report = fusion.fuse(ast)
+		self.assertEqual(len(report), 1)
+		self.assertEqual(ast[1][0], "fused")
+		return ast, plain
+	
+	def test_fused(self):
+		ast, plain = self.fused("reduce(map(filter(xs, small), double), add, 0)")
+		self.assertEqual(self.vm.rval(ast), 20)
+		self.assertEqual(self.vm.rval(ast), self.vm.rval(plain))
+		
+		ast, plain = self.fused('join(map(xs, double), "-")')
+		self.assertEqual(self.vm.rval(ast), self.vm.rval(plain))
+	
+	def test_rebound_adapter(self):
+		ast, _ = self.fused("reduce(map(filter(xs, small), double), add, 0)")
+		self.vm.rval(parse("map = filter"))
+		# filter(filter(xs, small), double) keeps 1-4 since double is truthy for them
+		self.assertEqual(self.vm.rval(ast), 10)
+	
+	def test_rebound_consumer(self):
+		ast, _ = self.fused("reduce(map(xs, double), add, 0)")
+		self.scope['reduce'] = lambda *args: "mine"
+		self.assertEqual(self.vm.rval(ast), "mine")
+		
+		# And back again
+		self.scope['reduce'] = fusion.BUILTIN['reduce']
+		self.assertEqual(self.vm.rval(ast), 90)
+	
+	def test_idempotent(self):
+		ast, _ = self.fused("reduce(map(xs, double), add, 0)")
+		self.assertEqual(fusion.fuse(ast), [])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,61 @@
+import os, sys, time, json, tempfile
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+
+import loader
+from vm import VM, builtins
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(tmp.cleanup)
+		self.dir = os.path.realpath(tmp.name)
+	
+	def write(self, name, src, mt=None):
+		fn = os.path.join(self.dir, name)
+		with open(fn, "w") as f:
+			f.write(src)
+		# Sources from well before their caches are written, unless given
+		mt = time.time() - 100 if mt is None else mt
+		os.utime(fn, (mt, mt))
+		return fn
+	
+	def load(self, fn):
+		vm = VM(builtins())
+		return loader.Loader(vm, self.dir).install().load(fn)
+	
+	def test_static_deps(self):
+		depfn = self.write("dep.esp", "return 5;")
+		srcfn = self.write("main.esp", 'var x = static import("dep"); return x;')
+		
+		self.assertEqual(self.load(srcfn), 5)
+		flat = loader.load_flat(srcfn)
+		self.assertIsNotNone(flat)
+		self.assertEqual(flat.deps, [depfn])
+		
+		# The source is untouched, only what its static value came from
+		self.write("dep.esp", "return 6;", time.time())
+		self.assertIsNone(loader.load_flat(srcfn))
+		self.assertEqual(self.load(srcfn), 6)
+		self.assertIsNotNone(loader.load_flat(srcfn))
+	
+	def test_python_deps(self):
+		srcfn = self.write("main.esp", 'var dumps = static import("json").dumps; return dumps(1);')
+		
+		self.assertEqual(self.load(srcfn), "1")
+		self.assertIn(json.__file__, loader.load_flat(srcfn).deps)
+	
+	def test_cached(self):
+		srcfn = self.write("main.esp", 'return 1 + 2;')
+		self.assertEqual(self.load(srcfn), 3)
+		
+		# A second load reads the cache instead of compiling again
+		cachefn = loader.cache_path(srcfn)
+		self.assertTrue(os.path.exists(cachefn))
+		mt = os.path.getmtime(cachefn)
+		self.assertEqual(self.load(srcfn), 3)
+		self.assertEqual(os.path.getmtime(cachefn), mt)
+
+if __name__ == "__main__":
+	unittest.main()
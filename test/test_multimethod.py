@@ -0,0 +1,81 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+
+from vm import VM, EspObject, builtins
+
+def const(x): return ['const', x]
+def ref(x): return ['id', x]
+def fn(name, params, body):
+	return ['fn', const(name), [{'name': p} for p in params], ['block', ['return', body]]]
+
+def proto(parent=None):
+	return EspObject() if parent is None else EspObject(proto=parent)
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		self.entity = proto()
+		self.player, self.alien = proto(self.entity), proto(self.entity)
+		self.scope = builtins()
+		self.scope.update(Entity=self.entity, Player=self.player, Alien=self.alien)
+		self.vm = VM(self.scope)
+	
+	def method(self, result, *protos):
+		'''Register an overload of collide(x, y) returning result'''
+		call = ['call', ref('method'), fn('collide', ['x', 'y'], const(result)),
+			*(ref(p) if p else const(None) for p in protos)]
+		return self.vm.rval(['=', ref('collide'), call])
+	
+	def collide(self, x, y):
+		return self.scope['collide'].dispatch(self.vm, x, y)
+	
+	def test_dispatch(self):
+		self.method("any", None, None)
+		self.method("entity-entity", 'Entity', 'Entity')
+		self.method("player-entity", 'Player', 'Entity')
+		self.method("entity-player", 'Entity', 'Player')
+		
+		p, a = proto(self.player), proto(self.alien)
+		self.assertEqual(self.collide(p, a), "player-entity")
+		self.assertEqual(self.collide(a, p), "entity-player")
+		self.assertEqual(self.collide(a, a), "entity-entity")
+		# Earlier arguments decide ties
+		self.assertEqual(self.collide(p, p), "player-entity")
+		# Python values' prototypes are their types
+		self.assertEqual(self.collide(1, "x"), "any")
+	
+	def test_no_overload(self):
+		self.method("player-player", 'Player', 'Player')
+		with self.assertRaises(TypeError):
+			self.collide(proto(self.alien), proto(self.player))
+	
+	def test_cache(self):
+		mm = self.method("entity-entity", 'Entity', 'Entity')
+		p, a = proto(self.player), proto(self.alien)
+		for _ in range(3):
+			self.assertEqual(self.collide(p, a), "entity-entity")
+		self.assertEqual((mm.hits, mm.misses), (2, 1))
+		
+		# Registering a nearer overload clears what was cached
+		self.method("player-alien", 'Player', 'Alien')
+		self.assertEqual(self.collide(p, a), "player-alien")
+		self.assertEqual(mm.misses, 2)
+		
+		# So does replacing one with the same prototypes
+		self.method("player-alien again", 'Player', 'Alien')
+		self.assertEqual(self.collide(p, a), "player-alien again")
+		self.assertEqual(len(mm.overloads), 2)
+	
+	def test_reassigned_proto(self):
+		self.method("entity-entity", 'Entity', 'Entity')
+		self.method("player-entity", 'Player', 'Entity')
+		x = proto(self.alien)
+		self.assertEqual(self.collide(x, x), "entity-entity")
+		
+		# The cache is keyed on the whole chain, not the object's first link
+		self.alien['proto'] = self.player
+		self.assertEqual(self.collide(x, x), "player-entity")
+
+if __name__ == "__main__":
+	unittest.main()
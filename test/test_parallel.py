@@ -0,0 +1,59 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest, math
+
+import parallel
+from vm import VM, builtins
+
+def const(x): return ['const', x]
+def ref(x): return ['id', x]
+def fn(name, params, body):
+	return ['fn', const(name), [{'name': p} for p in params], ['block', ['return', body]]]
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		self.vm = VM(builtins())
+		self.add = self.vm.rval(fn('add', ['a', 'b'], ['+', ref('a'), ref('b')]))
+		self.double = self.vm.rval(fn('double', ['x'], ['+', ref('x'), ref('x')]))
+	
+	def test_pmap(self):
+		self.assertEqual(list(parallel.pmap(self.double, range(10), 3, 2)), [x*2 for x in range(10)])
+		unordered = parallel.pmap(self.double, range(10), 3, 2, ordered=False)
+		self.assertEqual(sorted(unordered), [x*2 for x in range(10)])
+	
+	def test_preduce(self):
+		self.assertEqual(parallel.preduce(self.add, range(10), 0, 3, 2), 45)
+		# Chunks are combined in order
+		self.assertEqual(parallel.preduce(self.add, list("abcdefg"), "", 2, 2), "abcdefg")
+	
+	def test_preduce_initial(self):
+		# Applied once, not once per chunk
+		self.assertEqual(parallel.preduce(self.add, range(10), 100, 3, 2), 145)
+		with self.assertRaises(TypeError):
+			# As with reduce, the first call gets initial even when it's none
+			parallel.preduce(self.add, range(4), None, 2, 2)
+	
+	def test_python_function(self):
+		with self.assertRaises(parallel.PortableError):
+			list(parallel.pmap(abs, range(3)))
+	
+	def test_decode_module(self):
+		fns, data = parallel.encode(math.sqrt)
+		self.assertIs(parallel.decode(fns, data, {}), math.sqrt)
+	
+	def test_decode_unloaded(self):
+		# Importable, but nothing here loads it
+		self.assertNotIn("colorsys", sys.modules)
+		with self.assertRaises(parallel.PortableError):
+			parallel.decode([], {"py": ["colorsys", "rgb_to_hsv"]}, {})
+		self.assertNotIn("colorsys", sys.modules)
+	
+	def test_static_fallback(self):
+		# A baked value naming a module decode refuses is evaluated instead
+		vm = VM(builtins())
+		ast = ['static', const(3), {"fns": [], "data": {"py": ["espresso_not_a_module", "x"]}}]
+		self.assertEqual(vm.rval(ast), 3)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,67 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+
+from vm import VM, EspObject, builtins
+
+def const(x): return ['const', x]
+def ref(x): return ['id', x]
+def call(fn, *args): return ['call', ref(fn), *args]
+
+def proto(name, parent, fields, statics=()):
+	return ['proto', const(name), parent, [[ref(f), None] for f in fields],
+		[[ref(k), v] for k, v in statics]]
+
+class Test(unittest.TestCase):
+	def setUp(self):
+		self.vm = VM(builtins())
+		self.vm.rval(['progn',
+			proto('Node', const(None), ['line']),
+			proto('Op', ref('Node'), ['op', 'lhs', 'rhs'], [('arity', const(2))]),
+			proto('Point', ref('struct'), ['x', 'y'])
+		])
+	
+	def rval(self, ast):
+		return self.vm.rval(ast)
+	
+	def test_fields(self):
+		op = self.rval(call('new', ref('Op'), const(1), const("+")))
+		self.assertEqual(type(op).__fields__, ("line", "op", "lhs", "rhs"))
+		self.assertEqual((op.line, op.op), (1, "+"))
+		# Fields not given are none, as are names outside the layout
+		self.assertIsNone(op.lhs)
+		self.assertIsNone(op['nothing'])
+		self.assertEqual(self.rval(['.', ref('Op'), ref('arity')]), 2)
+		
+		# Protos which aren't structs can take extra fields
+		op['note'] = "extra"
+		self.assertEqual(list(op.keys()), ["line", "op", "lhs", "rhs", "note"])
+	
+	def test_is(self):
+		self.vm.stack[0].scope[0]['op'] = self.rval(call('new', ref('Op')))
+		self.assertTrue(self.rval(['is', ref('op'), ref('Op')]))
+		self.assertTrue(self.rval(['is', ref('op'), ref('Node')]))
+		self.assertTrue(self.rval(['is', ref('Op'), ref('Node')]))
+		self.assertFalse(self.rval(['is', ref('op'), ref('Point')]))
+		self.assertFalse(self.rval(['is', ref('Node'), ref('Op')]))
+	
+	def test_struct_layout(self):
+		p = self.rval(call('new', ref('Point'), const(1), const(2)))
+		self.assertEqual((p.x, p.y), (1, 2))
+		p['x'] = 3
+		self.assertEqual(p.x, 3)
+		with self.assertRaises(AttributeError):
+			p['z'] = 0
+	
+	def test_bad_declarations(self):
+		with self.assertRaises(ValueError):
+			self.rval(proto('Twice', ref('Op'), ['lhs']))
+		with self.assertRaises(ValueError):
+			self.rval(proto('Both', const(None), ['a'], [('a', const(1))]))
+		self.vm.stack[0].scope[0]['obj'] = EspObject()
+		with self.assertRaises(TypeError):
+			self.rval(proto('Child', ref('obj'), ['a']))
+
+if __name__ == "__main__":
+	unittest.main()
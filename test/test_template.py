@@ -0,0 +1,23 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+import crema
+
+def parse(src):
+	return crema.Parser(src).parse().to_json()
+
+class Test(unittest.TestCase):
+	def test_format(self):
+		self.assertEqual(parse(r'"a\{x}b"'),
+			['progn', ['format', ['const', 'a'], ['id', 'x'], ['const', 'b']]])
+	
+	def test_empty_embed(self):
+		with self.assertRaises(crema.ParseError):
+			parse(r'"\{}"')
+		
+		with self.assertRaises(crema.ParseError):
+			parse(r'"a\{ }b"')
+
+if __name__ == "__main__":
+	unittest.main()
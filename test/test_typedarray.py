@@ -0,0 +1,61 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+from unittest import mock
+
+import typedarray
+from typedarray import array
+
+class Pure(unittest.TestCase):
+	'''Kernels as map over operator functions, as without NumPy'''
+	
+	def setUp(self):
+		patch = mock.patch.object(typedarray, "np", None)
+		patch.start()
+		self.addCleanup(patch.stop)
+	
+	def test_arith(self):
+		a = array("i32", [1, 2, 3])
+		self.assertEqual((a + 1).tolist(), [2, 3, 4])
+		self.assertEqual((a * 2.5).kind, "f64")
+		self.assertEqual((a / 2).tolist(), [0.5, 1.0, 1.5])
+		self.assertEqual((a > 1).tolist(), [0, 1, 1])
+	
+	def test_negative_pow(self):
+		a = array("i32", [1, 2, 4])
+		r = a ** -1
+		self.assertEqual(r.kind, "f64")
+		self.assertEqual(r.tolist(), [1.0, 0.5, 0.25])
+		
+		r = 2 ** array("i64", [-1, 0, 1])
+		self.assertEqual(r.kind, "f64")
+		self.assertEqual(r.tolist(), [0.5, 1.0, 2.0])
+	
+	def test_pow(self):
+		r = array("i32", [1, 2, 3]) ** 2
+		self.assertEqual(r.kind, "i32")
+		self.assertEqual(r.tolist(), [1, 4, 9])
+	
+	def test_numpy(self):
+		with self.assertRaises(ImportError):
+			array("i32", 3).numpy()
+
+@unittest.skipUnless(typedarray.np, "NumPy isn't installed")
+class Test(Pure):
+	'''The same on NumPy kernels'''
+	
+	def setUp(self):
+		pass
+	
+	def test_numpy(self):
+		nd = array("i32", [1, 2]).numpy()
+		self.assertEqual(nd.tolist(), [1, 2])
+	
+	def test_from_numpy(self):
+		a = typedarray.from_numpy(typedarray.np.arange(1, 5, dtype="int64"))
+		self.assertEqual(a.kind, "i64")
+		self.assertEqual((a ** -1)[1], 0.5)
+
+if __name__ == "__main__":
+	unittest.main()
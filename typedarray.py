@@ -0,0 +1,316 @@
+'''
+Typed numeric arrays. An EspList is a list of boxed objects and arithmetic
+over one is a VM.binary dispatch per element, so numeric code gets a value
+holding i32, i64 or f64 elements in one buffer instead. Operators work on
+the whole array at once, which is where VM.binary ends up since it uses
+Python's operators: + - * / // % ** with arrays or scalars on either side,
+comparisons giving masks, and & | ^ ~ on masks (bitwise on integers).
+Integers to negative powers give f64 arrays.
+
+Arrays are a memoryview over an array.array, so slices are views sharing
+the original's elements and a mask indexes out a copy of what it selects.
+The kernels run on NumPy when it's installed, otherwise they're C-level
+loops of map over operator functions. Integer overflow is an
+OverflowError without NumPy and wraps with it.
+'''
+
+import array as _array, operator, itertools
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+def _typecode(size, codes):
+	# C type sizes vary, pick whichever code has the width
+	for code in codes:
+		if _array.array(code).itemsize == size:
+			return code
+	raise RuntimeError(f"No {size*8}-bit integer array type")
+
+# Masks are a byte per element, 0 or 1
+CODES = {
+	"i32": _typecode(4, "ilh"),
+	"i64": _typecode(8, "lq"),
+	"f64": "d",
+	"mask": "B"
+}
+DTYPES = {"i32": "int32", "i64": "int64", "f64": "float64", "mask": "uint8"}
+KINDS = {"int32": "i32", "int64": "i64", "float64": "f64", "bool": "mask", "uint8": "mask"}
+# Results take the widest operand's kind
+RANK = {"mask": 0, "i32": 1, "i64": 2, "f64": 3}
+
+def _wrap(kind, data):
+	'''A TypedArray over an array.array or a contiguous 1-D ndarray'''
+	
+	if np is not None and isinstance(data, np.ndarray):
+		if data.dtype == bool:
+			data = data.view(np.uint8)
+		# NumPy names its types differently (eg "l" for int64), so go through bytes
+		return TypedArray(kind, memoryview(data).cast("B").cast(CODES[kind]))
+	return TypedArray(kind, memoryview(data))
+
+def _kind(x):
+	'''Kind of an operand, None for int scalars, False if unsupported'''
+	
+	if isinstance(x, TypedArray):
+		return x.kind
+	if type(x) is float:
+		return "f64"
+	if isinstance(x, int):
+		return None
+	return False
+
+def _negative(x):
+	if isinstance(x, TypedArray):
+		return x.kind != "mask" and bool(x.data) and x.min() < 0
+	return x < 0
+
+def _result(a, b, op):
+	ka, kb = _kind(a), _kind(b)
+	if ka is False or kb is False:
+		return None
+	
+	if op is operator.truediv:
+		return "f64"
+	# Negative powers of integers are fractions, as with Python's int
+	if op is operator.pow and "f64" not in (ka, kb) and _negative(b):
+		return "f64"
+	# Arithmetic on masks counts them
+	return max(ka or "i32", kb or "i32", "i32", key=RANK.get)
+
+def _check(a, b):
+	if isinstance(a, TypedArray) and isinstance(b, TypedArray) and len(a) != len(b):
+		raise ValueError(f"Array lengths differ, {len(a)} and {len(b)}")
+
+def _elems(x):
+	return x.data if isinstance(x, TypedArray) else itertools.repeat(x)
+
+def _ndarray(x, kind=None):
+	if not isinstance(x, TypedArray):
+		return x
+	
+	nd = np.asarray(x.data)
+	if kind is not None and x.kind != kind:
+		nd = nd.astype(DTYPES[kind])
+	return nd
+
+def _kernel(op, a, b, kind):
+	'''Apply op elementwise, either side may be a scalar'''
+	
+	_check(a, b)
+	
+	if np is not None:
+		# The operands are converted first so masks don't wrap as bytes, and
+		#  so NumPy doesn't refuse integers to negative powers
+		convert = None if kind == "mask" or (kind == "f64" and op is not operator.pow) else kind
+		with np.errstate(divide="raise", invalid="raise"):
+			nd = op(_ndarray(a, convert), _ndarray(b, convert))
+		return _wrap(kind, np.ascontiguousarray(nd, DTYPES[kind]))
+	
+	return _wrap(kind, _array.array(CODES[kind], map(op, _elems(a), _elems(b))))
+
+def _arith(op, reflected=False):
+	def method(self, other):
+		a, b = (other, self) if reflected else (self, other)
+		if (kind := _result(a, b, op)) is None:
+			return NotImplemented
+		return _kernel(op, a, b, kind)
+	return method
+
+def _compare(op):
+	def method(self, other):
+		if _kind(other) is False:
+			return NotImplemented
+		return _kernel(op, self, other, "mask")
+	return method
+
+def _bitwise(op, reflected=False):
+	def method(self, other):
+		a, b = (other, self) if reflected else (self, other)
+		ka, kb = _kind(a), _kind(b)
+		if ka is False or kb is False or "f64" in (ka, kb):
+			return NotImplemented
+		
+		# Masks combine into masks, anything else is integer bitwise
+		if (ka or "mask") == (kb or "mask") == "mask":
+			kind = "mask"
+		else:
+			kind = max(ka or "i32", kb or "i32", "i32", key=RANK.get)
+		return _kernel(op, a, b, kind)
+	return method
+
+class TypedArray:
+	'''
+	A typed numeric array. kind is "i32", "i64", "f64" or "mask", data is a
+	1-D memoryview with that kind's typecode, possibly strided for views.
+	'''
+	
+	__slots__ = ("kind", "data")
+	
+	def __init__(self, kind, data):
+		self.kind = kind
+		self.data = data
+	
+	@property
+	def length(self): return len(self.data)
+	
+	def __len__(self): return len(self.data)
+	def __iter__(self): return iter(self.data)
+	
+	def __repr__(self):
+		return f"{self.kind}[{', '.join(map(str, self.data))}]"
+	
+	def __bool__(self):
+		if self.kind == "mask":
+			raise ValueError("A mask's truth is ambiguous, use any() or all()")
+		return len(self.data) != 0
+	
+	def __getitem__(self, x):
+		if isinstance(x, slice):
+			return TypedArray(self.kind, self.data[x])
+		
+		if isinstance(x, TypedArray):
+			if x.kind != "mask":
+				raise TypeError(f"Arrays are indexed by masks, not {x.kind}")
+			_check(self, x)
+			if np is not None:
+				return _wrap(self.kind, np.asarray(self.data)[np.asarray(x.data).view(bool)])
+			return _wrap(self.kind, _array.array(CODES[self.kind], itertools.compress(self.data, x.data)))
+		
+		if isinstance(x, str):
+			return getattr(self, x, None)
+		
+		return self.data[x]
+	
+	def __setitem__(self, x, value):
+		if isinstance(x, TypedArray):
+			if x.kind != "mask":
+				raise TypeError(f"Arrays are indexed by masks, not {x.kind}")
+			_check(self, x)
+			if np is not None:
+				np.asarray(self.data)[np.asarray(x.data).view(bool)] = value
+				return
+			for i in itertools.compress(range(len(self.data)), x.data):
+				self.data[i] = value
+		
+		elif isinstance(x, slice):
+			n = len(range(*x.indices(len(self.data))))
+			if isinstance(value, TypedArray):
+				value = value.data if value.kind == self.kind else value.tolist()
+			elif not hasattr(value, "__iter__"):
+				value = [value]*n
+			
+			if type(value) is not memoryview:
+				value = memoryview(_array.array(CODES[self.kind], value))
+			if len(value) != n:
+				raise ValueError(f"Assigning {len(value)} elements to a slice of {n}")
+			self.data[x] = value
+		
+		else:
+			self.data[x] = value
+	
+	__add__, __radd__ = _arith(operator.add), _arith(operator.add, True)
+	__sub__, __rsub__ = _arith(operator.sub), _arith(operator.sub, True)
+	__mul__, __rmul__ = _arith(operator.mul), _arith(operator.mul, True)
+	__truediv__, __rtruediv__ = _arith(operator.truediv), _arith(operator.truediv, True)
+	__floordiv__, __rfloordiv__ = _arith(operator.floordiv), _arith(operator.floordiv, True)
+	__mod__, __rmod__ = _arith(operator.mod), _arith(operator.mod, True)
+	__pow__, __rpow__ = _arith(operator.pow), _arith(operator.pow, True)
+	
+	__eq__, __ne__ = _compare(operator.eq), _compare(operator.ne)
+	__lt__, __le__ = _compare(operator.lt), _compare(operator.le)
+	__gt__, __ge__ = _compare(operator.gt), _compare(operator.ge)
+	__hash__ = None
+	
+	__and__, __rand__ = _bitwise(operator.and_), _bitwise(operator.and_, True)
+	__or__, __ror__ = _bitwise(operator.or_), _bitwise(operator.or_, True)
+	__xor__, __rxor__ = _bitwise(operator.xor), _bitwise(operator.xor, True)
+	
+	def __invert__(self):
+		if self.kind == "mask":
+			return _kernel(operator.xor, self, 1, "mask")
+		if self.kind == "f64":
+			raise TypeError("Can't invert an f64 array")
+		return _kernel(operator.xor, self, -1, self.kind)
+	
+	def __neg__(self):
+		return _kernel(operator.mul, self, -1, max(self.kind, "i32", key=RANK.get))
+	
+	def __pos__(self):
+		return self
+	
+	def __abs__(self):
+		if np is not None:
+			return _wrap(self.kind, np.abs(np.asarray(self.data)))
+		return _wrap(self.kind, _array.array(CODES[self.kind], map(abs, self.data)))
+	
+	def sum(self):
+		if np is not None:
+			return np.asarray(self.data).sum().item()
+		return sum(self.data)
+	
+	def min(self):
+		if not self.data: return None
+		if np is not None:
+			return np.asarray(self.data).min().item()
+		return min(self.data)
+	
+	def max(self):
+		if not self.data: return None
+		if np is not None:
+			return np.asarray(self.data).max().item()
+		return max(self.data)
+	
+	def any(self): return any(self.data)
+	def all(self): return all(self.data)
+	
+	def copy(self):
+		return _wrap(self.kind, _array.array(CODES[self.kind], self.data))
+	
+	def tolist(self):
+		return self.data.tolist()
+	
+	def numpy(self):
+		'''An ndarray sharing this array's elements'''
+		
+		if np is None:
+			raise ImportError("NumPy isn't installed")
+		nd = np.asarray(self.data)
+		return nd.view(bool) if self.kind == "mask" else nd
+	
+	def __array__(self, dtype=None, copy=None):
+		nd = self.numpy()
+		return nd if dtype is None else nd.astype(dtype)
+
+def from_numpy(nd):
+	'''A TypedArray sharing a 1-D ndarray's elements where its layout allows'''
+	
+	if nd.ndim != 1:
+		raise ValueError(f"Arrays are 1-D, got {nd.ndim} dimensions")
+	if (kind := KINDS.get(nd.dtype.name)) is None:
+		raise TypeError(f"No array kind for {nd.dtype}")
+	return _wrap(kind, np.ascontiguousarray(nd))
+
+def array(kind, init=0):
+	'''
+	Make an array of kind from an iterable, another array (converted), an
+	ndarray, or a length to fill with zeros.
+	'''
+	
+	if kind not in CODES:
+		raise ValueError(f"Unknown array kind {kind!r}, expected one of {', '.join(CODES)}")
+	code = CODES[kind]
+	
+	if isinstance(init, int):
+		return _wrap(kind, _array.array(code, bytes(init*_array.array(code).itemsize)))
+	
+	if isinstance(init, TypedArray):
+		if np is not None:
+			return from_numpy(np.asarray(init.data).astype(DTYPES[kind]))
+		init = init.data
+	
+	elif np is not None and isinstance(init, np.ndarray):
+		return from_numpy(init.astype(DTYPES[kind], copy=False))
+	
+	return _wrap(kind, _array.array(code, init))
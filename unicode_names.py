@@ -0,0 +1,299 @@
+'''
+Unicode character name database for \\N{...} escapes. Names are stored as
+sequences of indices into a word table (varints, most frequent words
+first), with a codepoint column for name() and an open addressing hash
+index for lookup(). Families named by codepoint (CJK UNIFIED IDEOGRAPH-4E00
+and the like) and Hangul syllables are generated rather than stored.
+
+The database file is mmapped on first use, so loading is a header parse and
+nothing else. Aliases and named sequences are included.
+
+	python unicode_names.py    regenerate unicode_names.bin
+'''
+
+import os, sys, json, mmap, zlib, bisect, struct
+from array import array
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DBFILE = os.path.join(ROOT, "unicode_names.bin")
+MAGIC = b"ESPUNAM\x01"
+# Codepoints past Unicode's range stand for named sequences
+SEQ_BASE = 0x110000
+
+HANGUL_BASE, HANGUL_COUNT = 0xac00, 11172
+JAMO_L = "G GG N D DD R M B BB S SS  J JJ C K T P H".split(" ")
+JAMO_V = "A AE YA YAE EO E YEO YE O WA WAE OE YO U WEO WE WI YU EU YI I".split(" ")
+JAMO_T = " G GG GS N NJ NH D L LG LM LB LS LT LP LH M B BS S SS NG J C K T P H".split(" ")
+JAMO_T_INDEX = {t: i for i, t in enumerate(JAMO_T)}
+
+def hangul_name(cp):
+	s = cp - HANGUL_BASE
+	l, v, t = s//(21*28), s//28%21, s%28
+	return f"HANGUL SYLLABLE {JAMO_L[l]}{JAMO_V[v]}{JAMO_T[t]}"
+
+def hangul_lookup(short):
+	# Short names are ambiguous to split greedily, but there are few options
+	for l, jl in enumerate(JAMO_L):
+		if not short.startswith(jl): continue
+		rest = short[len(jl):]
+		for v, jv in enumerate(JAMO_V):
+			if rest.startswith(jv) and (t := JAMO_T_INDEX.get(rest[len(jv):])) is not None:
+				return HANGUL_BASE + (l*21 + v)*28 + t
+	return None
+
+class NameDB:
+	def __init__(self, fn=DBFILE):
+		with open(fn, "rb") as f:
+			self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		
+		data = memoryview(self.mm)
+		if data[:len(MAGIC)] != MAGIC:
+			raise ValueError(f"{fn} isn't a name database")
+		
+		size, = struct.unpack_from("<I", data, len(MAGIC))
+		pos = len(MAGIC) + 4
+		header = json.loads(bytes(data[pos:pos + size]))
+		# Sections start aligned after the header
+		base = (pos + size + 3) & ~3
+		
+		self.version = header['version']
+		self.nnames = header['nnames']
+		self.families = header['families']
+		self.family_starts = [start for _, start, _ in self.families]
+		self.family_prefixes = {prefix for prefix, _, _ in self.families}
+		
+		for name, (off, n, tc) in header['sections'].items():
+			sect = data[base + off:base + off + n]
+			if tc != "B":
+				if sys.byteorder == "little":
+					sect = sect.cast(tc)
+				else:
+					sect = array(tc, sect)
+					sect.byteswap()
+			setattr(self, name, sect)
+		
+		self.mask = len(self.index) - 1
+		# Unused index slots are all ones, whatever the width
+		self.empty = (1 << 8*self.index.itemsize) - 1
+		self.wordcache = {}
+	
+	def word(self, w):
+		s = self.wordcache.get(w)
+		if s is None:
+			s = self.wordcache[w] = bytes(self.wordblob[self.words[w]:self.words[w + 1]])
+		return s
+	
+	def entry_name(self, e):
+		'''The stored name of an entry as bytes'''
+		
+		blob = self.nameblob
+		pos, end = self.names[e], self.names[e + 1]
+		words = []
+		while pos < end:
+			v = shift = 0
+			while True:
+				b = blob[pos]
+				pos += 1
+				v |= (b & 0x7f) << shift
+				if b < 0x80: break
+				shift += 7
+			words.append(self.word(v))
+		return b" ".join(words)
+	
+	def entry_value(self, e):
+		cp = self.cps[e]
+		if cp < SEQ_BASE:
+			return chr(cp)
+		i = cp - SEQ_BASE
+		return bytes(self.seqblob[self.seqs[i]:self.seqs[i + 1]]).decode()
+	
+	def lookup(self, name):
+		'''Character (or named sequence) for a name, case insensitive'''
+		
+		orig, name = name, name.upper()
+		if name.startswith("HANGUL SYLLABLE "):
+			if (cp := hangul_lookup(name[16:])) is not None:
+				return chr(cp)
+		
+		prefix, dash, code = name.rpartition("-")
+		if dash and prefix + dash in self.family_prefixes:
+			try:
+				cp = int(code, 16)
+			except ValueError:
+				cp = -1
+			if self.family(cp) == prefix + dash and f"{cp:04X}" == code:
+				return chr(cp)
+		
+		key = name.encode()
+		i = zlib.crc32(key) & self.mask
+		index, empty = self.index, self.empty
+		while (e := index[i]) != empty:
+			if self.entry_name(e) == key:
+				return self.entry_value(e)
+			i = (i + 1) & self.mask
+		
+		raise KeyError(f"undefined character name '{orig}'")
+	
+	def family(self, cp):
+		'''Prefix of the generated family holding cp, or None'''
+		i = bisect.bisect_right(self.family_starts, cp) - 1
+		if i >= 0:
+			prefix, start, end = self.families[i]
+			if start <= cp <= end:
+				return prefix
+	
+	def name(self, cp):
+		'''Primary name of a codepoint, or None'''
+		
+		if HANGUL_BASE <= cp < HANGUL_BASE + HANGUL_COUNT:
+			return hangul_name(cp)
+		if prefix := self.family(cp):
+			return f"{prefix}{cp:04X}"
+		
+		cps = self.cps
+		i = bisect.bisect_left(cps, cp, 0, self.nnames)
+		if i < self.nnames and cps[i] == cp:
+			return self.entry_name(i).decode()
+		return None
+
+_db = None
+
+def db():
+	global _db
+	if _db is None:
+		_db = NameDB()
+	return _db
+
+def lookup(name):
+	'''Like unicodedata.lookup, raises KeyError for unknown names'''
+	return db().lookup(name)
+
+_missing = object()
+def name(c, default=_missing):
+	'''Like unicodedata.name, raises ValueError if there's no name and no default'''
+	
+	n = db().name(ord(c))
+	if n is None:
+		if default is _missing:
+			raise ValueError("no such name")
+		return default
+	return n
+
+def read_ucd(fn):
+	'''Fields of the data lines of a UCD text file'''
+	with open(fn, "rt") as f:
+		for line in f:
+			line = line.split("#", 1)[0].strip()
+			if line:
+				yield [x.strip() for x in line.split(";")]
+
+def generate(fn=DBFILE, research=os.path.join(ROOT, "research")):
+	import re, unicodedata
+	from collections import Counter
+	
+	# Families named by their own codepoint, merged into contiguous runs
+	families = []
+	names = []
+	for cp in range(0x110000):
+		n = unicodedata.name(chr(cp), None)
+		if n is None or HANGUL_BASE <= cp < HANGUL_BASE + HANGUL_COUNT:
+			continue
+		
+		m = re.fullmatch(r"(.*-)([0-9A-F]{4,6})", n)
+		if m and int(m[2], 16) == cp:
+			if families and families[-1][0] == m[1] and families[-1][2] == cp - 1:
+				families[-1][2] = cp
+			else:
+				families.append([m[1], cp, cp])
+			continue
+		
+		names.append((cp, n))
+	
+	aliases = [
+		(int(code, 16), alias)
+		for code, alias, _ in read_ucd(os.path.join(research, "NameAliases.txt"))
+	]
+	seqs = [
+		(name, "".join(chr(int(c, 16)) for c in codes.split()))
+		for name, codes in read_ucd(os.path.join(research, "NamedSequences.txt"))
+	]
+	
+	entries = names + aliases + [(SEQ_BASE + i, n) for i, (n, _) in enumerate(seqs)]
+	
+	# Most frequent words get the shortest indices
+	freq = Counter(w for _, n in entries for w in n.split(" "))
+	words = [w for w, _ in freq.most_common()]
+	windex = {w: i for i, w in enumerate(words)}
+	
+	def varint(v):
+		out = bytearray()
+		while v >= 0x80:
+			out.append(v & 0x7f | 0x80)
+			v >>= 7
+		out.append(v)
+		return out
+	
+	wordoff, wordblob = array("I", [0]), bytearray()
+	for w in words:
+		wordblob += w.encode()
+		wordoff.append(len(wordblob))
+	
+	cps, nameoff, nameblob = array("I"), array("I", [0]), bytearray()
+	for cp, n in entries:
+		cps.append(cp)
+		for w in n.split(" "):
+			nameblob += varint(windex[w])
+		nameoff.append(len(nameblob))
+	
+	seqoff, seqblob = array("I", [0]), bytearray()
+	for _, s in seqs:
+		seqblob += s.encode()
+		seqoff.append(len(seqblob))
+	
+	# Open addressing at under 2/3 load keeps probes short
+	size = 1
+	while size*2 < len(entries)*3:
+		size *= 2
+	tc = "H" if len(entries) < 0xffff else "I"
+	empty = (1 << 8*array(tc).itemsize) - 1
+	index = array(tc, [empty])*size
+	for e, (_, n) in enumerate(entries):
+		i = zlib.crc32(n.encode()) & (size - 1)
+		while index[i] != empty:
+			i = (i + 1) & (size - 1)
+		index[i] = e
+	
+	sections = {
+		"words": wordoff, "wordblob": wordblob,
+		"cps": cps, "names": nameoff, "nameblob": nameblob,
+		"seqs": seqoff, "seqblob": seqblob, "index": index
+	}
+	if sys.byteorder != "little":
+		for x in sections.values():
+			if isinstance(x, array): x.byteswap()
+	
+	table, off = {}, 0
+	for name, x in sections.items():
+		tc = x.typecode if isinstance(x, array) else "B"
+		n = len(x)*(x.itemsize if isinstance(x, array) else 1)
+		table[name] = [off, n, tc]
+		# Keep sections aligned for casting
+		off = (off + n + 3) & ~3
+	
+	head = json.dumps({
+		"version": unicodedata.unidata_version,
+		"nnames": len(names),
+		"families": families,
+		"sections": table
+	}).encode()
+	
+	with open(fn, "wb") as f:
+		f.write(MAGIC)
+		f.write(struct.pack("<I", len(head)))
+		f.write(head)
+		for x in sections.values():
+			f.write(b"\0"*(-f.tell() % 4))
+			f.write(bytes(x))
+
+if __name__ == "__main__":
+	generate()
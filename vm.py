@@ -1,92 +1,145 @@
-import re
+import re, io, sys, time, itertools, threading
 
 SOL = re.compile("^", re.M)
 def indent(s, n=1):
 	return SOL.sub('  '*n, s)
 
-def color(x, c):
-	def ansi(c):
-		COLORS = {
-			"red": 31,
-			"blue": 94,
-			"yellow": 93,
-			"purple": 35,
-			"underline": 4,
-			"bold": 1,
-			"reset": 0
-		}
-		
-		if type(c) is str:
-			c = [c]
-		
-		return f"\x1b[{';'.join(str(COLORS[x]) for x in c)}m"
-	
-	if c is None: return x
-	return f"{ansi(c)}{x}{ansi('reset')}"
-
-UNDEFINED = object()
-class Sexp:
-	def __init__(self, op, *elems, nl=None, color=None, outer=UNDEFINED):
-		self.op = op
-		self.elems = elems
-		self.nl = nl
-		self.color = color
-		
-		OPEN = ("", "")
-		if outer is UNDEFINED:
-			self.outer = OPEN if op is None else "()"
+COLORS = {
+	"red": 31,
+	"blue": 94,
+	"yellow": 93,
+	"purple": 35,
+	"underline": 4,
+	"bold": 1,
+	"reset": 0
+}
+
+def ansi(c):
+	if type(c) is str:
+		c = [c]
+	
+	return f"\x1b[{';'.join(str(COLORS[x]) for x in c)}m"
+
+def iter_sexp(ast, depth=None, colors=True):
+	'''
+	Lazily yield the pieces of a readable sexp. ANSI escapes are yielded as
+	their own pieces so consumers can count visible characters. Subtrees
+	deeper than depth are elided as "...".
+	'''
+	
+	def paint(x, c):
+		if colors:
+			yield ansi(c)
+			yield str(x)
+			yield ansi('reset')
 		else:
-			self.outer = outer or OPEN
+			yield str(x)
 	
-	def __str__(self):
-		def join(x, sep):
-			return sep.join(str(e) for e in x)
+	def seq(op, elems, d, nl=None, outer="()"):
+		'''
+		nl is None to keep everything on one line, all to put every element
+		on its own line, or n to break before the nth element onwards.
+		'''
 		
-		op = self.op and color(self.op, ["bold", "blue"]) + " " or ""
+		yield outer[0]
+		if op:
+			yield from paint(op, ["bold", "blue"])
+			yield " "
 		
-		elems = self.elems
-		if self.nl is all:
-			elems = join(elems, '\n')
-		elif self.nl is None:
-			elems = join(elems, ' ')
-		else:
-			elems = join((join(elems[:self.nl - 1], ' '),) + elems[self.nl - 1:], '\n  ')
-		
-		elems = color(elems, self.color)
+		for i, e in enumerate(elems):
+			if nl is None:
+				if i: yield " "
+			elif nl is all:
+				if i: yield "\n"
+			elif i >= nl - 1:
+				yield "\n  "
+			elif i:
+				yield " "
+			
+			yield from walk(e, d)
+		yield outer[1]
+	
+	def walk(ast, d):
+		if type(ast) is list and depth is not None and d > depth:
+			yield "..."
+			return
 		
-		return f"{self.outer[0]}{op}{elems}{self.outer[1]}"
+		d += 1
+		match ast:
+			case None: yield "@"
+			case ['const', int(value)]: yield from paint(value, "yellow")
+			case ['const', str(value)]: yield from paint(value, "underline")
+			case ['id', str(name)]: yield from paint(name, "purple")
+			case ['list', *elems]: yield from seq(None, elems, d, 1, "[]")
+			case ['progn'|'block', *elems]: yield from seq(None, elems, d, 1, "{}")
+			
+			case ['if', *rest]: yield from seq("if", rest, d, 2)
+			case ["loop", *rest]: yield from seq("loop", rest, d, all)
+			case ['for', *rest]: yield from seq("for", rest, d, 3)
+			
+			case ["object", *entries]:
+				yield from seq("object", entries, d)
+			
+			case [str(op), *rest]: yield from seq(op, rest, d)
+			case list(): yield from seq(None, ast, d, outer="[]")
+			case _: yield repr(ast)
+	
+	return walk(ast, 0)
 
-def format_sexp(ast):
-	match ast:
-		case ['line', _, value]: return format_sexp(value)
-		case ['const', int(value)]: return Sexp(None, value, color="yellow")
-		case ['const', str(value)]: return Sexp(None, value, color="underline")
-		case ['id', name]: return Sexp(None, name, color="purple")
-		case ['list', *rest]: return Sexp(None, *map(format_sexp, elems), nl=1, outer="[]")
-		case ['progn'|'block', *elems]: return Sexp(None, *map(format_sexp, elems), nl=1, outer="{}")
-		
-		case ['if', *rest]: return Sexp("if", *map(format_sexp, rest), nl=2)
-		case ["loop", *rest]: return Sexp("loop", *map(format_sexp, rest), nl=all)
-		case ['for', *rest]: return Sexp("for", *map(format_sexp, rest), nl=3)
+def write_sexp(ast, out, limit=None, depth=None, colors=True):
+	'''
+	Stream a sexp to out, stopping after limit visible characters. Returns
+	whether the output was truncated.
+	'''
+	
+	n = 0
+	for piece in iter_sexp(ast, depth, colors):
+		if piece.startswith("\x1b"):
+			out.write(piece)
+			continue
 		
-		case ["object", *entries]:
-			return Sexp('object', *(Sexp(None, *map(format_sexp, pair), outer="()") for pair in entries))
+		if limit is not None and n + len(piece) > limit:
+			out.write(piece[:limit - n])
+			if colors:
+				out.write(ansi('reset'))
+			return True
 		
-		case [str(op), *rest]: return Sexp(op, *rest)
-		case _: return Sexp(repr(ast), outer=None)
+		n += len(piece)
+		out.write(piece)
+	
+	return False
 
-def sexp(ast):
+def sexp(ast, limit=None, depth=None):
 	'''Convert sexp ast to an actually readable string'''
-	if ast is None:
-		return "@"
-	
-	return str(format_sexp(ast))
+	out = io.StringIO()
+	write_sexp(ast, out, limit, depth)
+	return out.getvalue()
 
-def summary(ast):
-	s = sexp(ast)
-	if len(s) < 100:
-		return s
-	return s[:100] + "..."
+def summary(ast, limit=100):
+	'''Short sexp which only formats as much of the ast as it shows'''
+	out = io.StringIO()
+	if write_sexp(ast, out, limit):
+		out.write("...")
+	return out.getvalue()
+
+def spread(elems):
+	'''
+	The entries of a list literal or call's arguments. crema emits them as
+	one node, none for no entries or a right-nested chain of ',' for more
+	than one, while trees built by hand spread them out already.
+	'''
+	
+	match elems:
+		case [None]:
+			return []
+		case [[',', _, _] as node]:
+			out = []
+			while type(node) is list and len(node) == 3 and node[0] == ',':
+				out.append(node[1])
+				node = node[2]
+			out.append(node)
+			return out
+	return elems
 
 ###############
 ### Runtime ###
@@ -95,10 +148,12 @@ def summary(ast):
 def py2esp(value):
 	match value:
 		case None: return None
+		# Already converted, eg module values passing back through import
+		case EspString()|EspList()|EspObject(): return value
 		case str(value): return EspString(value)
 		case list(value): return EspList(map(py2esp, value))
 		case dict(value):
-			return EspObject((py2esp(k), py2esp(v)) for k, v in value)
+			return EspObject((py2esp(k), py2esp(v)) for k, v in value.items())
 		
 		case _: return value
 
@@ -179,32 +234,82 @@ class EspObject(dict):
 	def keys(self): return EspList(super().keys())
 	def values(self): return EspList(super().values())
 
+class EspProto:
+	'''
+	Base of prototypes with a fixed layout, see proto.py. Instances keep
+	their fields in slots, __fields__ in slot order. __ancestors__ is every
+	prototype on the chain so the is operator is a set lookup.
+	'''
+	
+	__slots__ = ()
+	__fields__ = ()
+	__ancestors__ = frozenset()
+	
+	def __getattr__(self, name):
+		# Unset fields are none, but keep Python's protocols working
+		if name.startswith("__"):
+			raise AttributeError(name)
+		return None
+	
+	def __getitem__(self, name):
+		if isinstance(name, str):
+			return getattr(self, name)
+	
+	def __setitem__(self, name, value):
+		setattr(self, name, value)
+	
+	def update(self, other):
+		for k, v in other.items():
+			setattr(self, k, v)
+	
+	def keys(self):
+		extra = getattr(self, "__dict__", None) or ()
+		return EspList([*self.__fields__, *extra])
+	
+	def __repr__(self):
+		fields = ", ".join(f"{k}={getattr(self, k)!r}" for k in self.keys())
+		return f"{type(self).__name__}({fields})"
+
+class EspStruct(EspProto):
+	'''Root of protos whose instances can't have fields beyond their layout'''
+	__slots__ = ()
+
+def is_a(x, p):
+	'''The is operator: identity, prototype inheritance or Python isinstance'''
+	
+	if x is p:
+		return True
+	if isinstance(x, EspProto) or (isinstance(x, type) and issubclass(x, EspProto)):
+		return p in x.__ancestors__
+	return isinstance(p, type) and isinstance(x, p)
+
 class EspError(RuntimeError):
-	def __init__(self, vm, msg):
-		def it_names(vm):
-			yield "global"
-			for sf in vm.stack[1:]:
-				fn = sf.fn
-				yield fn and fn.name or "?"
-		
-		def it_origins(vm):
-			for sf in vm.stack[1:]:
-				yield sf.origin
-			
-			if vm.origins:
-				for op, origin in reversed(vm.origins):
-					if origin: break
-				yield origin
+	'''
+	An error raised by Espresso code, value being what it failed with. Only
+	a snapshot of the stack is taken when it's raised, (fn, call node, scope
+	chain) per frame, and the traceback is formatted when it's displayed,
+	so failures which get caught cost next to nothing.
+	'''
+	
+	def __init__(self, vm, msg, node=None):
+		super().__init__(msg)
+		self.value = msg
+		self.node = node
+		self.origins = vm.origins
+		# The scope lists grow and shrink with blocks, so they're copied
+		self.frames = [(sf.fn, sf.origin, tuple(sf.scope)) for sf in vm.stack]
+		self.formatted = None
+	
+	def traceback(self):
+		names = ["global"]
+		names += [fn and fn.name or "?" for fn, _, _ in self.frames[1:]]
 		
-		def it_scopes(vm):
-			it = iter(vm.stack)
-			yield next(it).scope
-			for sf in it:
-				yield sf.scope[2:]
+		# Each frame is executing the call which pushed the next one
+		origins = [self.origins.get(origin) for _, origin, _ in self.frames[1:]]
+		origins.append(self.origins.get(self.node))
 		
-		names = it_names(vm)
-		origins = it_origins(vm)
-		scopes = it_scopes(vm)
+		scopes = [self.frames[0][2]]
+		scopes += [scope[2:] for _, _, scope in self.frames[1:]]
 		
 		fn = []
 		for name, origin, scope in zip(names, origins, scopes):
@@ -215,18 +320,88 @@ class EspError(RuntimeError):
 				origin = "?"
 			fn.append(f"{name} ({origin}): {scope_vars(scope)}")
 		
-		out = "stack [\n  " + ",\n  ".join(fn) + "\n]"
+		return "stack [\n  " + ",\n  ".join(fn) + "\n]"
+	
+	def __str__(self):
+		if self.formatted is None:
+			self.formatted = f"{self.value}\nTraceback\n" + indent(self.traceback())
+		return self.formatted
+
+class BudgetError(EspError):
+	'''A VM ran past its budget, kind being "steps", "time" or "memory"'''
+	
+	def __init__(self, vm, kind, msg):
+		super().__init__(vm, msg)
+		self.kind = kind
+
+class Budget:
+	'''
+	Limits on a VM, see VM.limit. steps counts loop iterations and function
+	calls, deadline is a time.monotonic() time and objects caps the memory
+	blocks allocated since it was made. They're checked every INTERVAL
+	steps at most, and once one is exceeded every check fails again so
+	Espresso code can't catch its way past it. VMs sharing a budget (see
+	VM.child) each count their own steps and account for them here.
+	'''
+	
+	__slots__ = ("steps", "deadline", "objects", "baseline", "used", "exceeded", "lock")
+	
+	INTERVAL = 1024
+	
+	def __init__(self, steps=None, seconds=None, objects=None):
+		self.steps = steps
+		self.deadline = None if seconds is None else time.monotonic() + seconds
+		self.objects = objects
+		self.baseline = sys.getallocatedblocks()
+		self.used = 0
+		self.exceeded = None
+		self.lock = threading.Lock()
+	
+	def check(self, vm, spent):
+		'''Account for steps spent, returning how many more until the next check'''
+		
+		with self.lock:
+			self.used += spent
+			used = self.used
+		
+		if self.exceeded is None:
+			if self.steps is not None and used > self.steps:
+				self.exceeded = ("steps", f"Exceeded {self.steps} steps")
+			elif self.deadline is not None and time.monotonic() > self.deadline:
+				self.exceeded = ("time", "Exceeded the time limit")
+			elif self.objects is not None and sys.getallocatedblocks() - self.baseline > self.objects:
+				self.exceeded = ("memory", f"Exceeded {self.objects} allocated objects")
 		
-		super().__init__(f"{msg}\nTraceback\n" + indent(out))
+		if self.exceeded is not None:
+			raise BudgetError(vm, *self.exceeded)
+		
+		if self.steps is None:
+			return self.INTERVAL
+		return max(0, min(self.INTERVAL, self.steps - used))
 
 class EspFunc:
+	__slots__ = ("name", "args", "body", "scope")
+	
 	def __init__(self, name, args, body, scope):
 		self.name = name
 		self.args = args
 		self.body = body
 		self.scope = scope
 
+class Intrinsic:
+	'''A builtin which needs the VM, eg to call back into Espresso'''
+	__slots__ = ("name", "fn")
+	
+	def __init__(self, name, fn):
+		self.name = name
+		self.fn = fn
+	
+	def __repr__(self):
+		return f"Intrinsic({self.name})"
+
 class EspGenerator:
+	__slots__ = ("vm", "stack", "iter")
+	
 	def __init__(self, vm, gen):
 		self.vm = vm
 		self.stack = vm.stack
@@ -245,6 +420,8 @@ class EspGenerator:
 		return x
 
 class LVAttr:
+	__slots__ = ("lhs", "rhs")
+	
 	def __init__(self, lhs, rhs):
 		self.lhs = lhs
 		self.rhs = rhs
@@ -262,6 +439,8 @@ class LVAttr:
 		return setattr(self.lhs, self.rhs, value)
 
 class LVIndex:
+	__slots__ = ("lhs", "rhs")
+	
 	def __init__(self, lhs, rhs):
 		self.lhs = lhs
 		self.rhs = rhs
@@ -285,6 +464,8 @@ def scope_vars(scope):
 	return f"[{', '.join(frames)}]"
 
 class StackFrame:
+	__slots__ = ("fn", "origin", "scope")
+	
 	def __init__(self, fn, origin, scope):
 		self.fn = fn
 		self.origin = origin
@@ -295,7 +476,118 @@ class StackFrame:
 		return f"StackFrame({name}, {self.origin}, {scope_vars(self.scope)}"
 	__repr__ = __str__
 
+class OriginTable:
+	'''
+	Source positions kept out of band from the AST. Nodes are numbered in
+	preorder (lists headed by an op string), matching the order in which
+	crema.AST.to_json emits origins, and looked up by identity. Only
+	consulted when reporting errors, never during normal evaluation.
+	'''
+	
+	def __init__(self, ast=None, origins=()):
+		self.roots = []
+		self.table = {}
+		if ast is not None:
+			self.add(ast, origins)
+	
+	def add(self, ast, origins):
+		it = iter(origins)
+		table = self.table
+		
+		def number(node):
+			if type(node) is not list: return
+			if node and type(node[0]) is str:
+				# Fusion, pool and debugger wrappers aren't in the source
+				if node[0] in ("fused", "pooled", "template", "debug"):
+					return number(node[1])
+				if (pos := next(it, None)) is not None:
+					table[id(node)] = tuple(pos)
+			for x in node:
+				number(x)
+		
+		number(ast)
+		# Keep the tree alive so ids can't be reused
+		self.roots.append(ast)
+	
+	def get(self, node):
+		'''Get the (line, col) of a node, or None if it has no origin'''
+		return self.table.get(id(node))
+
+class SwitchTable:
+	'''
+	Jump table for a switch, built once per node. Constant case labels are
+	hashed so dispatch doesn't depend on the number of cases, the rest are
+	evaluated in order as before.
+	'''
+	
+	def __init__(self, ast):
+		_, ex, cases, th, el = ast
+		
+		self.eqtab = {}
+		self.dynamic = []
+		self.default = None
+		
+		for i, (op, value, ft, body) in enumerate(cases):
+			if op == "default":
+				if self.default is None:
+					self.default = i
+				continue
+			
+			match value:
+				case ['const', const]:
+					# First case wins for duplicate labels
+					self.eqtab.setdefault(const, i)
+				case _:
+					self.dynamic.append((i, value))
+	
+	def find(self, vm, ex):
+		'''Index of the case to start at, or None to skip the body'''
+		
+		try:
+			i = self.eqtab.get(ex)
+		except TypeError:
+			# Unhashable values can't equal a constant label anyway
+			i = None
+		
+		# Non-constant labels before the hashed match still take priority
+		for j, value in self.dynamic:
+			if i is not None and j > i: break
+			if vm.rval(value) == ex:
+				return j
+		
+		return self.default if i is None else i
+
+class Template:
+	'''
+	A format node compiled once. Constant pieces are folded into a
+	str.format template whose fields are the other pieces, so building the
+	string is a single call instead of a concatenation per piece.
+	'''
+	
+	__slots__ = ("template", "values")
+	
+	def __init__(self, ast):
+		parts = []
+		self.values = []
+		for piece in ast[1:]:
+			match piece:
+				case ['const', value]:
+					parts.append(str(py2esp(value)).replace("{", "{{").replace("}", "}}"))
+				case ['spec', value, spec]:
+					parts.append(f"{{{len(self.values)}:{spec}}}")
+					self.values.append(value)
+				case _:
+					parts.append(f"{{{len(self.values)}}}")
+					self.values.append(piece)
+		
+		self.template = "".join(parts)
+	
+	def format(self, vm):
+		return EspString(self.template.format(*map(vm.rval, self.values)))
+
 class Context:
+	__slots__ = ("stack", "elem")
+	
 	def __init__(self, stack, elem):
 		self.stack = stack
 		self.elem = elem
@@ -321,18 +613,94 @@ class FailSignal(Signal):
 		super().__init__()
 		self.value = value
 
+# Operators VM.binary takes
+BINARY = {
+	"=", "+", "-", "*", "/", "%", "**", "//", "===", "!==", "==", "!=",
+	"<", "<=", ">", ">=", "&", "|", "^", "<<", ">>", "is", "in", "has", ":="
+}
+
 class VM:
-	def __init__(self, scope):
-		self.origins = []
+	def __init__(self, scope, origins=None):
+		self.origins = origins or OriginTable()
 		self.stack = [StackFrame(None, None, [scope])]
 		self.errlvl = 0
+		# Print the stack and the failing nodes as errors unwind
+		self.verbose = False
+		self.loader = None
+		# Event loop runtime, see aio.install
+		self.aio = None
+		# id(node) -> (node, plan) for data derived from the AST at runtime
+		self.plans = {}
+		# Multimethods made by the method builtin, for reporting
+		self.multimethods = []
+		# Steps until the budget is checked, counted down at loop back-edges
+		#  and calls so it costs a decrement without one, see limit
+		self.budget = None
+		self.ticks = sys.maxsize
+		# Steps this VM was last allowed before checking again
+		self.granted = 0
+		# Type feedback being recorded, see feedback.py
+		self.feedback = None
+		# Attached Debugger, only for the loader to hand it modules
+		self.debugger = None
 	
 	def scope(self):
 		return Context(self.stack[-1].scope, {})
 	
+	def child(self):
+		'''
+		A VM sharing this one's globals and state but with its own stack and
+		step count, for running on another thread (see aio.py). What's shared
+		is only updated in ways that are safe under the GIL: plans are added
+		with setdefault, the budget takes a lock. Espresso variables get no
+		such protection, tasks see each other's writes as threads do.
+		'''
+		
+		vm = VM.__new__(VM)
+		vm.__dict__.update(self.__dict__)
+		vm.stack = [self.stack[0]]
+		vm.errlvl = 0
+		# Checks the shared budget on its first back-edge
+		vm.ticks = vm.granted = 0
+		return vm
+	
+	def plan(self, ast, build):
+		'''Build data for a node once, eg a switch's jump table'''
+		
+		entry = self.plans.get(id(ast))
+		if entry is None:
+			# Keep the node alive so its id can't be reused. Threads racing
+			#  here may both build, but they all get the same one
+			entry = self.plans.setdefault(id(ast), (ast, build(ast)))
+		return entry[1]
+	
 	def print_stack(self):
 		print(str(EspError(self, "print_stack")))
 	
+	def limit(self, steps=None, seconds=None, objects=None):
+		'''
+		Budget what runs from now on, replacing any earlier budget. Past it
+		a BudgetError is raised. No limits removes the budget.
+		'''
+		
+		if steps is None and seconds is None and objects is None:
+			self.budget = None
+			self.ticks = sys.maxsize
+		else:
+			self.budget = Budget(steps, seconds, objects)
+			self.ticks = self.granted = 0
+		return self.budget
+	
+	def tick(self):
+		'''Called when ticks runs out, checks the budget and grants more'''
+		
+		budget = self.budget
+		if budget is None:
+			self.ticks = sys.maxsize
+			return
+		
+		self.ticks = self.granted = budget.check(self, self.granted - self.ticks)
+	
 	def resolve(self, name):
 		for scope in reversed(self.stack[-1].scope):
 			if name in scope:
@@ -340,13 +708,20 @@ class VM:
 		
 		return self.stack[-1].scope[-1]
 	
-	def call(self, fn, this, args):
+	def call(self, fn, this, args, node=None):
 		if fn is None:
 			raise ValueError("Calling none")
 		
+		if isinstance(fn, Intrinsic):
+			return fn.fn(self, *args)
+		
 		if callable(fn):
 			return py2esp(fn(*map(esp2py, args)))
 		
+		self.ticks -= 1
+		if self.ticks < 0:
+			self.tick()
+		
 		espargs = {"this": this}
 		for a, arg in enumerate(args):
 			if a < len(fn.args):
@@ -361,7 +736,7 @@ class VM:
 		scope.append(espargs)
 		
 		try:
-			with Context(self.stack, StackFrame(fn, self.origins[-1][1], scope)):
+			with Context(self.stack, StackFrame(fn, node, scope)):
 				result = self.rval(fn.body)
 		except ReturnSignal as r:
 			result = r.value
@@ -379,7 +754,7 @@ class VM:
 			
 			case _: raise NotImplementedError(f"unary op {op}")
 	
-	def binary(self, op, lhs, rhs):
+	def binary(self, op, lhs, rhs, node=None):
 		if op == "=":
 			lhs = self.lval(lhs)
 			rhs = self.rval(rhs)
@@ -392,6 +767,15 @@ class VM:
 		
 		lhs = self.rval(lhs)
 		rhs = self.rval(rhs)
+		if self.feedback is not None:
+			self.feedback.record(node, f"{type(lhs).__name__} {type(rhs).__name__}")
+			# Sites the profile has seen enough of skip the dispatch below
+			if (fast := self.feedback.fast(node, op)) is not None:
+				lt, rt, fn = fast
+				if type(lhs) is lt and type(rhs) is rt:
+					return fn(lhs, rhs)
+				self.feedback.deopt(node)
+		
 		match op:
 			case "+": return lhs + rhs
 			case "-": return lhs - rhs
@@ -416,9 +800,7 @@ class VM:
 			case "<<": return lhs << rhs
 			case ">>": return lhs >> rhs
 			
-			case "is":
-				if lhs is rhs: return True
-				return isinstance(lhs, rhs)
+			case "is": return is_a(lhs, rhs)
 			
 			case "in": return lhs in rhs
 			case "has": return hasattr(lhs, rhs)
@@ -430,9 +812,13 @@ class VM:
 			case _: raise NotImplementedError(f"binary op {op}")
 	
 	def loop(self, ast):
-		always, cond, body, th, el, *_ = ast + [None]*4
+		always, cond, body, th, el, *_ = ast[1:] + [None]*4
 		
 		while True:
+			self.ticks -= 1
+			if self.ticks < 0:
+				self.tick()
+			
 			try:
 				result = self.rval(always)
 				if isinstance(result, EspGenerator):
@@ -459,28 +845,37 @@ class VM:
 				continue
 	
 	def forloop(self, ast):
-		var, it, body, th, el, *_ = ast + [None]*2
+		var, it, body, th, el, *_ = ast[1:] + [None]*2
 		
 		var = self.lval(var)
 		it = iter(self.rval(it))
 		
 		while True:
+			self.ticks -= 1
+			if self.ticks < 0:
+				self.tick()
+			
 			try:
 				var.set(next(it))
 				yield self.rval(body)
 			except StopIteration:
 				self.rval(th)
+				break
 			except BreakSignal:
 				self.rval(el)
+				break
 			except ContinueSignal:
 				continue
-			break
 	
 	def lval(self, ast):
 		match ast:
 			case ['id', name]:
 				return LVIndex(self.resolve(name), name)
 			
+			# crema gives the member of a.b as an id rather than an expression
+			case ['.', lhs, ['id', rhs]]:
+				return LVAttr(self.rval(lhs), rhs)
+			
 			case ['.', lhs, rhs]:
 				lhs = self.rval(lhs)
 				rhs = self.rval(rhs)
@@ -491,7 +886,7 @@ class VM:
 				rhs = self.rval(rhs)
 				return LVIndex(lhs, rhs)
 			
-			case _: raise EspError(self, f"Not an lvalue: {sexp(ast)}")
+			case _: raise EspError(self, f"Not an lvalue: {summary(ast)}", ast)
 	
 	def rval(self, ast):
 		if ast is None: return
@@ -499,10 +894,6 @@ class VM:
 		try:
 			result = None
 			match ast:
-				case ['line', line, op]:
-					with Context(self.origins, [op[0], line]):
-						result = self.rval(op)
-				
 				case ['var', vars]:
 					for name, value in vars:
 						match name:
@@ -517,20 +908,53 @@ class VM:
 								raise NotImplementedError(f"var {name}")
 				
 				case ['const', value]: result = py2esp(value)
+				# Constant literals, see constpool
+				case ['pooled', _, value]: result = value
+				case ['template', _, value]: result = type(value)(value)
+				case ['format', *_]: result = self.plan(ast, Template).format(self)
+				
+				# Baked by loader.bake, or evaluated here once if it couldn't be
+				case ['static', value, {"fns": fns, "data": data}]:
+					import parallel
+					scope = self.stack[0].scope[0]
+					def baked(_):
+						try:
+							return parallel.decode(fns, data, scope)
+						# Names a module decode won't import
+						except parallel.PortableError:
+							return self.rval(value)
+					result = self.plan(ast, baked)
+				case ['static', value]:
+					result = self.plan(ast, lambda _: self.rval(value))
 				case ['id'|'.'|'[]', *_]: result = self.lval(ast).get()
 				
 				case ['break']: raise BreakSignal()
 				case ['continue']: raise ContinueSignal()
 				case ['fail', value]:
-					raise FailSignal(EspError(self, self.rval(value)))
+					raise FailSignal(EspError(self, self.rval(value), ast))
 				case ['return', value]:
 					raise ReturnSignal(self.rval(value))
 				
 				case ['prog', body]: result = self.rval(body)
 				
-				case ['block', body]:
+				case ['await', value]:
+					if self.aio is None:
+						raise EspError(self, "await without an event loop", ast)
+					result = py2esp(self.aio.wait(self.rval(value)))
+				
+				# Top level of a parsed file, runs in the current scope. Statements
+				#  are read from the node as they run so debugger probes placed
+				#  midway through are seen, see debugger.py
+				case ['progn', *_]:
+					for stmt in itertools.islice(ast, 1, None):
+						result = self.rval(stmt)
+						if isinstance(result, EspGenerator):
+							for _ in result: pass
+							result = None
+				
+				case ['block', *_]:
 					with self.scope():
-						for stmt in body:
+						for stmt in itertools.islice(ast, 1, None):
 							tmp = self.rval(stmt)
 							if isinstance(tmp, EspGenerator):
 								for _ in tmp: pass
@@ -538,37 +962,26 @@ class VM:
 							else:
 								result = tmp
 				
-				case ['cond', cs, th, el]:
+				case ['switch', ex, cases, th, el]:
 					with self.scope():
-						cond = self.rval(cond)
-						
-						i = 0
-						de = None
-						ft = False
+						table = self.plan(ast, SwitchTable)
+						i = table.find(self, self.rval(ex))
 						try:
-							while True:
-								op, value, fts, body = cs
-								
-								if ft or op == "case" and self.rval(value) == cond:
-									result = self.rval(body)
-									ft = (fts == ":")
-									if not ft: break
-								else:
-									de = i
-								
+							# Run from the match until a case which doesn't fall through
+							while i is not None and i < len(cases):
+								op, value, ft, body = cases[i]
+								result = self.rval(body)
+								if ft != ":": break
 								i += 1
-								
-								# Fell off the end
-								if i >= len(cs):
-									# Without default
-									if ft or de is None:
-										break
-									i = de
-									ft = True
-							self.rval(th)
+							
+							if th is not None:
+								result = self.rval(th)
 						except BreakSignal:
-							self.rval(el)
-							pass
+							if el is not None:
+								result = self.rval(el)
+				
+				case ['fused', original, pipeline]:
+					result = pipeline.run(self, original)
 				
 				case ['loop', *_]:
 					result = EspGenerator(self, self.loop(ast))
@@ -580,7 +993,13 @@ class VM:
 					with self.scope():
 						try:
 							result = self.rval(body)
-						except EspError as e:
+						except BudgetError:
+							# Only the host may handle running out, see Budget
+							raise
+						except (EspError, FailSignal) as e:
+							# fail wraps the error so Python handlers don't catch it
+							if isinstance(e, FailSignal):
+								e = e.value
 							self.lval(err).set(e.value)
 							result = self.rval(handler)
 							result = self.rval(el)
@@ -589,34 +1008,55 @@ class VM:
 						finally:
 							result = self.rval(fin)
 				
+				# Fields are [['id', name], type], statics [['id', name], value]
+				case ['proto', ['const', name], parent, fields, statics]:
+					import proto
+					result = proto.make(
+						name, self.rval(parent), [f for (_, f), _ in fields],
+						{k: self.rval(v) for (_, k), v in statics}
+					)
+					self.stack[-1].scope[-1][name] = result
+				
 				case ['tuple', *elems]:
 					result = EspTuple(self.rval(e) for e in elems)
 				
 				case ['list', *elems]:
-					result = EspList(self.rval(e) for e in elems)
+					result = EspList(self.rval(e) for e in spread(elems))
 				
 				case ['object', *elems]: ###TODO: Object -> ObjectEntry
-					result = EspObject((self.rval(k), self.rval(v)) for k, v in elems)
+					# Bare names are keys, not variables, and crema emits them as ids
+					result = EspObject(
+						(EspString(k[1]) if k[0] == "id" else self.rval(k), self.rval(v))
+						for k, v in elems
+					)
 				
 				case ['fn', ['const', name], args, body]:
 					result = EspFunc(name, args, body, self.stack[-1].scope.copy())
 				
-				case ['call', ['.'|'[]', this, fn], args]:
+				# Arguments are read with spread, see there
+				case ['call', ['.'|'[]', this, fn], *args]:
 					this = self.rval(this)
-					fn = self.rval(fn)
+					fn = fn[1] if ast[1][0] == "." and fn[0] == "id" else self.rval(fn)
+					if self.feedback is not None:
+						self.feedback.record(ast, type(this).__name__)
+					
 					if ast[1][0] == ".":
 						fn = getattr(this, fn)
 					else:
 						fn = this[fn]
-					result = self.call(fn, this, list(map(self.rval, args)))
+					result = self.call(fn, this, list(map(self.rval, spread(args))), ast)
 				
-				case ['call', fn, args]:
+				case ['call', fn, *args]:
 					fn = self.rval(fn)
-					result = self.call(fn, None, list(map(self.rval, args)))
+					result = self.call(fn, None, list(map(self.rval, spread(args))), ast)
 				
 				case ['if', cond, th, el]:
 					with self.scope():
-						if self.rval(cond):
+						cond = self.rval(cond)
+						if self.feedback is not None:
+							self.feedback.record(ast, "then" if cond else "else")
+						
+						if cond:
 							result = self.rval(th)
 						else:
 							result = self.rval(el)
@@ -630,17 +1070,28 @@ class VM:
 					self.rval(rhs)
 				
 				case [op, [value]]: result = self.unary(op, value)
-				case [op, [lhs, rhs]]: result = self.binary(op, lhs, rhs)
+				case [op, [lhs, rhs]]: result = self.binary(op, lhs, rhs, ast)
+				# As crema emits them, with the operands inline
+				case [op, lhs, rhs] if op in BINARY: result = self.binary(op, lhs, rhs, ast)
+				
+				# Last so nothing else pays for it, see debugger.py
+				case ['debug', stmt, probe]: result = probe.run(self, stmt)
 				
 				case _: raise NotImplementedError(summary(ast))
 			
 			return result
 		except Exception:
+			if not self.verbose:
+				raise
+			
 			if self.errlvl == 0:
 				self.print_stack()
 			
 			if self.errlvl < 3:
-				print("Error from", summary(ast))
+				if origin := self.origins.get(ast):
+					print(f"Error from line {origin[0]}:", summary(ast))
+				else:
+					print("Error from", summary(ast))
 				self.errlvl += 1
 				
 			raise
@@ -652,33 +1103,73 @@ class VM:
 			print("Error:", sig.value)
 			result = None
 		
+		# A finally block's return or break can still replace the error
+		if self.budget is not None and self.budget.exceeded is not None:
+			raise BudgetError(self, *self.budget.exceeded)
+		
 		return result
 	
-def strip_lines(ast):
-	if type(ast) is list:
-		if ast[0] == "line":
-			return strip_lines(ast[2])
-		else:
-			return list(map(strip_lines, ast))
-	return ast
+def builtins(argv=()):
+	'''The standard global scope'''
+	
+	import parallel, fusion, typedarray, multimethod, proto
+	
+	return {
+		**fusion.INTRINSICS,
+		**multimethod.INTRINSICS,
+		**proto.INTRINSICS,
+		"none": None,
+		"true": True,
+		"false": False,
+		"string": EspString,
+		"list": EspList,
+		"import": __import__,
+		"open": open,
+		"print": print,
+		"type": type,
+		"slice": slice,
+		"argv": list(argv),
+		"int": int,
+		"array": typedarray.array,
+		"pmap": parallel.pmap,
+		"preduce": parallel.preduce
+	}
 
 def main():
-	import sys, os, json, crema, argparse
+	import sys, os, json, crema, argparse, loader, aio, flatast, fusion, constpool, feedback, debugger
 	
 	ap = argparse.ArgumentParser("espresso")
 	ap.add_argument("-f", "--file", nargs=2, metavar=('src', 'ast'))
 	ap.add_argument("-c", "--cmd", nargs=1, metavar='cmd')
-	ap.add_argument("-s", "--sexp", action="store_true")
+	ap.add_argument("-s", "--sexp", metavar='ast', help="Print an AST cache or JSON file ('-' for stdin)")
+	ap.add_argument("-d", "--depth", type=int, help="Elide sexp subtrees deeper than this")
+	ap.add_argument("-v", "--verbose", action="store_true", help="Print the stack and failing nodes on errors")
+	ap.add_argument("-p", "--profile", action="store_true", help="Record type feedback, kept next to the AST cache")
+	ap.add_argument("-b", "--break", dest="breaks", type=int, action="append", default=[], metavar="line", help="Debug, stopping at a line of the script")
 	argv = ap.parse_args()
 	
 	if argv.sexp:
-		print(sexp(json.loads(sys.argv[2])))
+		if argv.sexp == "-":
+			ast = json.load(sys.stdin)
+		elif flatast.is_flat(argv.sexp):
+			ast, _ = flatast.FlatAST.load(argv.sexp).to_list()
+		else:
+			with open(argv.sexp, "r") as f:
+				ast = json.load(f)
+		
+		# AST caches carry their origins alongside the tree
+		if isinstance(ast, dict):
+			ast = ast['ast']
+		
+		write_sexp(ast, sys.stdout, depth=argv.depth, colors=sys.stdout.isatty())
+		print()
 		return
 	
 	if argv.cmd:
 		ast = crema.Parser(argv.cmd[0]).parse()
 		
-		print(sexp(ast.to_json()))
+		write_sexp(ast.to_json(), sys.stdout, depth=argv.depth)
+		print()
 		return
 	
 	if not all(argv.file):
@@ -692,20 +1183,10 @@ def main():
 			return float('inf')
 	
 	def reparse(srcfn, astfn):
-		with open(srcfn, "r") as f:
-			print("Reparsing...")
-			ast = crema.Parser(f.read()).parse()
-		
-		ast = ast.to_json()
-		
+		print("Reparsing...")
 		print("Saving to", astfn)
-		with open(astfn, "w") as f:
-			json.dump(ast, f)
-		
-		with open("debug.json", "w") as f:
-			json.dump(strip_lines(ast), f)
-		
-		return ast
+		# Same as a module's cache, static expressions included
+		return loader.compile_source(srcfn, astfn)
 	
 	srcfn, astfn = argv.file
 	
@@ -716,11 +1197,19 @@ def main():
 	if srcmt <= astmt >= crmmt:
 		print("Loading from", astfn)
 		try:
-			with open(astfn, "r") as f:
-				ast = json.load(f)
-		except (json.decoder.JSONDecodeError, FileNotFoundError):
-			print("AST JSON corrupted")
-			ast = reparse(srcfn, astfn)
+			flat = flatast.FlatAST.load(astfn)
+			if any(mtime(dep) > astmt for dep in flat.deps):
+				print("Static dependencies changed")
+				ast, origins = reparse(srcfn, astfn)
+			else:
+				ast, origins = flat.to_list()
+		except flatast.FlatError as e:
+			# Older caches were JSON
+			print(f"AST cache outdated ({e})")
+			ast, origins = reparse(srcfn, astfn)
+		except (ValueError, FileNotFoundError):
+			print("AST cache corrupted")
+			ast, origins = reparse(srcfn, astfn)
 	else:
 		if srcmt > astmt < crmmt:
 			print(f"Source changed at {srcfn} and {astfn}")
@@ -728,23 +1217,49 @@ def main():
 			print(f"Source changed at {astfn}")
 		else:
 			print(f"Source changed at {srcfn}")
-		ast = reparse(srcfn, astfn)
+		ast, origins = reparse(srcfn, astfn)
+	
+	vm = VM(builtins(sys.argv[3:]), OriginTable(ast, origins))
+	vm.verbose = argv.verbose
+	imp = loader.Loader(vm, os.path.dirname(os.path.abspath(srcfn))).install()
+	
+	# Compile whatever the script imports up front and in parallel
+	base = imp.base
+	imp.precompile(filter(None, (imp.resolve(n, base) for n in loader.imports(ast))))
+	
+	aio.install(vm)
+	
+	for origin, pipeline in fusion.fuse(ast, vm.origins):
+		print(f"Fused {pipeline.describe()}", f"at line {origin[0]}" if origin else "")
+	
+	pooled = constpool.pool(ast)
+	print("Pooled", ", ".join(f"{n} {kind}" for kind, n in pooled.items()))
+	
+	if argv.profile:
+		vm.feedback = feedback.Feedback()
+		print("Preloaded feedback for", vm.feedback.add(ast, astfn), "sites")
+	
+	if argv.breaks:
+		dbg = debugger.Debugger(vm)
+		dbg.add(ast, srcfn)
+		for line in argv.breaks:
+			dbg.breakpoint(line)
 	
 	print("Executing...")
-	VM({
-		"none": None,
-		"true": True,
-		"false": False,
-		"string": EspString,
-		"list": EspList,
-		"import": __import__,
-		"open": open,
-		"print": print,
-		"type": type,
-		"slice": slice,
-		"argv": sys.argv[3:],
-		"int": int
-	}).eval(ast)
+	try:
+		vm.eval(ast)
+	finally:
+		vm.aio.close()
+		
+		for mm in vm.multimethods:
+			print("Multimethod", mm.stats())
+		
+		if vm.feedback is not None:
+			vm.feedback.save()
+			for origin, counts in vm.feedback.hottest(vm.origins):
+				print(f"Polymorphic at line {origin[0] if origin else '?'}:", counts)
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	# Run as the importable module so the loader shares its classes
+	import vm
+	vm.main()
\ No newline at end of file
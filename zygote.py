@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+'''
+Pre-forking launcher for running many short espresso jobs. The zygote
+imports the runtime, parses and loads whatever esplib modules it can, then
+freezes the heap and forks a child per request so every job starts from a
+warm copy-on-write image instead of a cold interpreter.
+
+	python zygote.py serve /tmp/esp.sock [-j jobs]
+	python zygote.py run /tmp/esp.sock src.esp [args...]
+	python zygote.py stats /tmp/esp.sock
+
+Requests use the daemon protocol. A {"stats": true} request gets the
+launcher's counters back as JSON instead of running anything. A client
+which hasn't sent its request line within the timeout is turned away.
+'''
+
+import os, sys, gc, glob, json, time, socket, selectors, collections, contextlib, io, importlib
+
+import loader, daemon
+from vm import VM, builtins
+
+# Runtime modules the VM imports lazily, see Zygote.preload
+RUNTIME = [
+	"proto", "parallel", "typedarray", "multimethod", "fusion", "constpool",
+	"feedback", "debugger", "flatast", "unicode_names"
+]
+
+class Stats:
+	def __init__(self):
+		self.started = 0
+		self.finished = 0
+		self.failed = 0
+		self.fork_ms = collections.deque(maxlen=1000)
+		self.rss_kb = collections.deque(maxlen=1000)
+	
+	def summary(self, queued, running, preloaded):
+		def dist(xs):
+			if not xs:
+				return None
+			return {"last": xs[-1], "mean": sum(xs)/len(xs), "max": max(xs)}
+		
+		return {
+			"queued": queued,
+			"running": running,
+			"started": self.started,
+			"finished": self.finished,
+			"failed": self.failed,
+			"fork_ms": dist(self.fork_ms),
+			"rss_kb": dist(self.rss_kb),
+			"preloaded": preloaded
+		}
+
+class Zygote:
+	def __init__(self, path, jobs=None, timeout=5.0):
+		self.path = path
+		self.jobs = jobs or os.cpu_count() or 1
+		self.timeout = timeout
+		self.store = daemon.WarmStore()
+		self.stats = Stats()
+		self.listener = None
+		self.selector = None
+		
+		# Connections whose request line hasn't arrived, conn -> [data, deadline]
+		self.pending = {}
+		# Jobs waiting for a free slot as (conn, request)
+		self.queue = collections.deque()
+		# pid -> start time of running children
+		self.running = {}
+		
+		self.modules = {}
+		self.preloaded = []
+	
+	def preload(self, pattern=os.path.join(loader.ESPLIB, "*.esp")):
+		'''
+		Warm the image children are forked from. The parts of the runtime
+		which jobs would otherwise import on first use are imported, then
+		every esplib module that can be is parsed and executed, keeping the
+		results for children to share. Modules which fail are left for jobs
+		to load themselves (and report), and none of esplib is written in
+		what crema parses yet, so for now the warm part is the runtime.
+		'''
+		
+		for name in RUNTIME:
+			importlib.import_module(name)
+		
+		vm = VM(builtins())
+		imp = daemon.WarmLoader(vm, self.store).install()
+		
+		for path in sorted(glob.glob(pattern)):
+			path = os.path.realpath(path)
+			name = os.path.splitext(os.path.basename(path))[0]
+			# Module top levels may print, which isn't any job's output
+			with contextlib.redirect_stdout(io.StringIO()):
+				try:
+					imp.load(path, name)
+				except Exception:
+					continue
+			self.preloaded.append(name)
+		
+		self.modules = imp.modules
+		
+		# Everything so far lives as long as the zygote, so stop the
+		# collector from touching (and un-sharing) it in every child
+		gc.collect()
+		gc.freeze()
+	
+	def fork(self, conn, request):
+		t = time.perf_counter()
+		pid = os.fork()
+		if pid == 0:
+			code = 1
+			try:
+				# Only the parent serves the others
+				self.listener.close()
+				self.selector.close()
+				for other in self.pending:
+					other.close()
+				for other, _ in self.queue:
+					other.close()
+				
+				with conn.makefile("wb") as wfile:
+					chan = daemon.Channel(wfile)
+					code = daemon.run_job(self.store, request, chan, self.modules)
+					chan.send(exit=code)
+			finally:
+				os._exit(code)
+		
+		self.stats.fork_ms.append((time.perf_counter() - t)*1000)
+		self.stats.started += 1
+		self.running[pid] = t
+		
+		# The child owns the connection now
+		conn.close()
+	
+	def reap(self):
+		while self.running:
+			pid, status, usage = os.wait4(-1, os.WNOHANG)
+			if pid == 0:
+				break
+			
+			del self.running[pid]
+			self.stats.finished += 1
+			if os.waitstatus_to_exitcode(status) != 0:
+				self.stats.failed += 1
+			# Linux reports kilobytes
+			self.stats.rss_kb.append(usage.ru_maxrss)
+	
+	def reply(self, conn, out, code):
+		with conn, conn.makefile("wb") as wfile:
+			chan = daemon.Channel(wfile)
+			chan.send(out=out)
+			chan.send(exit=code)
+	
+	def accept(self):
+		conn, _ = self.listener.accept()
+		# Requests are read as they arrive so a slow client holds up nobody
+		conn.setblocking(False)
+		self.pending[conn] = [b"", time.monotonic() + self.timeout]
+		self.selector.register(conn, selectors.EVENT_READ)
+	
+	def receive(self, conn):
+		'''Read what's arrived of a request, handling it once its line is complete'''
+		
+		try:
+			data = conn.recv(65536)
+		except BlockingIOError:
+			return
+		except OSError:
+			data = b""
+		
+		entry = self.pending[conn]
+		entry[0] += data
+		# A client which closes early gets whatever it sent parsed
+		if data and b"\n" not in entry[0]:
+			return
+		
+		self.selector.unregister(conn)
+		del self.pending[conn]
+		if not entry[0]:
+			# Gone without a request, there's nobody to answer
+			conn.close()
+			return
+		
+		conn.setblocking(True)
+		try:
+			self.handle(conn, entry[0].split(b"\n", 1)[0])
+		except OSError:
+			# The client went away mid-reply, which is its own problem
+			conn.close()
+	
+	def expire(self):
+		'''Drop connections which didn't send a request in time'''
+		
+		now = time.monotonic()
+		for conn, (_, deadline) in list(self.pending.items()):
+			if now > deadline:
+				self.selector.unregister(conn)
+				del self.pending[conn]
+				conn.setblocking(True)
+				try:
+					self.reply(conn, "Request timed out\n", 2)
+				except OSError:
+					pass
+	
+	def handle(self, conn, line):
+		try:
+			request = json.loads(line)
+		except json.decoder.JSONDecodeError as e:
+			self.reply(conn, f"Bad request: {e}\n", 2)
+			return
+		
+		if type(request) is dict and request.get("stats"):
+			stats = self.stats.summary(len(self.queue), len(self.running), self.preloaded)
+			self.reply(conn, json.dumps(stats) + "\n", 0)
+			return
+		
+		# Turned away here rather than spending a fork on it
+		if why := daemon.bad_request(request):
+			self.reply(conn, f"Bad request: {why}\n", 2)
+			return
+		
+		self.queue.append((conn, request))
+	
+	def serve(self):
+		if os.path.exists(self.path):
+			os.unlink(self.path)
+		
+		self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.listener.bind(self.path)
+		self.listener.listen(128)
+		
+		self.selector = sel = selectors.DefaultSelector()
+		sel.register(self.listener, selectors.EVENT_READ)
+		try:
+			while True:
+				# Wake up regularly to reap children, cheaper than SIGCHLD juggling
+				for key, _ in sel.select(timeout=0.01):
+					if key.fileobj is self.listener:
+						self.accept()
+					else:
+						self.receive(key.fileobj)
+				
+				self.expire()
+				self.reap()
+				while self.queue and len(self.running) < self.jobs:
+					self.fork(*self.queue.popleft())
+		finally:
+			for conn in self.pending:
+				conn.close()
+			sel.close()
+			self.listener.close()
+			os.unlink(self.path)
+
+def main():
+	import argparse
+	
+	ap = argparse.ArgumentParser("espresso-zygote")
+	sub = ap.add_subparsers(dest="cmd", required=True)
+	
+	serve = sub.add_parser("serve", help="Run the launcher")
+	serve.add_argument("socket")
+	serve.add_argument("-j", "--jobs", type=int, help="Maximum concurrent jobs")
+	serve.add_argument("-t", "--timeout", type=float, default=5.0,
+		help="Seconds a client has to send its request")
+	
+	run = sub.add_parser("run", help="Run a file on a launcher")
+	run.add_argument("socket")
+	run.add_argument("src")
+	run.add_argument("argv", nargs="*")
+	
+	stats = sub.add_parser("stats", help="Print queue depth, fork latency and job RSS")
+	stats.add_argument("socket")
+	
+	argv = ap.parse_args()
+	
+	if argv.cmd == "run":
+		sys.exit(daemon.request(argv.socket, argv.src, argv.argv))
+	
+	if argv.cmd == "stats":
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.connect(argv.socket)
+			sock.sendall(b'{"stats": true}\n')
+			with sock.makefile("rb") as f:
+				for line in f:
+					msg = json.loads(line)
+					if "out" in msg:
+						sys.stdout.write(msg['out'])
+		return
+	
+	zygote = Zygote(argv.socket, argv.jobs, argv.timeout)
+	zygote.preload()
+	preloaded = ", ".join(zygote.preloaded) or "no esplib modules"
+	print(f"Serving on {argv.socket} with {zygote.jobs} jobs, preloaded {preloaded}", flush=True)
+	try:
+		zygote.serve()
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+	main()